@@ -1,4 +1,5 @@
 import locale
+from auth import auth
 from flask import Flask
 from cmm.api import bp_cmm
 from crm.api import bp_crm
@@ -13,7 +14,10 @@ from os import environ, path
 from sqlalchemy import Select
 from dotenv import load_dotenv
 from models.public import SysCustomer
-from models.helpers import db, migrate
+from models.helpers import db, migrate, Database
+from integrations.http_client import HttpClient
+from common import _prewarm_templates
+from mail_queue import MailQueue
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
@@ -34,6 +38,9 @@ app.config['SQLALCHEMY_BINDS'] = {
 db.init_app(app)
 try:
     with app.app_context():
+        # o search_path do tenant eh aplicado na conexao e nao a cada requisicao
+        Database.register_tenant_routing(db.engine)
+
         #valida a conexao com o banco de daods
         with db.engine.begin() as conn:
             conn.execute(text("SELECT 1"))
@@ -72,8 +79,20 @@ app.register_blueprint(bp_mpg)
 app.register_blueprint(bp_smc)
 
 CORS(app, resources={r"/*": {"origins": "*"}},supports_credentials=True)
+
+# compila os templates de relatorios e e-mails antes da primeira requisicao
+_prewarm_templates()
+
+# envia as mensagens que ficaram na fila de e-mails de execucoes anteriores
+MailQueue.start(app)
 # CORS(app, resources={r"/*": {"origins": "https://system.fast2bee.com"}},supports_credentials=True)
 
+@app.route("/metrics/http")
+@auth.login_required
+def http_metrics():
+    """ Latencia, erros e estado do circuito das integracoes externas deste processo """
+    return HttpClient.metrics()
+
 @app.route("/")
 def index():
     return """<html>
@@ -1,7 +1,10 @@
 import jwt
 import logging
+from hashlib import sha256
+from threading import Lock
 from flask import request
 from os import environ, path
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from models.public import SysUsers
 from flask_httpauth import HTTPTokenAuth
@@ -11,6 +14,81 @@ load_dotenv(path.join(BASEDIR, '.env'))
 
 auth = HTTPTokenAuth(scheme="Bearer")
 
+# cache em memoria dos tokens jah verificados (chave = hash do token)
+# cada entrada guarda as claims decodificadas, um snapshot do usuario e a validade
+# a validade eh o menor valor entre o token_expire do usuario e o TTL maximo do cache
+# o cache eh do processo: login, logout e revogacao limpam apenas o worker que os
+# atendeu, nos demais o token antigo segue aceito por ateh F2B_TOKEN_CACHE_TTL
+TOKEN_CACHE_TTL  = int(str(environ.get("F2B_TOKEN_CACHE_TTL","300")))
+TOKEN_CACHE_SIZE = int(str(environ.get("F2B_TOKEN_CACHE_SIZE","10000")))
+
+_token_cache:dict = {}
+_token_lock = Lock()
+
+def _token_key(token:str) -> str:
+    return sha256(str(token).encode()).hexdigest()
+
+def _cache_token(token:str,claims:dict,user:SysUsers) -> None:
+    now    = datetime.now()
+    expire = user.token_expire
+    if expire.tzinfo is not None:
+        expire = expire.astimezone().replace(tzinfo=None)
+    expire = min(expire,now + timedelta(seconds=TOKEN_CACHE_TTL))
+    with _token_lock:
+        if len(_token_cache) >= TOKEN_CACHE_SIZE:
+            _evict_tokens(now)
+        _token_cache[_token_key(token)] = {
+            "claims": claims,
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "type": user.type,
+                "active": user.active
+            },
+            "expire": expire
+        }
+
+def _evict_tokens(now:datetime) -> None:
+    # remove os vencidos e, se ainda estiver cheio, os mais proximos de vencer
+    for key in [k for k,v in _token_cache.items() if v["expire"] <= now]:
+        del _token_cache[key]
+    if len(_token_cache) >= TOKEN_CACHE_SIZE:
+        for key in sorted(_token_cache,key=lambda k: _token_cache[k]["expire"])[0:len(_token_cache)//10+1]:
+            del _token_cache[key]
+
+def get_cached_token(token:str|None) -> dict|None:
+    """ Retorna a entrada do cache de um token jah verificado ou None se nao existir/estiver vencida """
+    if token is None:
+        return None
+    key = _token_key(token)
+    with _token_lock:
+        entry = _token_cache.get(key)
+        if entry is None:
+            return None
+        if entry["expire"] <= datetime.now():
+            del _token_cache[key]
+            return None
+        return entry
+
+def get_token_claims(token:str|None) -> dict|None:
+    """ Retorna as claims do token usando o cache e decodificando apenas quando nao houver entrada """
+    entry = get_cached_token(token)
+    if entry is not None:
+        return entry["claims"]
+    return SysUsers.extract_token(token) if token else None
+
+def invalidate_token(token:str|None) -> None:
+    if token is None:
+        return
+    with _token_lock:
+        _token_cache.pop(_token_key(token),None)
+
+def invalidate_user(id_user:int) -> None:
+    """ Remove do cache todos os tokens de um usuario (logout, revogacao, desativacao) """
+    with _token_lock:
+        for key in [k for k,v in _token_cache.items() if v["user"]["id"]==int(id_user)]:
+            del _token_cache[key]
+
 @auth.verify_token
 def verify_token(token):
     try:
@@ -18,11 +96,16 @@ def verify_token(token):
         if "Authorization" in request.headers and token is None:
             token = request.headers["Authorization"].replace("Bearer ","")
 
+        # token jah verificado anteriormente nao precisa ir ao BD nem ser decodificado
+        if get_cached_token(token) is not None:
+            return True
+
         user = SysUsers.check_token(token)
         if user is not None:
             try:
                 data = jwt.decode(token,str(environ.get("F2B_TOKEN_KEY")),algorithms=['HS256'])
                 if 'username' in data:
+                    _cache_token(token,data,user)
                     return True
             except Exception as e:
                 logging.error(e)
@@ -33,4 +116,3 @@ def verify_token(token):
     except Exception as ex:
         logging.error(ex)
         return False
-
@@ -1,10 +1,11 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
 from models.tenant import B2bBrand
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource,Namespace,fields
 
@@ -42,6 +43,7 @@ class BrandList(Resource):
     @ns_brand.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_brand.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("brands")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -66,8 +68,7 @@ class BrandList(Resource):
                 rquery = rquery.where(B2bBrand.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -82,7 +83,7 @@ class BrandList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -103,6 +104,7 @@ class BrandList(Resource):
     @ns_brand.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registro!")
     @ns_brand.doc(body=brand_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -125,6 +127,7 @@ class BrandList(Resource):
     @ns_brand.response(HTTPStatus.OK,"Exclui os dados de uma ou mais marcas")
     @ns_brand.response(HTTPStatus.BAD_REQUEST,"Falha ao excluir registro!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool|dict:
         try:
             req = request.get_json()
@@ -146,6 +149,7 @@ class BrandApi(Resource):
     @ns_brand.response(HTTPStatus.OK,"Retorna os dados dados de uma marca")
     @ns_brand.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("brands")
     def get(self,id:int):
         try:
             cquery:B2bBrand|None = B2bBrand.query.get(id)
@@ -173,6 +177,7 @@ class BrandApi(Resource):
     @ns_brand.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_brand.doc(body=brand_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int)->bool|dict:
         try:
             req = request.get_json()
@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, desc, asc
 from flask_restx import Resource,Namespace,fields
 from models.tenant import B2bBrand, B2bCollection
@@ -54,6 +55,7 @@ class CollectionList(Resource):
     @ns_collection.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_collection.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("collections")
     def get(self):
         pag_num  =  1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -90,8 +92,7 @@ class CollectionList(Resource):
 
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -110,7 +111,7 @@ class CollectionList(Resource):
                         },
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -135,6 +136,7 @@ class CollectionList(Resource):
     @ns_collection.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registro!")
     @ns_collection.doc(body=coll_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -165,6 +167,7 @@ class CollectionApi(Resource):
     @ns_collection.response(HTTPStatus.OK,"Retorna os dados dados de uma coleção")
     @ns_collection.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("collections")
     def get(self,id:int):
         try:
             cquery = db.session.execute(Select(B2bCollection.id,
@@ -200,6 +203,7 @@ class CollectionApi(Resource):
     @ns_collection.response(HTTPStatus.OK,"Exclui os dados de uma coleção")
     @ns_collection.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool | dict:
         try:
             req = request.get_json()
@@ -219,6 +223,7 @@ class CollectionApi(Resource):
     @ns_collection.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_collection.doc(body=coll_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int)->bool | dict:
         try:
             req = request.get_json()
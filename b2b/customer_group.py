@@ -1,9 +1,10 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from f2bconfig import OrderStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource,Namespace,fields
 from sqlalchemy import Delete, Select, exc,and_,desc,asc, func
 from models.tenant import B2bCustomerGroup,B2bCustomerGroupCustomers, B2bOrders, CmmLegalEntities
@@ -87,8 +88,7 @@ class CustomerGroupList(Resource):
                 rquery = rquery.where(B2bCustomerGroup.need_approvement==filter_need_approvement)
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -106,7 +106,7 @@ class CustomerGroupList(Resource):
                         "need_approvement": m.need_approvement,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -130,6 +130,7 @@ class CustomerGroupList(Resource):
     @ns_customer_g.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registro!")
     @ns_customer_g.doc(body=grp_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -151,6 +152,7 @@ class CustomerGroupList(Resource):
     @ns_customer_g.response(HTTPStatus.OK,"Exclui os dados de uma coleção")
     @ns_customer_g.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -199,6 +201,7 @@ class CustomerGroupApi(Resource):
     @ns_customer_g.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_customer_g.doc(body=grp_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -221,6 +224,7 @@ class CustomerGroupApi(Resource):
     @ns_customer_g.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_customer_g.doc(body=grp_model)
     @auth.login_required
+    @RefCache.invalidates
     def put(self,id:int):
         try:
             req = request.get_json()
@@ -272,8 +276,7 @@ class CustomersApi(Resource):
             if filter_id_group is not None:
                 rquery = rquery.where(B2bCustomerGroupCustomers.id_customer_group==filter_id_group)
 
-            pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-            rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+            pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
             return {
                     "pagination":{
@@ -286,7 +289,7 @@ class CustomersApi(Resource):
                     "data":[{
                         "id": m.id_customer,
                         "name": m.name
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
 
         except exc.SQLAlchemyError as e:
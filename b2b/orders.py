@@ -1,15 +1,15 @@
 import calendar
-import requests
-import importlib
 import simplejson
 from auth import auth
+from conditional import ConditionalGet
 from os import environ
 from flask import request
 from http import HTTPStatus
 from decimal import Decimal
 from datetime import datetime
-from common import _extract_token
-from models.helpers import _get_params, db
+from common import _extract_token, _get_tenant_config
+from integrations.shipping.tracking import TrackingService
+from models.helpers import _get_params, _keyset_page, _paginate, db
 from flask_restx import Resource,Namespace,fields
 from f2bconfig import EntityAction, DevolutionStatus, OrderStatus
 from sqlalchemy import Update, and_, exc, Select, Delete, asc, desc, func
@@ -59,6 +59,16 @@ ord_return = ns_order.model(
     }
 )
 
+def _serialize_orders(rows) -> list:
+    return [{
+        "id": m.id,
+        "id_customer": m.id_customer,
+        "make_online": m.make_online,
+        "id_payment_condition": m.id_payment_condition,
+        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
+        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
+    } for m in rows]
+
 
 ####################################################################################
 #                  INICIO DAS CLASSES QUE IRAO TRATAR OS  PEDIDOS.                 #
@@ -70,11 +80,14 @@ class OrdersList(Resource):
     @ns_order.param("page","Número da página de registros","query",type=int,required=True)
     @ns_order.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_order.param("query","Texto para busca","query")
+    @ns_order.param("cursor","Paginação por cursor (vazio na primeira página, depois o next_cursor retornado)","query")
     @auth.login_required
+    @ConditionalGet.tables(B2bOrders)
     def get(self):
         pag_num  =  1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
         query   = "" if request.args.get("query") is None else request.args.get("query")
+        cursor  = request.args.get("cursor")
 
         try:
             params    = _get_params(str(query))
@@ -85,6 +98,25 @@ class OrdersList(Resource):
             # list_all  = False if not hasattr(params,'list_all') else True
 
 
+            # modo keyset: pedidos mais novos primeiro, sem OFFSET e sem COUNT
+            if cursor is not None:
+                stmt = Select(B2bOrders.id,B2bOrders.id_customer,B2bOrders.make_online,
+                              B2bOrders.id_payment_condition,B2bOrders.date_created,B2bOrders.date_updated)
+                if search is None:
+                    stmt = stmt.where(B2bOrders.trash.is_(False))
+                try:
+                    rows, pagination = _keyset_page(stmt,B2bOrders.id,B2bOrders.id,True,cursor,pag_size)
+                except ValueError:
+                    return {
+                        "error_code": HTTPStatus.BAD_REQUEST.value,
+                        "error_details": "Cursor inválido para a paginação por cursor!",
+                        "error_sql": ""
+                    }, HTTPStatus.BAD_REQUEST
+                return {
+                    "pagination": pagination,
+                    "data": _serialize_orders(rows)
+                }
+
             if search is not None:
 
                 #pensar nos filtros para essa listagem
@@ -100,14 +132,7 @@ class OrdersList(Resource):
                     "pages": rquery.pages,
                     "has_next": rquery.has_next
                 },
-                "data":[{
-                    "id": m.id,
-                    "id_customer": m.id_customer,
-                    "make_online": m.make_online,
-                    "id_payment_condition": m.id_payment_condition,
-                    "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                    "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                } for m in rquery.items]
+                "data": _serialize_orders(rquery.items)
             }
         except exc.SQLAlchemyError as e:
             return {
@@ -199,6 +224,7 @@ class OrderApi(Resource):
     @ns_order.response(HTTPStatus.OK,"Obtem um registro de pedido",ord_model)
     @ns_order.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @ConditionalGet.content()
     def get(self,id:int):
         try:
             order = db.session.execute(Select(B2bOrders.total_value,
@@ -408,6 +434,7 @@ class HistoryOrderList(Resource):
     @ns_order.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_order.param("query","Texto para busca","query")
     @auth.login_required
+    @ConditionalGet.content()
     def get(self):
         pag_num   = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size  = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -464,18 +491,14 @@ class HistoryOrderList(Resource):
                     Select(FprDevolution.id_order).where(FprDevolution.status!=DevolutionStatus.REJECTED.value)
                 ))
                     
-            track_order = False
-            url =str(environ.get("F2B_SMC_URL"))+"/config/"+str(request.headers.get("x-customer"))
-            cfg_req = requests.get(url)
-            if cfg_req.status_code==HTTPStatus.OK.value:
-                cfg = cfg_req.json()
-                track_order = bool(cfg["track_orders"])
+            cfg = _get_tenant_config(request.headers.get("x-customer"))
+            track_order = False if cfg is None else bool(cfg["track_orders"])
 
             # _show_query(stmt)
             
             if not list_all:
-                pag = db.paginate(stmt,page=pag_num,per_page=pag_size)
-                stmt = stmt.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(stmt,page=pag_num,per_page=pag_size)
+                tracks = self.__getTracks(pag.items,track_order,cfg)
 
                 return {
                     "pagination":{
@@ -499,17 +522,13 @@ class HistoryOrderList(Resource):
                         "status": r.status,
                         "integration_number": r.integration_number,
                         "invoice_number": r.invoice_number,
-                        "track": (None if track_order is False else self.__getTrack(
-                            r.taxvat,
-                            r.invoice_number,
-                            r.invoice_serie,
-                            r.track_company,
-                            r.track_code,
-                            cfg.id_customer) ),
+                        "track": tracks.get(r.id_order),
                         "date_created": r.date_created.strftime("%d/%m/%Y %H:%M:%S")
-                    }for r in db.session.execute(stmt)]
+                    }for r in pag.items]
                 }
             else:
+                rows = db.session.execute(stmt).all()
+                tracks = self.__getTracks(rows,track_order,cfg)
                 return [{
                         "id_order": '{:010d}'.format(r.id_order),
                         "id_order_number": r.id_order,
@@ -524,15 +543,9 @@ class HistoryOrderList(Resource):
                         "status": r.status,
                         "integration_number": r.integration_number,
                         "invoice_number": r.invoice_number,
-                        "track": (None if track_order is False else self.__getTrack(
-                            r.taxvat,
-                            r.invoice_number,
-                            r.invoice_serie,
-                            r.track_company,
-                            r.track_code,
-                            cfg.id_customer) ),
+                        "track": tracks.get(r.id_order),
                         "date_created": r.date_created.strftime("%d/%m/%Y %H:%M:%S")
-                    }for r in db.session.execute(stmt)]
+                    }for r in rows]
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -540,17 +553,13 @@ class HistoryOrderList(Resource):
                 "error_sql": e._sql_message()
             }
     
-    def __getTrack(self,_cnpj:str,_nf:int,_nf_serie:int,_emp:str,_code:str,_tenant:str):
-
-        class_name = str(_emp).lower().replace("_","").title().replace(" ","")
-        SHIPPING = getattr(
-            importlib.import_module('integrations.shipping.'+str(_emp).lower()),
-            class_name
-        )
-
-        track = SHIPPING()
-
-        return track.tracking(_cnpj,_nf,_nf_serie,_tenant=_tenant)
+    def __getTracks(self,rows:list,track_order:bool,cfg) -> dict:
+        # consulta todas as transportadoras da pagina em paralelo (com cache), no timeout retorna parcial
+        if track_order is False or cfg is None:
+            return {}
+        return TrackingService.track({
+            r.id_order: (r.track_company,r.taxvat,r.invoice_number,r.invoice_serie) for r in rows
+        },cfg["id_customer"])
         
 ns_order.add_resource(HistoryOrderList,'/history/')
 
@@ -559,6 +568,7 @@ class HistoryOrderApi(Resource):
     @ns_order.response(HTTPStatus.OK,"Obtem o total de pedidos realizados com base na meta")
     @ns_order.response(HTTPStatus.BAD_REQUEST,"Falha ao listar registros!")
     @auth.login_required
+    @ConditionalGet.content()
     def get(self):
         try:
             date_start = str(datetime.now().year)+'-01-01'
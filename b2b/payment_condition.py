@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, desc, asc
 from models.tenant import B2bPaymentConditions
 from flask_restx import Resource,Namespace,fields
@@ -44,6 +45,7 @@ class PaymentConditionsList(Resource):
     @ns_payment.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_payment.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("payment-conditions")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -78,8 +80,7 @@ class PaymentConditionsList(Resource):
                 rquery = rquery.where(B2bPaymentConditions.received_days==filter_received_days)
 
             if not list_all:
-                pag    = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag    = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
                     "pagination":{
                         "registers": pag.total,
@@ -95,7 +96,7 @@ class PaymentConditionsList(Resource):
                         "installments": m.installments,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -118,6 +119,7 @@ class PaymentConditionsList(Resource):
     @ns_payment.response(HTTPStatus.OK,"Cria uma nova condição de pagamento no sistema")
     @ns_payment.response(HTTPStatus.BAD_REQUEST,"Falha ao criar nova condicao de pagamento!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -138,6 +140,7 @@ class PaymentConditionsList(Resource):
     @ns_payment.response(HTTPStatus.OK,"Exclui os dados de uma condição de pagamento")
     @ns_payment.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -159,6 +162,7 @@ class PaymentConditionApi(Resource):
     @ns_payment.response(HTTPStatus.OK,"Obtem um registro de uma condição de pagamento",pay_model)
     @ns_payment.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("payment-conditions")
     def get(self,id:int):
         try:
             reg:B2bPaymentConditions|None = B2bPaymentConditions.query.get(id)
@@ -188,6 +192,7 @@ class PaymentConditionApi(Resource):
     @ns_payment.response(HTTPStatus.OK,"Salva dados de uma condição de pgamento")
     @ns_payment.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -3,7 +3,7 @@ from os import environ
 from flask import request
 from http import HTTPStatus
 from decimal import Decimal
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, desc, asc
 from flask_restx import Resource, Namespace, fields
 from models.tenant import B2bTablePrice, B2bTablePriceProduct
@@ -92,8 +92,7 @@ class PriceTableList(Resource):
                 rquery = rquery.where(B2bTablePrice.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -109,7 +108,7 @@ class PriceTableList(Resource):
                         "start_date": m.start_date,
                         "end_date": m.end_date,
                         "active": m.active
-                    }for m in db.session.execute(rquery)]
+                    }for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -1,11 +1,14 @@
+import logging
 import simplejson
 from auth import auth
+from ref_cache import RefCache
 from os import environ
-from flask import request
+from flask import Response, request, stream_with_context
 from decimal import Decimal
 from http import HTTPStatus
 from datetime import datetime
-from models.helpers import _get_params, db
+from f2bconfig import ContentType
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource, Namespace, fields
 from sqlalchemy import Delete, Select, and_, exc, or_, desc, asc
 from models.tenant import CmmTranslateColors, CmmTranslateSizes, ScmEvent
@@ -16,6 +19,87 @@ from models.tenant import CmmProductsGridSizes, CmmProductsImages, CmmProductsMo
 
 ns_stock = Namespace("product-stock",description="Operações para manipular dados de estoques de produtos")
 
+# quantidade de produtos carregados por vez no modo list_all (streaming)
+STOCK_STREAM_CHUNK = 500
+
+def _load_stock_matrix(id_products:list) -> dict:
+    """ Carrega cores e tamanhos de todos os produtos informados em uma unica consulta
+        e monta a arvore produto -> cor -> tamanho em uma unica passada """
+    matrix = {}
+    if len(id_products)==0:
+        return matrix
+
+    squery = Select(B2bProductStock.id_product,
+                    B2bProductStock.id_color,
+                    CmmTranslateColors.name.label("color_name"),
+                    B2bProductStock.id_size,
+                    CmmTranslateSizes.new_size.label("size_name"),
+                    B2bProductStock.quantity,
+                    B2bProductStock.ilimited,
+                    B2bProductStock.in_order)\
+        .join(CmmTranslateColors,CmmTranslateColors.id==B2bProductStock.id_color)\
+        .join(CmmTranslateSizes,CmmTranslateSizes.id==B2bProductStock.id_size)\
+        .where(B2bProductStock.id_product.in_(id_products))\
+        .order_by(B2bProductStock.id_product,B2bProductStock.id_color,B2bProductStock.id_size)
+
+    for s in db.session.execute(squery):
+        colors = matrix.setdefault(s.id_product,{})
+        color  = colors.get(s.id_color)
+        if color is None:
+            color = colors[s.id_color] = {
+                "id": s.id_color,
+                "name": s.color_name,
+                "sizes": []
+            }
+        color["sizes"].append({
+            "id": s.id_size,
+            "name": s.size_name,
+            "quantity": s.quantity,
+            "in_order": s.in_order,
+            "ilimited": s.ilimited
+        })
+    return matrix
+
+def _format_stock_product(m,matrix:dict) -> dict:
+    return {
+        "id_product":m.id_product,
+        "id_grid": m.id_grid,
+        "refCode": m.refCode,
+        "product": m.product,
+        "colors": list(matrix.get(m.id_product,{}).values())
+    }
+
+def _stream_stock_matrix(pquery):
+    """ Gera o JSON da listagem completa em partes, carregando o estoque
+        de cada bloco de produtos com uma unica consulta. O primeiro bloco eh lido
+        antes da resposta comecar, assim falhas na consulta ainda viram o erro da API """
+    result = db.session.execute(pquery.execution_options(yield_per=STOCK_STREAM_CHUNK))
+    partitions = result.partitions()
+    first_chunk = next(partitions,[])
+    first_matrix = _load_stock_matrix([m.id_product for m in first_chunk])
+
+    def generate():
+        yield "["
+        first = True
+        try:
+            products, matrix = first_chunk, first_matrix
+            while True:
+                for m in products:
+                    yield ("" if first else ",")+simplejson.dumps(_format_stock_product(m,matrix))
+                    first = False
+                products = next(partitions,None)
+                if products is None:
+                    break
+                matrix = _load_stock_matrix([m.id_product for m in products])
+        except exc.SQLAlchemyError as e:
+            # o status 200 jah foi enviado, o cliente recebe o JSON incompleto
+            logging.error("Falha no streaming do estoque: "+str(e))
+            return
+        finally:
+            result.close()
+        yield "]"
+    return generate()
+
 stock_pag_model = ns_stock.model(
     "Pagination",{
         "registers": fields.Integer,
@@ -151,19 +235,6 @@ class ProductStockList(Resource):
                     CmmTranslateColors.id.in_(str(filter_color).split(','))
                 )
             
-            # color query
-            cquery = Select(B2bProductStock.id_color,
-                            CmmTranslateColors.name).distinct()\
-                .join(CmmTranslateColors,CmmTranslateColors.id==B2bProductStock.id_color)
-            
-            # size query
-            squery = Select(B2bProductStock.id_size,
-                            CmmTranslateSizes.new_size.label("name"),
-                            B2bProductStock.quantity,
-                            B2bProductStock.ilimited,
-                            B2bProductStock.in_order)\
-                .join(CmmTranslateSizes,CmmTranslateSizes.id==B2bProductStock.id_size)
-            
             # _show_query(pquery)
 
             if search is not None:
@@ -183,8 +254,10 @@ class ProductStockList(Resource):
             # _show_query(pquery)
 
             if not list_all:
-                pag = db.paginate(pquery,page=pag_num,per_page=pag_size)
-                pquery = pquery.limit(pag_size).offset((pag_num -1) * pag_size)
+                pag = _paginate(pquery,page=pag_num,per_page=pag_size)
+
+                products = pag.items
+                matrix   = _load_stock_matrix([m.id_product for m in products])
 
                 retorno =  {
                     "pagination":{
@@ -194,43 +267,12 @@ class ProductStockList(Resource):
                         "pages": pag.pages,
                         "has_next": pag.has_next
                     },
-                    "data":[{
-                        "id_product":m.id_product,
-                        "id_grid": m.id_grid,
-                        "refCode": m.refCode,
-                        "product": m.product,
-                        "colors": [{
-                            "id": c.id_color,
-                            "name": c.name,
-                            "sizes":[{
-                                "id": s.id_size,
-                                "name": s.name,
-                                "quantity": s.quantity,
-                                "in_order": s.in_order,
-                                "ilimited": s.ilimited 
-                            }for s in db.session.execute(squery.where(and_(B2bProductStock.id_product==m.id_product,B2bProductStock.id_color==c.id_color)))]
-                        }for c in db.session.execute(cquery.where(B2bProductStock.id_product==m.id_product))]
-                    } for m in db.session.execute(pquery)]
+                    "data":[_format_stock_product(m,matrix) for m in products]
                 }
             else:
-                retorno = [{
-                        "id_product":m.id_product,
-                        "id_grid": m.id_grid,
-                        "refCode": m.refCode,
-                        "product": m.product,
-                        "colors": [{
-                            "id": c.id_color,
-                            "name": c.name,
-                            "sizes":[{
-                                "id": s.id_size,
-                                "name": s.name,
-                                "quantity": s.quantity,
-                                "in_order": s.in_order,
-                                "ilimited": s.ilimited 
-                            }for s in db.session.execute(squery.where(and_(B2bProductStock.id_product==m.id_product,B2bProductStock.id_color==c.id_color)))]
-                        }for c in db.session.execute(cquery.where(B2bProductStock.id_product==m.id_product))]
-                    } for m in db.session.execute(pquery)]
-                
+                # listagem completa eh enviada em partes para nao estourar o tempo das telas de showroom
+                return Response(stream_with_context(_stream_stock_matrix(pquery)),mimetype=ContentType.JSON.value)
+
             return retorno
         except exc.SQLAlchemyError as e:
             return {
@@ -245,6 +287,7 @@ class ProductStockList(Resource):
     @ns_stock.param("received_days","Dias para recebimento","formData",type=int,required=True)
     @ns_stock.param("installments","Número de parcelas","formData",type=int,required=True)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -340,6 +383,7 @@ class ProductStockApi(Resource):
     @ns_stock.response(HTTPStatus.OK,"Salva dados de um estoque")
     @ns_stock.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int,color:str,size:str):
         try:
             req = request.get_json()
@@ -363,6 +407,7 @@ class ProductStockApi(Resource):
     @ns_stock.response(HTTPStatus.OK,"Exclui os dados de uma condição de pagamento")
     @ns_stock.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self,id:int,color:str,size:str):
         try:
             payCond = B2bProductStock.query.get([id,color,size])
@@ -670,8 +715,7 @@ class ProductsGallery(Resource):
                 rquery = rquery.order_by(direction(order_by))
 
             if list_all is False:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size) # type: ignore
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 return {
                     "pagination":{
@@ -702,7 +746,7 @@ class ProductsGallery(Resource):
                             "name": c.name,
                             "color": c.hexcode
                         }for c in db.session.execute(cquery.where(and_(CmmProductsGrid.id==m.id_grid,B2bProductStock.id_product==m.id)))]
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 return [{
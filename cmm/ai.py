@@ -1,11 +1,9 @@
-import requests
 import importlib
 from auth import auth
-from os import environ
 from flask import request
 from http import HTTPStatus
 from flask_restx import Resource, Namespace, fields
-from common import _extract_token
+from common import _extract_token, _get_tenant_config
 
 ns_ai = Namespace("ai",description="Manipula informacoes com IA")
 
@@ -31,19 +29,14 @@ class AiApi(Resource):
                 if tkn is not None:
                     token = _extract_token(tkn)
                     if token is not None:
-                        # faz a chamada para reduzir acoplamento
-                        resp = requests.get(str(environ.get("F2B_SMC_URL"))+"config/",{
-                            "tenant": token["profile"]
-                        })
-                        if resp.status_code==HTTPStatus.OK.value:
-                            cfg = resp.json()
-
+                        cfg = _get_tenant_config(token["profile"])
+                        if cfg is not None:
                             model = 'chatgpt'
-                            if cfg.ai_model == 'C':
+                            if cfg["ai_model"] == 'C':
                                 model = 'chatgpt'
-                            elif cfg.ai_model == 'G':
+                            elif cfg["ai_model"] == 'G':
                                 model = 'gemini'
-                            elif cfg.ai_model == 'D':
+                            elif cfg["ai_model"] == 'D':
                                 model = 'deepseek'
                             
 
@@ -52,13 +45,13 @@ class AiApi(Resource):
                             importlib.import_module('integrations.ai.'+str(model)),
                             class_name
                             )
-                            ai = AI_OBJ(cfg.ai_api_key)
+                            ai = AI_OBJ(cfg["ai_api_key"])
                             return ai.suggest_email(req["text"],req["type"])
                         else:
                             return {
                                 "error_code": HTTPStatus.BAD_REQUEST.value,
                                 "error_details": "Falha ao buscar configurações do sistema",
-                                "error_sql": resp.reason
+                                "error_sql": ""
                             }, HTTPStatus.BAD_REQUEST
         except Exception as e:
             print(e)
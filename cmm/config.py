@@ -3,7 +3,7 @@ from os import environ
 from flask import request
 from sqlalchemy import exc
 from http import HTTPStatus
-from common import _extract_token
+from common import _extract_token, _get_tenant_config
 from flask_restx import Resource, Namespace, fields
 
 ns_config = Namespace("config",description="Obtem as configuracoes do sistema")
@@ -35,9 +35,8 @@ class ConfigList(Resource):
     @ns_config.response(HTTPStatus.BAD_REQUEST,"Falha ao listar registros!")
     def get(self):
         try:
-            resp = requests.get(str(environ.get("F2B_SMC_URL"))+"config/"+str(request.headers.get("x-customer")))
-            if resp.status_code == HTTPStatus.OK.value:
-                cfg = resp.json()
+            cfg = _get_tenant_config(request.headers.get("x-customer"))
+            if cfg is not None:
                 return {
                     "ai_model": cfg["ai_model"],
                     "ai_api_key": cfg["ai_api_key"],
@@ -4,13 +4,10 @@ import mimetypes
 from auth import auth
 from flask import request
 from http import HTTPStatus
-from common import _send_email
+from common import _send_email, _get_tenant_config
 from werkzeug import exceptions
 from f2bconfig import MailTemplates
 from flask_restx import Resource,Namespace
-from sqlalchemy import Select
-from models.helpers import db
-from models.public import SysConfig
 
 ns_email = Namespace("email",description="Operações para manipular upload de dados")
 
@@ -27,9 +24,9 @@ class EmailApi(Resource):
 
             id_customer = str(request.headers.get("x-customer"))
 
-            # get brevo API Key
-            brevo_key = db.session.execute(Select(SysConfig.email_brevo_api_key).where(SysConfig.id_customer==id_customer)).first()
-            if brevo_key is None:
+            # a chave da Brevo eh lida da configuracao no envio, aqui soh confere se existe
+            cfg = _get_tenant_config(id_customer)
+            if cfg is None:
                 return False
 
             #verifica se os arquivos existem
@@ -39,9 +36,10 @@ class EmailApi(Resource):
                     pass
                 else:
                     with open(fpath+file,"rb") as f:
-                        content = base64.b64encode(f.read())
+                        content = base64.b64encode(f.read()).decode("utf-8")
+                    # o conteudo vai para a fila de envio em json, por isso texto
                     attachs.append({
-                        "name": file,
+                        "filename": file,
                         "type": mimetypes.guess_type(fpath+file),
                         "content": content
                     })
@@ -52,7 +50,6 @@ class EmailApi(Resource):
                 req['subject'],
                 req['content'],
                 MailTemplates.DEFAULT,
-                brevo_key.email_brevo_api_key,
                 attachs) is True:
                 #limpa os arquivos do tmp
                 for file in req["attachments"]:
@@ -1,12 +1,14 @@
 import os
-import csv
 from auth import auth
+from ref_cache import RefCache
+from conditional import ConditionalGet
 from pathlib import Path
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
-from f2bconfig import EntityAction, LegalEntityContactType
-from models.helpers import _get_params, db
+from f2bconfig import EntityAction
+from models.helpers import _get_params, _keyset_page, _paginate, db
+from importer import CsvImporter
 from models.tenant import CmmLegalEntities
 from models.tenant import CmmLegalEntityContact
 from flask_restx import Resource, Namespace, fields
@@ -62,6 +64,33 @@ lgl_return = ns_legal.model(
     }
 )
 
+def _serialize_entities(rows) -> list:
+    return [{
+        "id": m.id,
+        "name": m.social_name,
+        "fantasy_name": m.fantasy_name,
+        "taxvat": m.taxvat,
+        "city": {
+            "id": m.city_id,
+            "name": m.city_name,
+            "stage_region": {
+                "id": m.state_id,
+                "name": m.state_name,
+                "acronym": m.acronym,
+                "country":{
+                    "id": m.country_id,
+                    "name": m.country_name
+                }
+            }
+        },
+        "postal_code": m.postal_code,
+        "address": m.address,
+        "neighborhood": m.neighborhood,
+        "type": m.type,
+        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
+        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
+    } for m in rows]
+
 ####################################################################################
 #            INICIO DAS CLASSES QUE IRAO TRATAR OS GRUPOS DE CLIENTES.             #
 ####################################################################################
@@ -73,11 +102,14 @@ class EntitysList(Resource):
     @ns_legal.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_legal.param("query","Texto para busca","query")
     @ns_legal.param("list_all","Se deve exportar","query",type=bool,default=False)
+    @ns_legal.param("cursor","Paginação por cursor (vazio na primeira página, depois o next_cursor retornado)","query")
     @auth.login_required
+    @ConditionalGet.tables(CmmLegalEntities,B2bCustomerGroup,B2bCustomerGroupCustomers)
     def get(self):
         pag_num   = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size  = int(str(os.environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
         search    = "" if request.args.get("query") is None else request.args.get("query")
+        cursor    = request.args.get("cursor")
 
         try:
             params = _get_params(search)
@@ -151,9 +183,24 @@ class EntitysList(Resource):
             if filter_country is not None:
                 rquery = rquery.where(SysCountries.id==filter_country)
 
+            # modo keyset: sem OFFSET e sem COUNT, a proxima pagina vem do next_cursor
+            if cursor is not None:
+                try:
+                    rows, pagination = _keyset_page(rquery,getattr(CmmLegalEntities,order_by),CmmLegalEntities.id,
+                                                    direction is desc,cursor,pag_size)
+                except (AttributeError,ValueError):
+                    return {
+                        "error_code": HTTPStatus.BAD_REQUEST.value,
+                        "error_details": "Cursor ou ordenação inválidos para a paginação por cursor!",
+                        "error_sql": ""
+                    }, HTTPStatus.BAD_REQUEST
+                return {
+                    "pagination": pagination,
+                    "data": _serialize_entities(rows)
+                }
+
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 return {
                     "pagination":{
@@ -163,58 +210,10 @@ class EntitysList(Resource):
                         "pages": pag.pages,
                         "has_next": pag.has_next
                     },
-                    "data":[{
-                        "id": m.id,
-                        "name": m.social_name,
-                        "fantasy_name": m.fantasy_name,
-                        "taxvat": m.taxvat,
-                        "city": {
-                            "id": m.city_id,
-                            "name": m.city_name,
-                            "stage_region": {
-                                "id": m.state_id,
-                                "name": m.state_name,
-                                "acronym": m.acronym,
-                                "country":{
-                                    "id": m.country_id,
-                                    "name": m.country_name
-                                }
-                            }
-                        },
-                        "postal_code": m.postal_code,
-                        "address": m.address,
-                        "neighborhood": m.neighborhood,
-                        "type": m.type,
-                        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    "data": _serialize_entities(pag.items)
                 }
             else:
-                return [{
-                        "id": m.id,
-                        "name": m.social_name,
-                        "fantasy_name": m.fantasy_name,
-                        "taxvat": m.taxvat,
-                        "city": {
-                            "id": m.city_id,
-                            "name": m.city_name,
-                            "stage_region": {
-                                "id": m.state_id,
-                                "name": m.state_name,
-                                "acronym": m.acronym,
-                                "country":{
-                                    "id": m.country_id,
-                                    "name": m.country_name
-                                }
-                            }
-                        },
-                        "postal_code": m.postal_code,
-                        "address": m.address,
-                        "neighborhood": m.neighborhood,
-                        "type": m.type,
-                        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery).all()]
+                return _serialize_entities(db.session.execute(rquery).all())
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -231,6 +230,7 @@ class EntitysList(Resource):
     @ns_legal.response(HTTPStatus.OK,"Cria um novo registro de cliente/representante/fornecedor",model=lgl_registry)
     @ns_legal.response(HTTPStatus.BAD_REQUEST,"Falha ao criar um novo cliente/representante/fornecedor!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -314,6 +314,7 @@ class EntityApi(Resource):
     @ns_legal.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @ns_legal.param("id","Id do usuário do sistema (tabela CmmUser)")
     @auth.login_required
+    @ConditionalGet.tables(CmmLegalEntities,CmmLegalEntityContact,CmmLegalEntityFile,B2bCustomerGroup)
     def get(self,id:int):
         try:
             rquery = Select(
@@ -489,6 +490,7 @@ class EntityApi(Resource):
     @ns_legal.response(HTTPStatus.OK,"Salva dados de um cliente/representante/fornecedor",model=lgl_registry)
     @ns_legal.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -653,9 +655,8 @@ class EntityOfStage(Resource):
                     )
                 )
                 
-            pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
+            pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
-            rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
 
             return {
                     "pagination":{
@@ -692,7 +693,7 @@ class EntityOfStage(Resource):
                         "type": m.type,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
         except exc.SQLAlchemyError as e:
             return {
@@ -846,8 +847,7 @@ class EntityHistory(Resource):
                 rquery = rquery.where(CmmLegalEntityHistory.history.like('%{}%'.format(search)))
             
 
-            pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-            rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+            pag = _paginate(rquery,page=pag_num,per_page=pag_size)
             
             return {
                     "pagination":{
@@ -863,7 +863,7 @@ class EntityHistory(Resource):
                         "history": r.history,
                         "action": r.action,
                         "date_created": r.date_created.strftime("%d/%m/%Y %H:%M:%S")
-                    }for r in db.session.execute(rquery)]
+                    }for r in pag.items]
             }
             
         except exc.SQLAlchemyError as e:
@@ -900,6 +900,7 @@ class EntityImport(Resource):
             #varre o diretorio atras dos arquivos do customer
             str_path = str(os.environ.get("F2B_APP_PATH"))+'assets/import/'
             path = Path(str_path)
+            summary = {}
             for file in list(path.rglob("*.csv")):
                 if file.name.find(customer)!=-1:
                     "extract data from file name"
@@ -907,63 +908,22 @@ class EntityImport(Resource):
                     # tipo de cadastro
                     # data[2]
 
-                    with open(str_path+file.name,mode='r',newline='',encoding="utf-8") as f:
-                        reader = csv.reader(f)
-                        for row in reader:
-                            if reader.line_num > 1:
-                                self.__import(row,data[2])
+                    # importacao em blocos com o mapa de cidades carregado uma unica vez
+                    with db.engine.connect() as conn:
+                        summary[file.name] = CsvImporter(conn).import_legal_entities(str_path+file.name,data[2])
+                        conn.commit()
 
                     # apaga o arquivo apos importacao
                     if os.path.exists(str_path+file.name)==True:
                         os.remove(str_path+file.name)
             
-            return True
+            return summary
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
                 "error_details": e._message(),
                 "error_sql": e._sql_message()
             }
-        
-    def __import(self,reg:list,type:str) -> bool:
-                
-        ent = CmmLegalEntities()
-        ent.origin_id    = reg[0]
-        ent.taxvat       = reg[1]
-        ent.name         = reg[2]
-        ent.fantasy_name = reg[3]
-        ent.type         = type
-
-        city = db.session.execute(Select(SysCities.id).where(func.upper(SysCities.name)==str(reg[4]).upper())).first()
-        ent.id_city         = 0 if city is None else city.id
-        ent.postal_code     = str(reg[5]).replace("-","").replace(" ","")
-        ent.neighborhood    = str(reg[6]).upper()
-        ent.address         = str(reg[7]).upper()
-        ent.activation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        db.session.add(ent)
-        db.session.commit()
-
-        ent_ct = CmmLegalEntityContact()
-        ent_ct.id_legal_entity = ent.id
-        ent_ct.name            = str(reg[8])
-        ent_ct.contact_type    = LegalEntityContactType.PHONE.value
-        ent_ct.value           = str(reg[9]).replace(" ","").replace("-","").replace("(","").replace(")","") # se for telefone pode remover tracos e parenteses
-        ent_ct.is_whatsapp     = True if reg[10]=="1" else False
-        ent_ct.is_default      = True if reg[11]=="1" else False
-        db.session.add(ent_ct)
-
-        ent_ml = CmmLegalEntityContact()
-        ent_ml.id_legal_entity = ent.id
-        ent_ml.name            = reg[12]
-        ent_ml.contact_type    = LegalEntityContactType.EMAIL.value
-        ent_ml.value           = reg[13]
-        ent_ml.is_whatsapp     = False
-        ent_ml.is_default      = True if reg[14]=="1" else False
-        db.session.add(ent_ml)
-        db.session.commit()
-
-        return True
-
 
 
 ns_legal.add_resource(EntityImport,'/process-import')
\ No newline at end of file
@@ -1,9 +1,10 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from models.tenant import CmmMeasureUnit
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, desc, exc, asc
 from flask_restx import Resource,Namespace,fields
 
@@ -44,6 +45,7 @@ class MeasureUnitList(Resource):
     @ns_measure_unit.param("order_by","Campo de ordenacao","query")
     @ns_measure_unit.param("order_dir","Direção da ordenação","query",enum=['ASC','DESC'])
     @auth.login_required
+    @RefCache.cached("measure-units")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -66,8 +68,7 @@ class MeasureUnitList(Resource):
                 rquery = rquery.where(CmmMeasureUnit.description.like("%{}%".format("search")))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
 					"pagination":{
 						"registers": pag.total,
@@ -80,7 +81,7 @@ class MeasureUnitList(Resource):
 						"id": m.id,
                         "code": m.code,
 						"description": m.description
-					} for m in db.session.execute(rquery)]
+					} for m in pag.items]
 				}
             else:
                 retorno = [{
@@ -100,6 +101,7 @@ class MeasureUnitList(Resource):
     @ns_measure_unit.response(HTTPStatus.BAD_REQUEST,"Falha ao criar nova unidade de medida!")
     @ns_measure_unit.doc(body=mu_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -119,6 +121,7 @@ class MeasureUnitList(Resource):
     @ns_measure_unit.response(HTTPStatus.OK,"Exclui os dados de unidade(s) de medida")
     @ns_measure_unit.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -139,6 +142,7 @@ class MeasureUnitApi(Resource):
     @ns_measure_unit.response(HTTPStatus.OK,"Obtem um registro de uma unidade de medida",mu_model)
     @ns_measure_unit.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("measure-units")
     def get(self,id:int):
         try:
             reg: CmmMeasureUnit|None = CmmMeasureUnit.query.get(id)
@@ -166,6 +170,7 @@ class MeasureUnitApi(Resource):
     @ns_measure_unit.response(HTTPStatus.OK,"Atualiza os dados de uma unidade de medida")
     @ns_measure_unit.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
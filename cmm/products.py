@@ -1,10 +1,12 @@
 import simplejson
 from auth import auth
+from ref_cache import RefCache
+from conditional import ConditionalGet
 from os import environ
 from flask import request
 from decimal import Decimal
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _keyset_page, _paginate, db
 from f2bconfig import ProductMassiveAction
 from flask_restx import Resource, Namespace, fields
 from models.tenant import CmmCategories, CmmMeasureUnit
@@ -61,6 +63,38 @@ prd_return = ns_prod.model(
     }
 )
 
+def _serialize_products(rows:list) -> list:
+    # busca as categorias de todos os produtos da pagina em uma unica consulta
+    categories = {}
+    if len(rows) > 0:
+        for c in db.session.execute(Select(CmmProductsCategories.id_product,CmmCategories.name)
+                                    .join(CmmCategories,CmmCategories.id==CmmProductsCategories.id_category)
+                                    .where(CmmProductsCategories.id_product.in_([m.id for m in rows]))):
+            categories.setdefault(c.id_product,[]).append({"name": c.name})
+
+    return [{
+        "id": m.id,
+        "type_description": m.type_description,
+        "model_description": m.model_description,
+        "grid_description":m.grid_description,
+        "moment_description": m.moment_description,
+        "prodCode": m.prodCode,
+        "barCode": m.barCode,
+        "refCode": m.refCode,
+        "name": m.name,
+        "description": m.description,
+        "observation": m.observation,
+        "ncm": m.ncm,
+        # str do Decimal gera o mesmo texto que o simplejson.dumps
+        "price": str(m.price),
+        "price_pos": None if m.price_pos is None else str(m.price_pos),
+        "measure_unit": m.measure_unit,
+        "structure": m.structure,
+        "categories": categories.get(m.id,[]),
+        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
+        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
+    } for m in rows]
+
 ####################################################################################
 #                INICIO DAS CLASSES QUE IRA TRATAR OS PRODUTOS.                    #
 ####################################################################################
@@ -73,11 +107,15 @@ class ProductsList(Resource):
     @ns_prod.param("query","Texto para busca","query")
     @ns_prod.param("order_by","Campo de ordenacao","query")
     @ns_prod.param("order_dir","Direção da ordenação","query",enum=['ASC','DESC'])
+    @ns_prod.param("cursor","Paginação por cursor (vazio na primeira página, depois o next_cursor retornado)","query")
     @auth.login_required
+    @ConditionalGet.tables(CmmProducts,CmmProductsTypes,CmmProductsModels,CmmProductsGrid,CmmMeasureUnit,
+                          B2bCollection,CmmCategories,CmmProductsCategories,B2bProductStock)
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
         query   = "" if request.args.get("query") is None else request.args.get("query")
+        cursor  = request.args.get("cursor")
 
         try:
             params = _get_params(query)
@@ -121,8 +159,6 @@ class ProductsList(Resource):
                             .where(CmmProducts.trash==trash)\
                             .order_by(direction(getattr(CmmProducts, order_by)))
             
-            cat_query = Select(CmmCategories.name).join(CmmProductsCategories,CmmProductsCategories.id_category==CmmCategories.id)
-
             # _show_query(rquery)
             
             if filter_search is not None:
@@ -168,9 +204,24 @@ class ProductsList(Resource):
                     Select(B2bProductStock.id_product.distinct())
                 ))
 
+            # modo keyset: sem OFFSET e sem COUNT, a proxima pagina vem do next_cursor
+            if cursor is not None:
+                try:
+                    rows, pagination = _keyset_page(rquery,getattr(CmmProducts,order_by),CmmProducts.id,
+                                                    direction is desc,cursor,pag_size)
+                except (AttributeError,ValueError):
+                    return {
+                        "error_code": HTTPStatus.BAD_REQUEST.value,
+                        "error_details": "Cursor ou ordenação inválidos para a paginação por cursor!",
+                        "error_sql": ""
+                    }, HTTPStatus.BAD_REQUEST
+                return {
+                    "pagination": pagination,
+                    "data": _serialize_products(rows)
+                }
+
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 return {
                     "pagination":{
@@ -180,50 +231,10 @@ class ProductsList(Resource):
                         "pages": pag.pages,
                         "has_next": pag.has_next
                     },
-                    "data":[{
-                        "id": m.id,
-                        "type_description": m.type_description,
-                        "model_description": m.model_description,
-                        "grid_description":m.grid_description,
-                        "moment_description": m.moment_description,
-                        "prodCode": m.prodCode,
-                        "barCode": m.barCode,
-                        "refCode": m.refCode,
-                        "name": m.name,
-                        "description": m.description,
-                        "observation": m.observation,
-                        "ncm": m.ncm,
-                        "price": simplejson.dumps(Decimal(m.price)),
-                        "price_pos": None if m.price_pos is None else simplejson.dumps(Decimal(m.price_pos)),
-                        "measure_unit": m.measure_unit,
-                        "structure": m.structure,
-                        "categories": [{"name": c.name } for c in db.session.execute(cat_query.where(CmmProductsCategories.id_product==m.id))],
-                        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    "data": _serialize_products(pag.items)
                 }
             else:
-                return [{
-                        "id": m.id,
-                        "type_description": m.type_description,
-                        "model_description": m.model_description,
-                        "grid_description":m.grid_description,
-                        "moment_description": m.moment_description,
-                        "prodCode": m.prodCode,
-                        "barCode": m.barCode,
-                        "refCode": m.refCode,
-                        "name": m.name,
-                        "description": m.description,
-                        "observation": m.observation,
-                        "ncm": m.ncm,
-                        "price": simplejson.dumps(Decimal(m.price)),
-                        "price_pos": None if m.price_pos is None else simplejson.dumps(Decimal(m.price_pos)),
-                        "measure_unit": m.measure_unit,
-                        "structure": m.structure,
-                        "categories": [{"name": c.name } for c in db.session.execute(cat_query.where(CmmProductsCategories.id_product==m.id))],
-                        "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                return _serialize_products(db.session.execute(rquery).all())
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -235,6 +246,7 @@ class ProductsList(Resource):
     @ns_prod.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo produto!")
     @ns_prod.doc(body=prd_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -289,6 +301,7 @@ class ProductsList(Resource):
     @ns_prod.response(HTTPStatus.OK,"Exclui os dados de produto(s)")
     @ns_prod.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -348,6 +361,7 @@ class ProductApi(Resource):
     @ns_prod.response(HTTPStatus.OK,"Obtem um registro de produto",prd_model)
     @ns_prod.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @ConditionalGet.tables(CmmProducts,CmmProductsImages)
     def get(self,id:int):
         try:
             rquery = CmmProducts.query.get(id)
@@ -393,6 +407,7 @@ class ProductApi(Resource):
     @ns_prod.response(HTTPStatus.OK,"Salva dados de um produto")
     @ns_prod.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int)->bool|dict:
         try:
             req = request.get_json()
@@ -443,6 +458,7 @@ class ProductApi(Resource):
     @ns_prod.response(HTTPStatus.OK,"Exclui os dados de um produto")
     @ns_prod.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self,id:int)->bool|dict:
         try:
             prod = CmmProducts.query.get(id)
@@ -1,9 +1,10 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from models.tenant import CmmCategories
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource, Namespace, fields
 
@@ -44,6 +45,7 @@ class CategoryList(Resource):
     @ns_cat.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_cat.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("categories")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -79,8 +81,7 @@ class CategoryList(Resource):
                 rquery = rquery.where(CmmCategories.id_parent.is_not(None))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
 					"pagination":{
 						"registers": pag.total,
@@ -96,7 +97,7 @@ class CategoryList(Resource):
 						"id_parent": m.id_parent,
 						"date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
 						"date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-					} for m in db.session.execute(rquery)]
+					} for m in pag.items]
 				}
             else:
                 retorno = [{
@@ -119,6 +120,7 @@ class CategoryList(Resource):
     @ns_cat.response(HTTPStatus.BAD_REQUEST,"Falha ao criar nova categoria de produto!")
     @ns_cat.doc(body=cat_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -138,6 +140,7 @@ class CategoryList(Resource):
     @ns_cat.response(HTTPStatus.OK,"Exclui os dados de uma categoria")
     @ns_cat.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -158,6 +161,7 @@ class CategoryApi(Resource):
     @ns_cat.response(HTTPStatus.OK,"Obtem um registro de uma categoria",cat_model)
     @ns_cat.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("categories")
     def get(self,id:int):
         try:
             reg:CmmCategories|None = CmmCategories.query.get(id)
@@ -187,6 +191,7 @@ class CategoryApi(Resource):
     @ns_cat.response(HTTPStatus.OK,"Atualiza os dados de uma categoria")
     @ns_cat.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -2,7 +2,7 @@ from auth import auth
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource,Namespace,fields
 from sqlalchemy import Delete, Select, asc, desc, exc
 from models.tenant import CmmProductsGridSizes, CmmTranslateSizes
@@ -83,8 +83,7 @@ class GridList(Resource):
             #     rquery = rquery.where(CmmProductsGrid.default==filter_default)
 
             if not list_all:
-                pag    = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag    = _paginate(rquery,page=pag_num,per_page=pag_size)
                 return {
                     "pagination":{
                         "registers": pag.total,
@@ -98,7 +97,7 @@ class GridList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    }for m in db.session.execute(rquery)]
+                    }for m in pag.items]
                 }
             else:
                 return [{
@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from models.tenant import CmmProductsModels
 from sqlalchemy import Select, exc, desc, asc
 from flask_restx import Resource, Namespace, fields
@@ -43,6 +44,7 @@ class ModelList(Resource):
     @ns_model.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_model.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("product-models")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -67,8 +69,7 @@ class ModelList(Resource):
                 rquery = rquery.where(CmmProductsModels.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -84,7 +85,7 @@ class ModelList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -106,6 +107,7 @@ class ModelList(Resource):
     @ns_model.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo modelo de produto!")
     @ns_model.doc(body=model_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -125,6 +127,7 @@ class ModelList(Resource):
     @ns_model.response(HTTPStatus.OK,"Exclui os dados de um modelo de produto")
     @ns_model.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -145,6 +148,7 @@ class ModelApi(Resource):
     @ns_model.response(HTTPStatus.OK,"Obtem um registro de um modelo de produto",model_model)
     @ns_model.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("product-models")
     def get(self,id:int):
         try:
             reg:CmmProductsModels|None = CmmProductsModels.query.get(id)
@@ -173,6 +177,7 @@ class ModelApi(Resource):
     @ns_model.response(HTTPStatus.OK,"Atualiza os dados de um modelo de produto")
     @ns_model.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
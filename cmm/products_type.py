@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from models.tenant import CmmProductsTypes
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource, Namespace, fields
@@ -43,6 +44,7 @@ class TypeList(Resource):
     @ns_type.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_type.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("product-types")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -67,8 +69,7 @@ class TypeList(Resource):
                 rquery = rquery.where(CmmProductsTypes.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -84,7 +85,7 @@ class TypeList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -106,6 +107,7 @@ class TypeList(Resource):
     @ns_type.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo tipo de produto!")
     @ns_type.doc(body=type_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -124,6 +126,7 @@ class TypeList(Resource):
     @ns_type.response(HTTPStatus.OK,"Exclui os dados de um tipo de produto")
     @ns_type.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -144,6 +147,7 @@ class TypeApi(Resource):
     @ns_type.response(HTTPStatus.OK,"Obtem um registro de um tipo de produto",type_model)
     @ns_type.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("product-types")
     def get(self,id:int):
         try:
             reg:CmmProductsTypes|None = CmmProductsTypes.query.get(id)
@@ -172,6 +176,7 @@ class TypeApi(Resource):
     @ns_type.response(HTTPStatus.OK,"Atualiza os dados de um tipo de produto")
     @ns_type.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
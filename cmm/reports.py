@@ -1,13 +1,14 @@
-import os
-import base64
 import decimal
 import datetime
 from auth import auth
 from os import environ
-from flask import request
+from functools import partial
 from http import HTTPStatus
+from types import SimpleNamespace
+from flask import request, send_file
 from models.tenant import CmmReport
-from models.helpers import _get_params, db
+from report_queue import ReportQueue, ReportQueueFull
+from models.helpers import _get_params, _get_tenant, _paginate, db, EngineRegistry
 from flask_restx import Resource, Namespace
 from common import _format_action, _gen_report
 from sqlalchemy import Select, text, desc, exc, asc, or_
@@ -56,8 +57,7 @@ class ReportsApi(Resource):
                 )
                             
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 return {
                     "pagination":{
                         "registers": pag.total,
@@ -70,7 +70,7 @@ class ReportsApi(Resource):
                         "id": r.id,
                         "name": r.name,
                         "filters": str(r.filters).split(","),
-                    }for r in db.session.execute(rquery)]
+                    }for r in pag.items]
                 }
             else:    
                 return [{
@@ -87,7 +87,8 @@ class ReportsApi(Resource):
 
 
 
-    @ns_report.response(HTTPStatus.OK,"Monta um relatório existente no sistema")
+    @ns_report.response(HTTPStatus.ACCEPTED,"Enfileira a geração de um relatório e retorna o id do job")
+    @ns_report.response(HTTPStatus.SERVICE_UNAVAILABLE,"Limite de relatórios em geração atingido")
     @ns_report.response(HTTPStatus.BAD_REQUEST,"Falha ao montar o relatório!")
     @auth.login_required
     def post(self):
@@ -108,6 +109,13 @@ class ReportsApi(Resource):
             date_end      = None
 
             report:CmmReport|None = CmmReport.query.get(req["report"])
+            if report is None:
+                return {
+                    "error_code": HTTPStatus.BAD_REQUEST.value,
+                    "error_details": "Registro não encontrado!",
+                    "error_sql": ""
+                }, HTTPStatus.BAD_REQUEST
+
             for param in req["params"]:
                 if "id_cities" in param and len(param["id_cities"]) > 0:
                     cities = param["id_cities"]
@@ -166,120 +174,184 @@ class ReportsApi(Resource):
                 mwhere = ""
             mqry += " "+mwhere # type: ignore
 
-            body = []
-            mstr = ""
-            for data_master in db.session.execute(text(mqry)): # type: ignore
-                row = []
-                i = 0
-                for field_master in str(report.master_fields).split(","): # type: ignore
-                    master_type = type(data_master[i])
-                    if master_type is datetime.date:
-                        row.append("\""+field_master+"\" : \""+data_master[i].strftime("%d/%m/%Y")+"\"")
-                    elif master_type is int:
-                        row.append("\""+field_master+"\" : \""+str(data_master[i])+"\"")
-                    elif master_type is float:
-                        row.append("\""+field_master+"\" : \""+str(data_master[i])+"\"")
-                    elif master_type is decimal.Decimal:
-                        row.append("\""+field_master+"\" : \""+str(data_master[i]).replace(".",",")+"\"")
-                    else:
-                        row.append("\""+field_master+"\" : \""+("" if data_master[i] is None else data_master[i])+"\"")
-
-                    if report is not None and report.child_query is not None:
-                        if field_master=="id":
-                            crow = self.__mount_child(report,data_master[i])
-                            row.append("\"child\" : ["+",".join(crow)+"]")
-
-                    i += 1
-                mstr = "{"+",".join(row)+"}"
-                nrow = eval(mstr)
-                body.append(nrow)
-
-            if not _gen_report(
-                ("" if report is None else report.file_model), # type: ignore
-                {
-                    "title": "" if report is None else report.title,
-                    "body": body,
-                    "footer": ""
-                }
-            ):
-                return False
-            
-            with open(str(environ.get("F2B_APP_PATH"))+'assets/pdf/'+str(report.file_model if report is not None else "").replace(".html","")+".pdf","rb") as pdf:
-                content = base64.b64encode(pdf.read()).decode("utf-8")
-                pdf.close()
-                return {
-                    "name": str(report.file_model if report is not None else "").replace(".html","")+".pdf",
-                    "type": "application/pdf",
-                    "size": os.path.getsize(str(environ.get("F2B_APP_PATH"))+"assets/pdf/"+str(report.file_model if report is not None else "").replace(".html","")+".pdf"),
-                    "content": content,
-                }
+            # copia o necessario do relatorio, o job roda fora da sessao da requisicao
+            definition = SimpleNamespace(
+                title        = report.title,
+                file_model   = report.file_model,
+                master_fields= report.master_fields,
+                child_query  = report.child_query,
+                child_where  = report.child_where,
+                child_fileds = report.child_fileds,
+                last_query   = report.last_query,
+                last_where   = report.last_where,
+                last_fileds  = report.last_fileds
+            )
+            tenant = _get_tenant()
+            job = ReportQueue.submit(tenant,str(report.file_model).replace(".html","")+".pdf",
+                                     partial(_render_report,tenant,definition,mqry))
+            return {
+                "id": job["id"],
+                "name": job["name"],
+                "status": job["status"]
+            }, HTTPStatus.ACCEPTED
+        except ReportQueueFull as e:
+            return {
+                "error_code": HTTPStatus.SERVICE_UNAVAILABLE.value,
+                "error_details": str(e),
+                "error_sql": ""
+            }, HTTPStatus.SERVICE_UNAVAILABLE
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
                 "error_details": e._message(),
                 "error_sql": e._sql_message()
             }
-        
-    def __mount_child(self,report:CmmReport,id:int):
-        cqry = report.child_query+" "+str(report.child_where).replace("%1",str(id))
-        crow = []
-        for data_child in db.session.execute(text(cqry)): # type: ignore
-            cdata = []
-            c = 0
-            for field_child in str(report.child_fileds).split(","):
-                child_type = type(data_child[c])
-                if child_type is datetime.date:
-                    cdata.append("\""+field_child+"\" : \""+data_child[c].strftime("%d/%m/%Y")+"\"")
-                elif child_type is datetime.datetime:
-                    cdata.append("\""+field_child+"\" : \""+data_child[c].strftime("%d/%m/%Y %H:%M")+"\"")
-                elif child_type is int:
-                    cdata.append("\""+field_child+"\" : \""+str(data_child[c])+"\"")
-                elif child_type is float:
-                    cdata.append("\""+field_child+"\" : \""+str(data_child[c])+"\"")
-                elif child_type is decimal.Decimal:
-                    cdata.append("\""+field_child+"\" : \""+str(data_child[c]).replace(".",",")+"\"")
-                else:
-                    if field_child=="action":
-                        cdata.append("\""+field_child+"\" : \""+_format_action(data_child[c])+"\"")
-                    else:
-                        cdata.append("\""+field_child+"\" : \""+("" if data_child[c] is None else data_child[c])+"\"")
-
-                if report.last_query is not None:
-                        if field_child=="id":
-                            lrow = self.__mount_last(report,data_child[c])
-                            cdata.append("\"last\" : ["+",".join(lrow)+"]")
-        
-                c += 1
-            crow.append("{"+",".join(cdata)+"}")
-        return crow
-    
-    def __mount_last(self,report:CmmReport,id:int):
-        lqry = report.last_query+" "+str(report.last_where).replace("%1",str(id))
-        lrow = []
-        for data_last in db.session.execute(text(lqry)): # type: ignore
-            ldata = []
-            line = 0
-            for field_last in str(report.last_fileds).split(","):
-                last_type = type(data_last[line])
-                if last_type is datetime.date:
-                    ldata.append("\""+field_last+"\" : \""+data_last[line].strftime("%d/%m/%Y")+"\"")
-                elif last_type is datetime.datetime:
-                    ldata.append("\""+field_last+"\" : \""+data_last[line].strftime("%d/%m/%Y %H:%M")+"\"")
-                elif last_type is int:
-                    ldata.append("\""+field_last+"\" : \""+str(data_last[line])+"\"")
-                elif last_type is float:
-                    ldata.append("\""+field_last+"\" : \""+str(data_last[line])+"\"")
-                elif last_type is decimal.Decimal:
-                    ldata.append("\""+field_last+"\" : \""+str(data_last[line]).replace(".",",")+"\"")
-                else:
-                    if field_last=="action":
-                        ldata.append("\""+field_last+"\" : \""+_format_action(data_last[line])+"\"")
-                    else:
-                        ldata.append("\""+field_last+"\" : \""+("" if data_last[line] is None else data_last[line])+"\"")
-        
-                line += 1
-            lrow.append("{"+",".join(ldata)+"}")
-        return lrow
+
+def _render_report(tenant:str,report,mqry:str,output:str) -> bool:
+    """ Monta os dados e gera o PDF do relatorio (executado no pool da ReportQueue) """
+    with EngineRegistry.get_engine(tenant).connect() as conn:
+        # as consultas do relatorio sao texto, o schema precisa estar no search_path
+        # (o SET LOCAL vale apenas para esta transacao)
+        conn.execute(text('set local search_path to "'+tenant+'"'))
+        body = _mount_report(conn,report,mqry)
+        conn.rollback()
+    return _gen_report(
+        str(report.file_model),
+        {
+            "title": report.title,
+            "body": body,
+            "footer": ""
+        },
+        output
+    )
+
+def _format_date(value) -> str:
+    return value.strftime("%d/%m/%Y")
+
+def _format_datetime(value) -> str:
+    return value.strftime("%d/%m/%Y %H:%M")
+
+def _format_decimal(value) -> str:
+    return str(value).replace(".",",")
+
+def _pick_formatter(field:str,value):
+    """ Formatador da coluna escolhido pelo tipo do primeiro valor nao nulo """
+    if field=="action":
+        return _format_action
+    # datetime eh subclasse de date, por isso vem antes
+    if isinstance(value,datetime.datetime):
+        return _format_datetime
+    if isinstance(value,datetime.date):
+        return _format_date
+    if isinstance(value,decimal.Decimal):
+        return _format_decimal
+    return str
+
+
+class _RowSerializer():
+    """ Converte as linhas de um nivel do relatorio em dicts com os valores formatados """
+
+    def __init__(self,fields:str|None,offset:int = 0) -> None:
+        self.fields = str(fields).split(",")
+        # colunas iniciais que nao sao campos do relatorio (ex.: id do pai)
+        self.offset = offset
+        self.formatters:list = [None for _ in self.fields]
+        self.id_pos = self.fields.index("id") if "id" in self.fields else None
+
+    def row(self,data) -> dict:
+        result = {}
+        for i,field in enumerate(self.fields):
+            value = data[i+self.offset]
+            if value is None:
+                result[field] = ""
+                continue
+            if self.formatters[i] is None:
+                self.formatters[i] = _pick_formatter(field,value)
+            result[field] = self.formatters[i](value)
+        return result
+
+    def id(self,data):
+        return None if self.id_pos is None else data[self.id_pos+self.offset]
+
+
+def _fetch_children(conn,query:str,where:str,fields:str,ids:list) -> tuple[dict,list]:
+    """ Executa o nivel filho para todos os pais de uma vez
+
+        O where cadastrado referencia o pai com %1, por isso a consulta do nivel eh
+        aplicada via LATERAL sobre a lista de ids, mantendo a ordenacao do cadastro.
+        Retorna {id_pai: [(linha, dict)]} e o serializer usado """
+    serializer = _RowSerializer(fields,offset=1)
+    children:dict = {}
+    if len(ids)==0:
+        return children,serializer
+    qry = "select f2b_parent.id,f2b_child.* from unnest(:ids) as f2b_parent(id) "\
+          "cross join lateral ("+query+" "+str(where).replace("%1","f2b_parent.id")+") as f2b_child"
+    for data in conn.execute(text(qry),{"ids": ids}):
+        children.setdefault(data[0],[]).append((data,serializer.row(data)))
+    return children,serializer
+
+def _mount_report(conn,report,mqry:str) -> list[dict]:
+    """ Monta as linhas do relatorio com no maximo tres consultas (master, child e last) """
+    master = _RowSerializer(report.master_fields)
+    rows = [(data,master.row(data)) for data in conn.execute(text(mqry))]
+
+    if report.child_query is None or master.id_pos is None:
+        return [r for _,r in rows]
+
+    parent_ids = list(dict.fromkeys(master.id(data) for data,_ in rows))
+    children,child = _fetch_children(conn,report.child_query,report.child_where,report.child_fileds,parent_ids)
+
+    if report.last_query is not None and child.id_pos is not None:
+        child_ids = list(dict.fromkeys(child.id(data) for items in children.values() for data,_ in items))
+        lasts,_ = _fetch_children(conn,report.last_query,report.last_where,report.last_fileds,child_ids)
+        for items in children.values():
+            for data,crow in items:
+                crow["last"] = [lrow for _,lrow in lasts.get(child.id(data),[])]
+
+    body = []
+    for data,row in rows:
+        # os mesmos filhos podem pertencer a mais de um pai com o mesmo id
+        row["child"] = [dict(crow) for _,crow in children.get(master.id(data),[])]
+        body.append(row)
+    return body
+
+@ns_report.route("/jobs/<string:job>")
+class ReportJobApi(Resource):
+    @ns_report.response(HTTPStatus.OK.value,"Situação da geração de um relatório")
+    @ns_report.response(HTTPStatus.NOT_FOUND.value,"Relatório não encontrado ou expirado!")
+    @auth.login_required
+    def get(self,job:str):
+        meta = ReportQueue.status(_get_tenant(),job)
+        if meta is None:
+            return {
+                "error_code": HTTPStatus.NOT_FOUND.value,
+                "error_details": "Relatório não encontrado ou expirado!",
+                "error_sql": ""
+            }, HTTPStatus.NOT_FOUND
+        return {
+            "id": meta["id"],
+            "name": meta["name"],
+            "status": meta["status"],
+            "size": meta["size"],
+            "error": meta["error"]
+        }
+
+@ns_report.route("/jobs/<string:job>/download")
+class ReportJobDownloadApi(Resource):
+    @ns_report.response(HTTPStatus.OK.value,"Baixa o PDF de um relatório gerado")
+    @ns_report.response(HTTPStatus.NOT_FOUND.value,"Relatório não encontrado, expirado ou ainda em geração!")
+    @auth.login_required
+    def get(self,job:str):
+        meta = ReportQueue.status(_get_tenant(),job)
+        if meta is None or meta["status"]!="done":
+            return {
+                "error_code": HTTPStatus.NOT_FOUND.value,
+                "error_details": "Relatório não encontrado, expirado ou ainda em geração!",
+                "error_sql": ""
+            }, HTTPStatus.NOT_FOUND
+        # envia o arquivo em partes direto do disco (sem base64 em memoria)
+        return send_file(ReportQueue.file_path(job),mimetype="application/pdf",
+                         as_attachment=True,download_name=meta["name"],conditional=True)
 
 @ns_report.route("/<int:id>")
 class ReporApi(Resource):
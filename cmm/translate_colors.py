@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, desc, asc
 from flask_restx import Resource, Namespace, fields
 from models.tenant import B2bProductStock, CmmTranslateColors
@@ -45,6 +46,7 @@ class ColorsList(Resource):
     @ns_color.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_color.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("colors")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -79,8 +81,7 @@ class ColorsList(Resource):
                 rquery = rquery.where(CmmTranslateColors.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
                     "pagination":{
                         "registers": pag.total,
@@ -96,7 +97,7 @@ class ColorsList(Resource):
                         "color": m.color,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -119,6 +120,7 @@ class ColorsList(Resource):
     @ns_color.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo modelo de produto!")
     @ns_color.doc(body=color_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -139,6 +141,7 @@ class ColorsList(Resource):
     @ns_color.response(HTTPStatus.OK,"Exclui os dados de uma nova tradução de tamanho")
     @ns_color.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -160,6 +163,7 @@ class ColorsApi(Resource):
     @ns_color.response(HTTPStatus.OK,"Obtem um registro de uma nova tradução de cor",color_model)
     @ns_color.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("colors")
     def get(self,id:int):
         try:
             reg:CmmTranslateColors|None = CmmTranslateColors.query.get(id)
@@ -190,6 +194,7 @@ class ColorsApi(Resource):
     @ns_color.response(HTTPStatus.OK,"Atualiza os dados de uma nova tradução de cor")
     @ns_color.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             reg = request.get_json()
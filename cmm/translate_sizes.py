@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from models.tenant import CmmTranslateSizes
 from sqlalchemy import Select, exc, desc, asc
 from flask_restx import Resource, Namespace, fields
@@ -47,6 +48,7 @@ class SizeList(Resource):
     @ns_size.param("order_by","Campo de ordenacao","query")
     @ns_size.param("order_dir","Direção da ordenação","query",enum=['ASC','DESC'])
     @auth.login_required
+    @RefCache.cached("sizes")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -75,8 +77,7 @@ class SizeList(Resource):
             # _show_query(rquery)
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
                     "pagination":{
                         "registers": pag.total,
@@ -92,7 +93,7 @@ class SizeList(Resource):
                         "name":m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -115,6 +116,7 @@ class SizeList(Resource):
     @ns_size.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo modelo de produto!")
     @ns_size.doc(body=size_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -137,6 +139,7 @@ class SizeList(Resource):
     @ns_size.response(HTTPStatus.OK,"Exclui os dados de uma nova tradução de tamanho")
     @ns_size.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -157,6 +160,7 @@ class SizeApi(Resource):
     @ns_size.response(HTTPStatus.OK,"Obtem um registro de uma nova tradução de tamanho",size_model)
     @ns_size.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("sizes")
     def get(self,id:int):
         try:
             reg:CmmTranslateSizes|None = CmmTranslateSizes.query.get(id)
@@ -187,6 +191,7 @@ class SizeApi(Resource):
     @ns_size.response(HTTPStatus.OK,"Atualiza os dados de uma nova tradução de tamanho")
     @ns_size.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required      
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -2,6 +2,7 @@ import os
 import filetype
 import importlib
 from auth import auth
+from ref_cache import RefCache
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
@@ -224,6 +225,8 @@ class UploadProduct(Resource):
                 db.session.commit()
                 i += 1
 
+            # imagens nao tem datas, a versao do tenant invalida o ETag do produto
+            RefCache.bump()
             return files
         except exceptions.HTTPException as e:
             print(e)
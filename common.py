@@ -1,24 +1,30 @@
 import os
+import time
+import uuid
 import jinja2
 import pdfkit
 import logging
-import requests
 from os import environ
 from flask import request
-from http import HTTPStatus
-from random import seed,randint
-from models.public import SysUsers, SysConfig
+from threading import Lock
+from typing import TypedDict
+from models.public import SysConfig
 from models.helpers import Database, db
+from mail_queue import MailQueue
+from auth import get_token_claims
 from f2bconfig import EntityAction, MailTemplates, DashboardImage, DashboardImageColor
 from sqlalchemy import Select
 
 def _before_execute(check:bool = False):
+    # evita que o schema da requisicao anterior da mesma thread seja reaproveitado,
+    # nos dois modos as URLs publicas e as requisicoes sem token ficam no public
+    Database('public').switch_schema()
     # apenas no common serah verificada a existencia do auth
     if not check:
         if "Authorization" in request.headers:
             tkn = request.headers["Authorization"].replace("Bearer ","")
             if tkn is not None:
-                token = SysUsers.extract_token(tkn) if tkn else None
+                token = get_token_claims(tkn)
                 tenant = Database(str('public' if token is None else token["profile"]))
                 tenant.switch_schema()
     else:
@@ -32,12 +38,12 @@ def _before_execute(check:bool = False):
             if "Authorization" in request.headers:
                 tkn = request.headers["Authorization"].replace("Bearer ","")
                 if tkn is not None:
-                    token = SysUsers.extract_token(tkn) if tkn else None
+                    token = get_token_claims(tkn)
                     tenant = Database(str('' if token is None else token["profile"]))
                     tenant.switch_schema()
 
 def _extract_token(tkn):
-    return SysUsers.extract_token(tkn)
+    return get_token_claims(tkn)
 
 def _get_dashboard_config(_config:str):
     if _config=="M":
@@ -54,10 +60,152 @@ def _get_dashboard_config(_config:str):
         return (DashboardImage.PISTON.value, DashboardImageColor.PISTON.value)
     return (DashboardImage.PHARMA.value, DashboardImageColor.PHARMA.value)
 
-def _gen_report(fileName:str,_content:dict):
+# tempo (segundos) que a configuracao de um tenant fica em memoria sem ser relida do BD
+CONFIG_CACHE_TTL = int(str(environ.get("F2B_CONFIG_CACHE_TTL","300")))
+
+class TenantConfig(TypedDict):
+    id_customer: str
+    pagination_size: int
+    email_brevo_api_key: str|None
+    email_from_name: str
+    email_from_value: str
+    flimv_model: str
+    dashboard_config: str
+    dashboard_image: str|None
+    dashboard_color: str|None
+    ai_model: str
+    ai_api_key: str
+    company_custom: bool
+    company_name: str
+    company_logo: str|None
+    url_instagram: str|None
+    url_facebook: str|None
+    url_linkedin: str|None
+    max_upload_files: int
+    max_upload_images: int
+    use_url_images: bool
+    track_orders: bool
+    erp_integration: bool
+    erp_url: str|None
+    erp_token: str|None
+    erp_grant_type: str|None
+    erp_client_id: str|None
+    erp_client_secret: str|None
+    erp_username: str|None
+    erp_password: str|None
+
+_config_cache:dict = {}
+_config_lock = Lock()
+
+def _to_tenant_config(cfg:SysConfig) -> TenantConfig:
+    dash_image, dash_color = _get_dashboard_config(str(cfg.dashboard_config))
+    return {
+        "id_customer": str(cfg.id_customer),
+        "pagination_size": cfg.pagination_size,
+        "email_brevo_api_key": cfg.email_brevo_api_key,
+        "email_from_name": cfg.email_from_name,
+        "email_from_value": cfg.email_from_value,
+        "flimv_model": cfg.flimv_model,
+        "dashboard_config": cfg.dashboard_config,
+        "dashboard_image": dash_image,
+        "dashboard_color": dash_color,
+        "ai_model": cfg.ai_model,
+        "ai_api_key": cfg.ai_api_key,
+        "company_custom": cfg.company_custom,
+        "company_name": cfg.company_name,
+        "company_logo": cfg.company_logo,
+        "url_instagram": cfg.url_instagram,
+        "url_facebook": cfg.url_facebook,
+        "url_linkedin": cfg.url_linkedin,
+        "max_upload_files": cfg.max_upload_files,
+        "max_upload_images": cfg.max_upload_images,
+        "use_url_images": cfg.use_url_images,
+        "track_orders": cfg.track_orders,
+        "erp_integration": cfg.erp_integration,
+        "erp_url": cfg.erp_url,
+        "erp_token": cfg.erp_token,
+        "erp_grant_type": cfg.erp_grant_type,
+        "erp_client_id": cfg.erp_client_id,
+        "erp_client_secret": cfg.erp_client_secret,
+        "erp_username": cfg.erp_username,
+        "erp_password": cfg.erp_password
+    } # type: ignore
+
+def _get_tenant_config(id_customer:str|None) -> TenantConfig|None:
+    """ Configuracao do tenant lida do cache em memoria, vai ao BD apenas na primeira
+        leitura, apos o TTL ou apos _invalidate_tenant_config. Retorna None se nao existir """
+    if id_customer is None:
+        return None
+    key = str(id_customer)
+    now = time.monotonic()
+    with _config_lock:
+        entry = _config_cache.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+    cfg = db.session.execute(Select(SysConfig).where(SysConfig.id_customer==key)).scalar()
+    if cfg is None:
+        return None
+    config = _to_tenant_config(cfg)
+    with _config_lock:
+        _config_cache[key] = (config,now + CONFIG_CACHE_TTL)
+    return config
+
+def _invalidate_tenant_config(id_customer:str|None = None) -> None:
+    """ Remove a configuracao de um tenant (ou de todos) do cache, usar apos gravar SysConfig """
+    with _config_lock:
+        if id_customer is None:
+            _config_cache.clear()
+        else:
+            _config_cache.pop(str(id_customer),None)
+
+# templates de relatorios e e-mails
+TEMPLATE_PATH    = str(environ.get("F2B_APP_PATH"))+'assets/layout/'
+# bytecode compilado dos templates, reaproveitado entre processos e reinicios
+TEMPLATE_CACHE   = str(environ.get("F2B_APP_PATH"))+'assets/cache/jinja/'
+# em debug o template eh relido quando o arquivo muda, em producao fica compilado em memoria
+TEMPLATE_RELOAD  = str(environ.get("F2B_DEBUG","0"))=="1"
+# templates usados em rajadas (relatorios e e-mails), compilados no start da aplicacao
+TEMPLATE_PREWARM = ["pdf_f2b_header.html","pdf_f2b_footer.html",MailTemplates.DEFAULT.value,MailTemplates.PWD_RECOVERY.value]
+
+_templates:jinja2.Environment|None = None
+_templates_lock = Lock()
+
+def _get_templates() -> jinja2.Environment:
+    """ Environment unico do processo, os templates sao compilados uma vez e ficam em cache """
+    global _templates
+    if _templates is not None:
+        return _templates
+    with _templates_lock:
+        if _templates is None:
+            bytecode = None
+            try:
+                os.makedirs(TEMPLATE_CACHE,exist_ok=True)
+                bytecode = jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE)
+            except OSError as e:
+                logging.warning("Cache de templates desativado: "+str(e))
+            _templates = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(searchpath=TEMPLATE_PATH),
+                bytecode_cache=bytecode,
+                auto_reload=TEMPLATE_RELOAD,
+                cache_size=400
+            )
+    return _templates
+
+def _prewarm_templates() -> None:
+    """ Compila os templates mais usados antes da primeira requisicao """
+    env = _get_templates()
+    for name in TEMPLATE_PREWARM:
+        try:
+            env.get_template(name)
+        except jinja2.TemplateError as e:
+            logging.warning("Falha ao compilar o template "+name+": "+str(e))
+
+def _gen_report(fileName:str,_content:dict,output:str|None = None):
+    """ Gera o PDF do template em output (padrao assets/pdf/<template>.pdf) """
+    header_temp = footer_temp = None
     try:
-        tplLoader  = jinja2.FileSystemLoader(searchpath=str(environ.get("F2B_APP_PATH"))+'assets/layout/')
-        tplEnv     = jinja2.Environment(loader=tplLoader)
+        tplEnv     = _get_templates()
 
         # se nao existir a pasta de pdfs vai criar
         fpath = str(os.environ.get("F2B_APP_PATH"))+'assets/pdf/'
@@ -79,8 +227,8 @@ def _gen_report(fileName:str,_content:dict):
         #-----------------------------------------------------#
         #conteudo do header padrao
         header_txt = headerReport.render(title=_content["title"])
-        seed(1)
-        report_id = randint(0,100000)
+        # nome unico por geracao, relatorios simultaneos nao podem compartilhar header/footer
+        report_id = uuid.uuid4().hex
 
         header_temp = str(environ.get("F2B_APP_PATH"))+'assets/layout/pdf_header_tmp_'+str(report_id)+'.html'
         footer_temp = str(environ.get("F2B_APP_PATH"))+'assets/layout/pdf_footer_tmp_'+str(report_id)+'.html'
@@ -107,7 +255,9 @@ def _gen_report(fileName:str,_content:dict):
 
         body_txt = bodyReport.render(body=_content["body"],regs=len(_content["body"]))
         
-        pdfkit.from_string(body_txt,str(environ.get("F2B_APP_PATH"))+'assets/pdf/'+fileName.replace(".html","")+'.pdf',options={
+        if output is None:
+            output = str(environ.get("F2B_APP_PATH"))+'assets/pdf/'+fileName.replace(".html","")+'.pdf'
+        pdfkit.from_string(body_txt,output,options={
             'encoding': "UTF-8",
             'disable-smart-shrinking':'',
             'header-spacing':3,
@@ -117,74 +267,56 @@ def _gen_report(fileName:str,_content:dict):
             'footer-html': footer_temp,
             "enable-local-file-access": ""
         })
-        
-        if os.path.exists(header_temp):
-            os.remove(header_temp)
-
-        if os.path.exists(footer_temp):
-            os.remove(footer_temp)
-
         return True
     except Exception as e:
         logging.error(e)
         return False
+    finally:
+        # remove os temporarios mesmo se o wkhtmltopdf falhar
+        for temp in (header_temp,footer_temp):
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+def _send_email(customer_id:str,p_to:list,p_cc:list,p_subject:str,p_content:str,p_tpl:MailTemplates,p_attach:list|None=None,p_url:str|None=None)->bool:
+    """ Monta o e-mail e coloca na fila de envio (MailQueue), o envio ocorre em segundo plano
+        com a chave da Brevo do tenant customer_id
 
-def _send_email(customer_id:str,p_to:list,p_cc:list,p_subject:str,p_content:str,p_tpl:MailTemplates,brevo_key:str,p_attach:list|None=None,)->bool:
+        p_url complementa o link do template de recuperacao de senha (padrao customer_id) """
     try:
-        tplLoader     = jinja2.FileSystemLoader(searchpath=str(environ.get("F2B_APP_PATH"))+'assets/layout/')
-        tplEnv        = jinja2.Environment(loader=tplLoader)
+        tplEnv        = _get_templates()
         layoutFile    = p_tpl.value
         mailTemplate  = tplEnv.get_template(layoutFile)
         mail_template = mailTemplate.render(
             content=p_content,
-            url=(str(environ.get("F2B_APP_URL"))) +('reset-password/'+customer_id if p_tpl==MailTemplates.PWD_RECOVERY else "")
+            url=(str(environ.get("F2B_APP_URL"))) +('reset-password/'+(customer_id if p_url is None else p_url) if p_tpl==MailTemplates.PWD_RECOVERY else "")
         )
 
-        user = db.session.execute(Select(SysConfig.email_from_name,SysConfig.email_from_value).where(SysConfig.id_customer==customer_id)).first()
-
         if p_attach is not None:
-            json_content= {
-                "sender": {
-                    "name": str(user.email_from_name),
-                    "email": str(user.email_from_value)
-                },
-                "to": [{
-                    "email": one_to.split()
-                }for one_to in p_to],
-                "cc": [{
-                    "email": str(one_cc).split()
-                }for one_cc in p_cc],
-                "htmlContent": mail_template,
-                "subject": p_subject,
-                "attachment": [
-                    {
-                        "content": att['content'],
-                        "name": att['filename']
-                    }for att in p_attach]
+            # o remetente do tenant vem do cache de configuracao
+            cfg = _get_tenant_config(customer_id)
+            sender = {
+                "name": str(None if cfg is None else cfg["email_from_name"]),
+                "email": str(None if cfg is None else cfg["email_from_value"])
             }
         else:
-            json_content= {
-                "sender": {
-                    "name": str(environ.get("F2B_EMAIL_FROM_NAME")),
-                    "email": str(environ.get("F2B_EMAIL_FROM_VALUE"))
-                },
-                "to": [{
-                    "email": one_to.split()
-                }for one_to in p_to],
-                "cc": [{
-                    "email": str(one_cc).split()
-                }for one_cc in p_cc],
-                "htmlContent": mail_template,
-                "subject": p_subject,
+            sender = {
+                "name": str(environ.get("F2B_EMAIL_FROM_NAME")),
+                "email": str(environ.get("F2B_EMAIL_FROM_VALUE"))
             }
-        resp = requests.post("https://api.brevo.com/v3/smtp/email",json=json_content,headers={
-            'accept':'application/json',
-            'content-type': 'application/json',
-            'api-key': brevo_key
-        })
-        if resp.status_code==HTTPStatus.OK.value:
-            return True
-        return False
+
+        MailQueue.enqueue(
+            customer_id,
+            sender,
+            p_to,
+            p_cc,
+            p_subject,
+            mail_template,
+            None if p_attach is None else [{
+                "content": att['content'],
+                "name": att['filename']
+            }for att in p_attach]
+        )
+        return True
     except Exception as e:
         logging.error(e)
         return False
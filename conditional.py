@@ -0,0 +1,99 @@
+import json
+import time
+from hashlib import sha1
+from functools import wraps
+from http import HTTPStatus
+from datetime import date
+from flask import request
+from models.helpers import _get_tenant
+from ref_cache import RefCache, REF_CACHE_TTL
+
+
+class ConditionalGet():
+    """ GET condicional (ETag) para os recursos do flask-restx
+
+        tables(*models): o ETag eh formado pelas versoes de gravacao das tabelas que
+        compoem a resposta e pela versao do tenant do RefCache, sem consultar o BD.
+        Cada commit da sessao do ORM incrementa a versao das tabelas gravadas (ver
+        ref_cache.py). Se o cliente jah tem a versao (If-None-Match) a resposta eh
+        304 sem consultar nem serializar os dados. Gravacoes fora da API (cron do ERP,
+        importacao) soh sao vistas com o backend redis; nos backends do proprio
+        processo o ETag tambem muda a cada F2B_REF_CACHE_TTL, o mesmo atraso do
+        cache de referencia. Com o RefCache desligado (F2B_REF_CACHE_BACKEND=none)
+        o GET segue sem validadores, e com mais de um no o backend precisa ser o redis.
+
+        content(): para respostas sem validador barato (dados externos, estoque
+        calculado), executa o GET e compara o hash do corpo, economizando apenas a
+        transferencia.
+
+        O ETag combina tenant, token, URL, query e o dia, entao cada usuario/filtro tem o seu """
+
+    @staticmethod
+    def __scope() -> list:
+        # a data entra porque varios GETs usam o ano/mes corrente quando o filtro vem vazio
+        return [_get_tenant(),sha1(str(request.headers.get("Authorization")).encode()).hexdigest(),
+                request.path,sorted(request.args.items(multi=True)),date.today()]
+
+    @staticmethod
+    def __etag(parts:list) -> str:
+        return sha1(json.dumps(parts,sort_keys=True,default=str).encode()).hexdigest()
+
+    @staticmethod
+    def __validators(tables:list) -> list:
+        row = [RefCache.version()]+RefCache.table_versions(tables)
+        if not getattr(RefCache.backend,"shared",False):
+            # gravacoes de outros processos nao incrementam o contador deste
+            row.append(int(time.time())//max(REF_CACHE_TTL,1))
+        return row
+
+    @staticmethod
+    def __headers(etag:str) -> dict:
+        # no-cache: o navegador guarda, mas sempre revalida antes de usar
+        return {"ETag": '"'+etag+'"', "Cache-Control": "private, no-cache"}
+
+    @staticmethod
+    def __not_modified(etag:str) -> bool:
+        return bool(request.if_none_match) and request.if_none_match.contains(etag)
+
+    @staticmethod
+    def __is_error(result) -> bool:
+        # erros (dict com error_code ou tupla com status) seguem sem validadores
+        return result is None or isinstance(result,tuple) or (isinstance(result,dict) and "error_code" in result)
+
+    @classmethod
+    def tables(cls,*models):
+        """ Decorator do GET validado pelas versoes das tabelas informadas """
+        tables = [m.__table__.name for m in models]
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args,**kwargs):
+                if RefCache.backend is None:
+                    # sem as versoes as gravacoes passariam despercebidas
+                    return func(*args,**kwargs)
+                etag = cls.__etag(cls.__scope()+cls.__validators(tables))
+                headers = cls.__headers(etag)
+                if cls.__not_modified(etag):
+                    return None, HTTPStatus.NOT_MODIFIED, headers
+                result = func(*args,**kwargs)
+                if cls.__is_error(result):
+                    return result
+                return result, HTTPStatus.OK, headers
+            return wrapper
+        return decorator
+
+    @classmethod
+    def content(cls):
+        """ Decorator do GET validado pelo hash do corpo da resposta """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args,**kwargs):
+                result = func(*args,**kwargs)
+                if cls.__is_error(result):
+                    return result
+                etag = cls.__etag(cls.__scope()+[result])
+                headers = cls.__headers(etag)
+                if cls.__not_modified(etag):
+                    return None, HTTPStatus.NOT_MODIFIED, headers
+                return result, HTTPStatus.OK, headers
+            return wrapper
+        return decorator
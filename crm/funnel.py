@@ -1,10 +1,11 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from models.tenant import CrmFunnel, CrmFunnelStage
 from flask_restx import Resource, fields, Namespace
-from models.helpers import _get_params, db #, _show_query
+from models.helpers import _get_params, _paginate, db #, _show_query
 from sqlalchemy import Update, desc, exc, and_, asc, Select
 
 ns_funil = Namespace("funnels",description="Operações para manipular funis de clientes")
@@ -56,6 +57,7 @@ class FunnelList(Resource):
     @ns_funil.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_funil.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("funnels")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -96,8 +98,7 @@ class FunnelList(Resource):
             # _show_query(rquery)
 
             if not list_all:
-                pag    = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag    = _paginate(rquery,page=pag_num,per_page=pag_size)
                 return {
                     "pagination":{
                         "registers": pag.total,
@@ -114,7 +115,7 @@ class FunnelList(Resource):
                         "stages": self.get_stages(m.id),
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 return [{
@@ -150,6 +151,7 @@ class FunnelList(Resource):
     @ns_funil.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo funil!")
     @ns_funil.doc(body=fun_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -185,6 +187,7 @@ class FunnelList(Resource):
     @ns_funil.response(HTTPStatus.OK,"Exclui os dados de um funil")
     @ns_funil.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool:
         try:
             req = request.get_json()
@@ -202,6 +205,7 @@ class FunnelApi(Resource):
     @ns_funil.response(HTTPStatus.OK,"Obtem um registro de um funil",fun_model)
     @ns_funil.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @auth.login_required
+    @RefCache.cached("funnels")
     def get(self,id:int):
         try:
             rquery = CrmFunnel.query.get(id)
@@ -244,6 +248,7 @@ class FunnelApi(Resource):
     @ns_funil.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado")
     @ns_funil.param("name","Nome do funil",required=True)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
@@ -1,8 +1,9 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource, Namespace
 from sqlalchemy import Select, Update, desc, exc, and_, asc, or_
 from models.tenant import CrmFunnelStageCustomer, CrmFunnelStage
@@ -63,8 +64,7 @@ class FunnelStagesApi(Resource):
                 rquery = rquery.where(CrmFunnel.type==CrmFunnelType.SALES.value)
 
             if list_all is False:
-                pag    = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag    = _paginate(rquery,page=pag_num,per_page=pag_size)
                 return {
                     "pagination":{
                         "registers": pag.total,
@@ -84,7 +84,7 @@ class FunnelStagesApi(Resource):
                         "order": m.order,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    }for m in db.session.execute(rquery)]
+                    }for m in pag.items]
                 }
             else:
                 return [{
@@ -107,6 +107,7 @@ class FunnelStagesApi(Resource):
             }
     
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -137,6 +138,7 @@ class FunnelStagesApi(Resource):
     @ns_fun_stg.response(HTTPStatus.OK,"Exclui um estágio de um funil")
     @ns_fun_stg.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool|dict:
         try:
             req = request.get_json()
@@ -251,6 +253,7 @@ class FunnelStageApi(Resource):
     @ns_fun_stg.param("name","Nome do estágio do funil",required=True)
     @ns_fun_stg.param("order","Ordem do estágio dentro do funil",type=int,required=True)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
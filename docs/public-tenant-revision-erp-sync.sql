@@ -0,0 +1,35 @@
+-- tabelas publicas do controle de migracoes dos tenants (tenant_migrate.py) e
+-- dos watermarks da sincronizacao com o ERP (integrations/erp/erp.py)
+
+CREATE TABLE IF NOT EXISTS public.sys_tenant_revision (
+	id_customer uuid NOT NULL,
+	revision varchar(32) NULL,
+	status char(1) NOT NULL DEFAULT 'O',
+	error varchar(1000) NULL,
+	duration numeric(10,3) NULL,
+	date_updated timestamp NULL,
+	CONSTRAINT sys_tenant_revision_pkey PRIMARY KEY (id_customer),
+	CONSTRAINT sys_tenant_revision_id_customer_fkey FOREIGN KEY (id_customer) REFERENCES public.sys_customer(id)
+);
+COMMENT ON COLUMN public.sys_tenant_revision.id_customer IS 'Id da tabela SysCustomer (nome do schema do tenant)';
+COMMENT ON COLUMN public.sys_tenant_revision.revision IS 'Ultima revisao das migracoes de tenant aplicada no schema';
+COMMENT ON COLUMN public.sys_tenant_revision.status IS 'O = OK, F = Falha na ultima migracao';
+COMMENT ON COLUMN public.sys_tenant_revision.error IS 'Erro da ultima migracao com falha';
+COMMENT ON COLUMN public.sys_tenant_revision.duration IS 'Segundos gastos na ultima migracao';
+
+CREATE TABLE IF NOT EXISTS public.sys_erp_sync (
+	id serial NOT NULL,
+	id_customer uuid NOT NULL,
+	entity varchar(50) NOT NULL,
+	watermark varchar(100) NULL,
+	records int4 NOT NULL DEFAULT 0,
+	last_sync timestamp NULL,
+	CONSTRAINT sys_erp_sync_pkey PRIMARY KEY (id),
+	CONSTRAINT sys_erp_sync_id_customer_fkey FOREIGN KEY (id_customer) REFERENCES public.sys_customer(id)
+);
+CREATE INDEX IF NOT EXISTS ix_public_sys_erp_sync_id_customer ON public.sys_erp_sync (id_customer);
+CREATE UNIQUE INDEX IF NOT EXISTS "IDX_ERP_SYNC" ON public.sys_erp_sync (id_customer,entity);
+COMMENT ON COLUMN public.sys_erp_sync.id_customer IS 'Id da tabela SysCustomer';
+COMMENT ON COLUMN public.sys_erp_sync.entity IS 'Entidade sincronizada (products, customers, representatives...)';
+COMMENT ON COLUMN public.sys_erp_sync.watermark IS 'Data/hora ou cursor da ultima alteracao jah importada do ERP';
+COMMENT ON COLUMN public.sys_erp_sync.records IS 'Registros aplicados na ultima sincronizacao';
@@ -3,26 +3,23 @@ from datetime import datetime
 from dotenv import load_dotenv
 from sqlalchemy.engine import Engine
 from f2bconfig import LegalEntityType, OrderStatus,FlimvModel
-from models.tenant import CmmProducts, CmmProductsGridDistribution
+from models.tenant import CmmProducts
 from models.tenant import B2bCollection, B2bOrdersProducts, CmmLegalEntities 
 from models.tenant import FprDevolution, FprDevolutionItem, B2bOrders, ScmFlimvResult
-from sqlalchemy import Insert, Select, Update, and_, create_engine, distinct, func, tuple_
+from models.helpers import EngineRegistry
+from sqlalchemy import Insert, Select, Update, and_, bindparam, distinct, func
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
 
 class Flimv():
     dbconn:Engine
-    internal_flimv = []
+    internal_flimv:dict
 
     def __init__(self,_schema:str) -> None:
-        conn = str(environ.get("F2B_DB_LIB"))+"://"
-        conn += str(environ.get("F2B_DB_USER"))+":"
-        conn += str(environ.get("F2B_DB_PASS"))+"@"
-        conn += str(environ.get("F2B_DB_HOST"))+"/"
-        conn += str(environ.get("F2B_DB_NAME"))
-        conn += "?options=-c%20search_path="+_schema
-        self.dbconn = create_engine(conn)
+        self.dbconn = EngineRegistry.get_engine(_schema)
+        # resultados indexados por (id_customer,id_collection)
+        self.internal_flimv = {}
         super().__init__()
 
     def process(self) -> None:
@@ -32,116 +29,93 @@ class Flimv():
             self.__make_data_continuos()
         self.__save_flimv()
 
+    def __by_customer_collection(self,conn,query) -> dict:
+        # executa uma agregacao agrupada por cliente/colecao e indexa o resultado
+        return {(r.id_customer,r.id_collection):r.total for r in conn.execute(query)}
+
     def __make_data_seasonal(self) -> None:
         with self.dbconn.connect() as conn:
-            # realiza a busca de todas as colecoes existentes
-            for collection in conn.execute(Select(B2bCollection.id).where(B2bCollection.trash.is_(False))):
-
-                # utilizado para calcular o volume do mix comprado
-                total_mix = conn.execute(
-                    Select(func.count(CmmProducts.id).label("total")).where(and_(CmmProducts.id_collection==collection.id,CmmProducts.trash.is_(False)))
-                ).first()
-                total_mix = total_mix.total if total_mix is not None else 0
-
-                # busca todos os clientes existentes
-                for cst in conn.execute(Select(CmmLegalEntities.id).where(CmmLegalEntities.type==LegalEntityType.CUSTOMER.value)):
-                    
-                    ###############################################################
-                    #                           FREQUENCY                         #
-                    ###############################################################
-                    # para o cliente existente, verifica se comprou na colecao (o pedido tem que estar como finalizado)
-                    # monta o indicador frequency
-                    customer_in_collection = conn.execute(Select(func.count(B2bOrders.id_customer).label("total")).where(
-                        B2bOrders.id.in_(
-                            Select(B2bOrdersProducts.id_order)\
-                            .join(CmmProducts,CmmProducts.id==B2bOrdersProducts.id_product)\
-                            .join(B2bCollection,B2bCollection.id==CmmProducts.id_collection)\
-                            .where(B2bCollection.id==collection.id)
-                        )
-                    ).where(and_(
-                        B2bOrders.id_customer==cst.id,
-                        B2bOrders.status==OrderStatus.FINISHED.value
-                    ))).first()
-
-                    if customer_in_collection is not None and customer_in_collection.total > 0:
-                        self.internal_flimv.append({
-                            "id_customer": cst.id,
-                            "id_collection": collection.id,
-                            "frequency": True,
-                            "liquidity": 0,
-                            "injury": 0,
-                            "mix": 0,
-                            "volume": 0
-                        })
-
-                    ##########################################################################
-                    #                                  INJURY                                #
-                    ##########################################################################
-                    # monta o indicador de injury buscando o total de reclamacoes da colecao
-                    # isso indiferente se foi aprovada ou nao, o importante eh se o 
-                    # cliente abriu devolucao
-                    sql_reclamacao_cliente = Select(func.count(FprDevolutionItem.id_product).label("total")).select_from(FprDevolution)\
-                    .join(B2bOrders,B2bOrders.id==FprDevolution.id_order)\
-                    .join(FprDevolutionItem,FprDevolutionItem.id_devolution==FprDevolution.id)\
-                    .join(CmmProducts,CmmProducts.id==FprDevolutionItem.id_product)\
-                    .join(B2bCollection,B2bCollection.id==CmmProducts.id_collection)\
-                    .where(and_(
-                        B2bCollection.id==collection.id,
-                        B2bOrders.id_customer==cst.id,
-                        FprDevolutionItem.id_size==CmmProductsGridDistribution.id_size
-                    ))
-
-                    reclamacao_cliente = conn.execute(sql_reclamacao_cliente).first()
-
-                    if reclamacao_cliente is not None and reclamacao_cliente.total > 0:
-                        for flimv in self.internal_flimv:
-                            if flimv["id_customer"]==cst.id and flimv["id_collection"]==collection.id:
-                                flimv["injury"] = reclamacao_cliente
-
-
-                    ###############################################################
-                    #                              MIX                            #
-                    ###############################################################
-                    # total de produtos unicos adquiridos por colecao
-                    total_unique_aquisition = conn.execute(Select(
-                        func.count(distinct(tuple_(B2bOrdersProducts.id_product))).label("total")
-                    ).select_from(B2bOrders)\
-                    .join(B2bOrdersProducts,B2bOrdersProducts.id_order==B2bOrders.id)\
-                    .join(CmmProducts,CmmProducts.id==B2bOrdersProducts.id_product)\
-                    .where(
-                        and_(
-                            B2bOrders.id_customer==cst.id,
-                            CmmProducts.id_collection==collection.id
-                        )
-                    )).first()
-
-                    if total_unique_aquisition is not None and total_unique_aquisition.total > 0:
-                        for flimv in self.internal_flimv:
-                            if flimv["id_customer"]==cst.id and flimv["id_collection"]==collection.id:
-                                flimv["mix"] = total_mix/total_unique_aquisition.total
-                    
-
-                    ###############################################################
-                    #                            VOLUME                           #
-                    ###############################################################
-                    # total adquirido
-                    total_aquisition = conn.execute(Select(
-                        func.sum(B2bOrdersProducts.quantity).label("total")
-                    ).select_from(B2bOrders)\
-                    .join(B2bOrdersProducts,B2bOrdersProducts.id_order==B2bOrders.id)\
-                    .join(CmmProducts,CmmProducts.id==B2bOrdersProducts.id_product)\
-                    .where(
-                        and_(
-                            B2bOrders.id_customer==cst.id,
-                            CmmProducts.id_collection==collection.id
-                        )
-                    )).first()
-                    if total_aquisition is not None and total_aquisition._total > 0:
-                        for flimv in self.internal_flimv:
-                            if flimv["id_customer"]==cst.id and flimv["id_collection"]==collection.id:
-                                flimv["volume"] = total_aquisition.total/total_mix
-
-                    
+            # apenas clientes e colecoes ativas participam do calculo
+            customers   = Select(CmmLegalEntities.id).where(CmmLegalEntities.type==LegalEntityType.CUSTOMER.value)
+            collections = Select(B2bCollection.id).where(B2bCollection.trash.is_(False))
+
+            # utilizado para calcular o volume do mix comprado (total de produtos por colecao)
+            total_mix = {r.id_collection:r.total for r in conn.execute(
+                Select(CmmProducts.id_collection,func.count(CmmProducts.id).label("total"))\
+                .where(and_(CmmProducts.trash.is_(False),CmmProducts.id_collection.in_(collections)))\
+                .group_by(CmmProducts.id_collection)
+            )}
+
+            ###############################################################
+            #                           FREQUENCY                         #
+            ###############################################################
+            # verifica quais clientes compraram em cada colecao (o pedido tem que estar como finalizado)
+            frequency = self.__by_customer_collection(conn,
+                Select(B2bOrders.id_customer,
+                       CmmProducts.id_collection,
+                       func.count(distinct(B2bOrders.id)).label("total"))\
+                .join(B2bOrdersProducts,B2bOrdersProducts.id_order==B2bOrders.id)\
+                .join(CmmProducts,CmmProducts.id==B2bOrdersProducts.id_product)\
+                .where(and_(
+                    B2bOrders.status==OrderStatus.FINISHED.value,
+                    B2bOrders.id_customer.in_(customers),
+                    CmmProducts.id_collection.in_(collections)
+                ))\
+                .group_by(B2bOrders.id_customer,CmmProducts.id_collection)
+            )
+
+            ##########################################################################
+            #                                  INJURY                                #
+            ##########################################################################
+            # total de reclamacoes do cliente na colecao, indiferente se foi aprovada
+            # ou nao, o importante eh se o cliente abriu devolucao
+            injury = self.__by_customer_collection(conn,
+                Select(B2bOrders.id_customer,
+                       CmmProducts.id_collection,
+                       func.count(FprDevolutionItem.id_product).label("total"))\
+                .select_from(FprDevolution)\
+                .join(B2bOrders,B2bOrders.id==FprDevolution.id_order)\
+                .join(FprDevolutionItem,FprDevolutionItem.id_devolution==FprDevolution.id)\
+                .join(CmmProducts,CmmProducts.id==FprDevolutionItem.id_product)\
+                .group_by(B2bOrders.id_customer,CmmProducts.id_collection)
+            )
+
+            ###############################################################
+            #                         MIX E VOLUME                        #
+            ###############################################################
+            # total de produtos unicos e quantidade total adquirida por cliente/colecao
+            aquisitions = {(r.id_customer,r.id_collection):r for r in conn.execute(
+                Select(B2bOrders.id_customer,
+                       CmmProducts.id_collection,
+                       func.count(distinct(B2bOrdersProducts.id_product)).label("unique_total"),
+                       func.sum(B2bOrdersProducts.quantity).label("total"))\
+                .select_from(B2bOrders)\
+                .join(B2bOrdersProducts,B2bOrdersProducts.id_order==B2bOrders.id)\
+                .join(CmmProducts,CmmProducts.id==B2bOrdersProducts.id_product)\
+                .group_by(B2bOrders.id_customer,CmmProducts.id_collection)
+            )}
+
+        # monta o resultado apenas para os pares em que o cliente comprou na colecao
+        for key,total in frequency.items():
+            if total==0:
+                continue
+            mix   = total_mix.get(key[1],0)
+            aq    = aquisitions.get(key)
+            flimv = {
+                "id_customer": key[0],
+                "id_collection": key[1],
+                "frequency": True,
+                "liquidity": 0,
+                "injury": injury.get(key,0),
+                "mix": 0,
+                "volume": 0
+            }
+            if aq is not None and aq.unique_total > 0:
+                flimv["mix"] = mix/aq.unique_total
+            if aq is not None and aq.total is not None and aq.total > 0 and mix > 0:
+                flimv["volume"] = aq.total/mix
+            self.internal_flimv[key] = flimv
+
     def __make_data_continuos(self) -> None:
         with self.dbconn.connect() as conn:
             # total de pedidos existentes finalizados
@@ -182,31 +156,39 @@ class Flimv():
                 pass
 
     def __save_flimv(self) -> None:
+        if len(self.internal_flimv)==0:
+            return
+
         with self.dbconn.connect() as conn:
-            for flimv in self.internal_flimv:
-                # realizar verificacao se ja existe o registro
-                exist = conn.execute(Select(ScmFlimvResult.id).where(and_(ScmFlimvResult.id_customer==flimv.id_customer,ScmFlimvResult.id_collection==flimv.id_collection))).first()
-
-                if exist is not None:
-                    Update(ScmFlimvResult).values(
-                        frequency=flimv.frequency,
-                        liquidity=flimv.liquidity,
-                        injury=flimv.injury,
-                        mix=flimv.mix,
-                        volume=flimv.volume,
-                    ).where(and_(ScmFlimvResult.id_customer==flimv.id_customer,ScmFlimvResult.id_collection==flimv.id_collection))
+            # busca de uma soh vez os registros jah existentes para separar insert de update
+            exists = {(r.id_customer,r.id_collection):r.id for r in conn.execute(
+                Select(ScmFlimvResult.id,ScmFlimvResult.id_customer,ScmFlimvResult.id_collection)
+            )}
+
+            date_ref = datetime.now()
+            to_update = []
+            to_insert = []
+            for key,flimv in self.internal_flimv.items():
+                if key in exists:
+                    # bindparam nao pode ter o mesmo nome da coluna no update
+                    to_update.append({"b_"+k:v for k,v in flimv.items()} | {"b_id":exists[key],"b_date_ref":date_ref})
                 else:
-                    conn.execute(
-                        Insert(ScmFlimvResult).values(
-                            id_customer=flimv.id_customer,
-                            id_collection=flimv.id_collection,
-                            frequency=flimv.frequency,
-                            liquidity=flimv.liquidity,
-                            injury=flimv.injury,
-                            mix=flimv.mix,
-                            volume=flimv.volume,
-                            date_ref=datetime.now()
-                        )
-                    )
-
-            conn.commit()
\ No newline at end of file
+                    to_insert.append(dict(flimv,date_ref=date_ref))
+
+            if len(to_update) > 0:
+                conn.execute(
+                    Update(ScmFlimvResult).where(ScmFlimvResult.id==bindparam("b_id")).values(
+                        frequency=bindparam("b_frequency"),
+                        liquidity=bindparam("b_liquidity"),
+                        injury=bindparam("b_injury"),
+                        mix=bindparam("b_mix"),
+                        volume=bindparam("b_volume"),
+                        date_ref=bindparam("b_date_ref"),
+                        date_updated=date_ref
+                    ),to_update
+                )
+
+            if len(to_insert) > 0:
+                conn.execute(Insert(ScmFlimvResult),to_insert)
+
+            conn.commit()
@@ -3,7 +3,7 @@ from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource, Namespace, fields
 from models.tenant import FprReason, _save_entity_log
 from f2bconfig import EntityAction, DevolutionStatus
@@ -78,8 +78,7 @@ class CategoryList(Resource):
                 rquery = rquery.where(FprDevolution.status!=int(no_status))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
 					"pagination":{
 						"registers": pag.total,
@@ -95,7 +94,7 @@ class CategoryList(Resource):
                         "order_date": m.order_date.strftime("%Y-%m-%d"),
                         "customer": m.fantasy_name,
                         "status": m.status
-					} for m in db.session.execute(rquery)]
+					} for m in pag.items]
 				}
             else:
                 retorno = [{
@@ -1,9 +1,10 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from models.tenant import FprReason
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, desc, exc, asc
 from flask_restx import Resource, Namespace, fields
 
@@ -44,6 +45,7 @@ class CategoryList(Resource):
     @ns_reason.param("order_by","Campo de ordenacao","query")
     @ns_reason.param("order_dir","Direção da ordenação","query",enum=['ASC','DESC'])
     @auth.login_required
+    @RefCache.cached("fpr-reasons")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -67,8 +69,7 @@ class CategoryList(Resource):
                 rquery = rquery.where(FprReason.description.like('%{}%'.format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 retorno = {
 					"pagination":{
 						"registers": pag.total,
@@ -82,7 +83,7 @@ class CategoryList(Resource):
 						"description": m.description,
 						"date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
 						"date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-					} for m in db.session.execute(rquery)]
+					} for m in pag.items]
 				}
             else:
                 retorno = [{
@@ -103,6 +104,7 @@ class CategoryList(Resource):
     @ns_reason.response(HTTPStatus.BAD_REQUEST,"Falha ao criar novo país!")
     @ns_reason.doc(body=cou_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -121,6 +123,7 @@ class CategoryList(Resource):
     @ns_reason.response(HTTPStatus.OK,"Exclui os dados de um país")
     @ns_reason.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool|dict:
         try:
             req = request.get_json()
@@ -141,6 +144,7 @@ class CategoryApi(Resource):
     @ns_reason.response(HTTPStatus.OK,"Obtem um registro de um país",cou_model)
     @ns_reason.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("fpr-reasons")
     def get(self,id:int):
         try:
             reason = FprReason.query.get(id)
@@ -168,6 +172,7 @@ class CategoryApi(Resource):
     @ns_reason.response(HTTPStatus.OK,"Atualiza os dados de um país")
     @ns_reason.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int)->bool|dict:
         try:
             req = request.get_json()
@@ -0,0 +1,205 @@
+import time
+import unicodedata
+from hashlib import sha1
+from threading import Lock
+from os import environ, path
+from dotenv import load_dotenv
+from sqlalchemy import Select
+from models.helpers import EngineRegistry
+from models.public import SysCities, SysCountries, SysStateRegions
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# tempo (segundos) apos o qual o indice eh recarregado mesmo sem invalidacao
+GEO_INDEX_TTL = int(str(environ.get("F2B_GEO_INDEX_TTL","3600")))
+
+def normalize_name(name:str|None) -> str:
+    """ Remove acentos, espacos extras e converte para maiusculas (ex.: 'São  Paulo' -> 'SAO PAULO') """
+    if name is None:
+        return ""
+    text = unicodedata.normalize("NFKD",str(name))
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).upper().split())
+
+def _split_filter(value) -> list[int]:
+    # aceita 1, "1" ou "1,2,3" como nos filtros das listagens
+    return [int(v) for v in str(value).split(",") if str(v).strip()!=""]
+
+
+class GeoIndex():
+    """ Indice em memoria (por processo) de paises, estados e cidades da tabela publica.
+        Eh carregado na primeira consulta e recarregado apos invalidate() ou vencido o TTL """
+    _lock = Lock()
+    _loaded_at:float = 0
+    _version:str = ""
+    countries:dict = {}
+    states:dict = {}
+    cities:dict = {}
+    by_name:dict = {}
+    by_ibge:dict = {}
+    by_state:dict = {}
+
+    @classmethod
+    def __load(cls) -> None:
+        with EngineRegistry.get_engine().connect() as conn:
+            countries = conn.execute(Select(SysCountries.id,SysCountries.name).order_by(SysCountries.id)).all()
+            states = conn.execute(Select(SysStateRegions.id,SysStateRegions.id_country,
+                                         SysStateRegions.name,SysStateRegions.acronym)
+                                  .order_by(SysStateRegions.id)).all()
+            cities = conn.execute(Select(SysCities.id,SysCities.id_state_region,
+                                         SysCities.name,SysCities.brazil_ibge_code)
+                                  .order_by(SysCities.id)).all()
+
+        idx_countries = {c.id: {"id": c.id, "name": c.name} for c in countries}
+        idx_states = {s.id: {
+            "id": s.id,
+            "id_country": s.id_country,
+            "name": s.name,
+            "acronym": s.acronym,
+            "search": normalize_name(s.name)+" "+normalize_name(s.acronym)
+        } for s in states}
+
+        idx_cities,by_name,by_ibge,by_state = {},{},{},{}
+        for c in cities:
+            state = idx_states.get(c.id_state_region)
+            country = None if state is None else idx_countries.get(state["id_country"])
+            idx_cities[c.id] = {
+                "id": c.id,
+                "id_state_region": c.id_state_region,
+                "name": c.name,
+                "brazil_ibge_code": c.brazil_ibge_code,
+                "search": " ".join([normalize_name(c.name),
+                                    "" if state is None else state["search"],
+                                    "" if country is None else normalize_name(country["name"])])
+            }
+            by_name.setdefault(normalize_name(c.name),[]).append(c.id)
+            by_state.setdefault(c.id_state_region,[]).append(c.id)
+            if c.brazil_ibge_code is not None and str(c.brazil_ibge_code).strip()!="":
+                by_ibge[str(c.brazil_ibge_code).strip()] = c.id
+
+        # a versao vem do conteudo para que todos os processos gerem o mesmo ETag
+        version = sha1(repr((countries,states,cities)).encode()).hexdigest()
+
+        cls.countries,cls.states,cls.cities = idx_countries,idx_states,idx_cities
+        cls.by_name,cls.by_ibge,cls.by_state = by_name,by_ibge,by_state
+        cls._version   = version
+        cls._loaded_at = time.monotonic()
+
+    @classmethod
+    def ensure(cls) -> None:
+        """ Carrega o indice se ainda nao existir ou estiver vencido """
+        if cls._loaded_at!=0 and time.monotonic()-cls._loaded_at < GEO_INDEX_TTL:
+            return
+        with cls._lock:
+            if cls._loaded_at==0 or time.monotonic()-cls._loaded_at >= GEO_INDEX_TTL:
+                cls.__load()
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """ Forca a recarga na proxima consulta (chamar apos gravar cidades/estados/paises) """
+        with cls._lock:
+            cls._loaded_at = 0
+
+    @classmethod
+    def version(cls) -> str:
+        cls.ensure()
+        return cls._version
+
+    @classmethod
+    def etag(cls,*parts) -> str:
+        """ ETag da versao atual do indice combinada com os parametros da consulta """
+        return sha1((cls.version()+"|"+"|".join([str(p) for p in parts])).encode()).hexdigest()
+
+    @classmethod
+    def find_city(cls,name:str,state:str|int|None = None) -> int:
+        """ Id da cidade pelo nome (sem diferenciar acentos e maiusculas), opcionalmente
+            restrito ao estado (id ou sigla). Retorna 0 se nao encontrar """
+        cls.ensure()
+        ids = cls.by_name.get(normalize_name(name),[])
+        if state is not None and len(ids) > 0:
+            if str(state).isdigit():
+                ids = [i for i in ids if cls.cities[i]["id_state_region"]==int(state)]
+            else:
+                acronym = normalize_name(str(state))
+                ids = [i for i in ids if normalize_name(cls.states.get(cls.cities[i]["id_state_region"],{}).get("acronym"))==acronym]
+        return ids[0] if len(ids) > 0 else 0
+
+    @classmethod
+    def find_city_by_ibge(cls,ibge:str|None) -> int:
+        """ Id da cidade pelo codigo IBGE. Retorna 0 se nao encontrar """
+        cls.ensure()
+        return cls.by_ibge.get(str(ibge).strip(),0) if ibge is not None else 0
+
+    @classmethod
+    def list_cities(cls,search:str|None = None,state_region = None,order_by:str = "id",reverse:bool = False) -> list[dict]:
+        """ Cidades com estado e pais, filtradas por texto e/ou estados """
+        cls.ensure()
+        if state_region is not None:
+            ids = [i for s in _split_filter(state_region) for i in cls.by_state.get(s,[])]
+        else:
+            ids = list(cls.cities.keys())
+        cities = [cls.cities[i] for i in ids]
+
+        if search is not None and str(search)!="":
+            term = normalize_name(search)
+            cities = [c for c in cities if c["search"].find(term)!=-1]
+
+        key = order_by if order_by in ("id","name","id_state_region","brazil_ibge_code") else "id"
+        cities.sort(key=lambda c: normalize_name(c[key]) if isinstance(c[key],str) or c[key] is None else c[key],reverse=reverse)
+
+        result = []
+        for c in cities:
+            state   = cls.states.get(c["id_state_region"],{})
+            country = cls.countries.get(state.get("id_country"),{})
+            result.append({
+                "id": c["id"],
+                "name": c["name"],
+                "state_region":{
+                    "id": state.get("id"),
+                    "name": state.get("name"),
+                    "acronym": state.get("acronym"),
+                    "country": {
+                        "id": country.get("id"),
+                        "name": country.get("name")
+                    }
+                }
+            })
+        return result
+
+    @classmethod
+    def list_states(cls,search:str|None = None,country = None,order_by:str = "id",reverse:bool = False) -> list[dict]:
+        """ Estados filtrados por texto e/ou paises """
+        cls.ensure()
+        states = list(cls.states.values())
+        if country is not None:
+            countries = _split_filter(country)
+            states = [s for s in states if s["id_country"] in countries]
+
+        if search is not None and str(search)!="":
+            term = normalize_name(search)
+            states = [s for s in states if s["search"].find(term)!=-1]
+
+        key = order_by if order_by in ("id","id_country","name","acronym") else "id"
+        states.sort(key=lambda s: normalize_name(s[key]) if isinstance(s[key],str) else s[key],reverse=reverse)
+        return [{
+            "id": s["id"],
+            "id_country": s["id_country"],
+            "name": s["name"],
+            "acronym": s["acronym"]
+        } for s in states]
+
+    @staticmethod
+    def paginate(rows:list,page:int,per_page:int) -> dict:
+        """ Pagina uma lista jah filtrada no mesmo formato das listagens paginadas do BD """
+        total = len(rows)
+        pages = (total + per_page - 1)//per_page if per_page > 0 else 0
+        return {
+            "pagination":{
+                "registers": total,
+                "page": page,
+                "per_page": per_page,
+                "pages": pages,
+                "has_next": page < pages
+            },
+            "data": rows[(page-1)*per_page:page*per_page]
+        }
@@ -0,0 +1,241 @@
+import io
+import csv
+import logging
+from datetime import datetime
+from os import environ, path
+from dotenv import load_dotenv
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy import Connection, Insert, Table
+from f2bconfig import LegalEntityContactType
+from geo import GeoIndex
+from models.tenant import CmmLegalEntities, CmmLegalEntityContact
+from models.tenant import CmmLegalEntityImport, CmmProductsImport
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# quantidade de linhas lidas e gravadas por vez
+IMPORT_CHUNK = int(str(environ.get("F2B_IMPORT_CHUNK","5000")))
+
+def _read_csv_chunks(fName:str,chunk_size:int,skip_header:bool|None = None):
+    """ Le o arquivo em blocos de (numero da linha, colunas) sem carregar tudo em memoria """
+    with open(fName,newline='',encoding="utf-8") as csv_file:
+        if skip_header is None:
+            try:
+                skip_header = csv.Sniffer().has_header(csv_file.read(1024))
+            except csv.Error:
+                skip_header = True
+            csv_file.seek(0)
+        reader = csv.reader(csv_file)
+        #pula a linha de cabecalho
+        if skip_header:
+            next(reader,None)
+        chunk = []
+        for row in reader:
+            chunk.append((reader.line_num,row))
+            if len(chunk)==chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+def _parse_product(row:list) -> dict:
+    return {
+        "refCode":row[0],
+        "barCode":row[1],
+        "type":row[2],
+        "model":row[3],
+        "brand":row[4],
+        "name":row[5],
+        "description":row[6],
+        "observation":row[7],
+        "price":float(str(row[8]).replace(",",".")),
+        "measure_unit":row[9],
+        "color":row[10],
+        "size":row[11],
+        "quantity":int(row[12])
+    }
+
+def _parse_entity(row:list) -> dict:
+    return {
+        "id_original":row[0],
+        "taxvat":row[1],
+        "name":row[2],
+        "fantasy_name":row[3],
+        "city":row[4],
+        "postal_code":row[5],
+        "neighborhood":row[6],
+        "address":row[7],
+        "type": "P" if row[8]=='PERSONA' else "C" if row[8]=="CUSTOMER" else "R",
+        "phone_type":row[9],
+        "phone_number":row[10],
+        "is_whatsapp":bool(row[11]),
+        "phone_is_default":bool(row[12]),
+        "email_type":row[13],
+        "email_address":row[14],
+        "email_is_default":bool(row[15])
+    }
+
+class CsvImporter():
+    """ Pipeline de importacao de CSV em blocos: le o arquivo em partes, grava cada
+        bloco com COPY (ou executemany) e registra o progresso e os erros por linha """
+    conn:Connection
+    chunk_size:int
+    processed:int
+    imported:int
+    errors:list
+
+    def __init__(self,conn:Connection,chunk_size:int = IMPORT_CHUNK,progress=None) -> None:
+        self.conn       = conn
+        self.chunk_size = chunk_size
+        self.progress   = progress
+        self.processed  = 0
+        self.imported   = 0
+        self.errors     = []
+
+    def summary(self) -> dict:
+        return {
+            "processed": self.processed,
+            "imported": self.imported,
+            "errors": self.errors
+        }
+
+    def __report(self,fName:str) -> None:
+        logging.info("Importacao "+path.basename(fName)+": "+str(self.processed)+" linhas lidas, "+\
+                     str(self.imported)+" importadas, "+str(len(self.errors))+" com erro")
+        if self.progress is not None:
+            self.progress(self.processed,self.imported,len(self.errors))
+
+    def __error(self,line:int,e:Exception|str) -> None:
+        self.errors.append({"line":line,"error":str(e)})
+
+    def __parse(self,chunk:list,parser) -> list:
+        # converte as linhas do bloco, as linhas invalidas ficam registradas como erro
+        rows = []
+        for line,row in chunk:
+            self.processed += 1
+            try:
+                rows.append((line,parser(row)))
+            except (IndexError,ValueError) as e:
+                self.__error(line,e)
+        return rows
+
+    def __copy(self,table:Table,rows:list) -> None:
+        # o COPY nao passa pelo schema_translate_map, entao qualifica a tabela manualmente
+        schema  = (self.conn.get_execution_options().get("schema_translate_map") or {}).get(None)
+        target  = ('"'+str(schema)+'".' if schema is not None else '')+table.name
+        columns = list(rows[0].keys())
+        sql     = "COPY "+target+" ("+",".join(['"'+c+'"' for c in columns])+") FROM STDIN"
+        cursor  = self.conn.connection.cursor()
+        try:
+            if hasattr(cursor,"copy_expert"): # psycopg2
+                buffer = io.StringIO()
+                writer = csv.writer(buffer,quoting=csv.QUOTE_NONNUMERIC)
+                for r in rows:
+                    writer.writerow([r[c] for c in columns])
+                buffer.seek(0)
+                cursor.copy_expert(sql+" WITH (FORMAT csv)",buffer)
+            elif hasattr(cursor,"copy"): # psycopg 3
+                with cursor.copy(sql) as copy:
+                    for r in rows:
+                        copy.write_row([r[c] for c in columns])
+            else:
+                self.conn.execute(Insert(table),rows)
+        finally:
+            cursor.close()
+
+    def __load(self,table:Table,rows:list) -> None:
+        # grava o bloco inteiro, em caso de falha refaz linha a linha para apontar as linhas com erro
+        if len(rows)==0:
+            return
+        try:
+            with self.conn.begin_nested():
+                self.__copy(table,[r for _,r in rows])
+            self.imported += len(rows)
+        except (DBAPIError,SQLAlchemyError):
+            for line,row in rows:
+                try:
+                    with self.conn.begin_nested():
+                        self.conn.execute(Insert(table),row)
+                    self.imported += 1
+                except (DBAPIError,SQLAlchemyError) as e:
+                    self.__error(line,getattr(e,"orig",e))
+
+    def import_staging(self,fName:str) -> dict:
+        """ Carrega um arquivo import_P_ (produtos) ou import_E_ (entidades) na tabela de importacao """
+        if path.basename(fName).find("import_P_")!=-1:
+            table,parser = CmmProductsImport.__table__,_parse_product # type: ignore
+        elif path.basename(fName).find("import_E_")!=-1:
+            table,parser = CmmLegalEntityImport.__table__,_parse_entity # type: ignore
+        else:
+            raise ValueError("Tipo de arquivo de importacao desconhecido: "+fName)
+
+        for chunk in _read_csv_chunks(fName,self.chunk_size):
+            self.__load(table,self.__parse(chunk,parser))
+            self.__report(fName)
+        return self.summary()
+
+    def __get_city(self,name:str) -> int:
+        return GeoIndex.find_city(name)
+
+    def __parse_legal_entity(self,type:str):
+        activation = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        def parser(reg:list) -> dict:
+            return {
+                "entity": {
+                    "origin_id": reg[0],
+                    "taxvat": reg[1],
+                    "name": reg[2],
+                    "fantasy_name": reg[3],
+                    "type": type,
+                    "id_city": self.__get_city(reg[4]),
+                    "postal_code": str(reg[5]).replace("-","").replace(" ",""),
+                    "neighborhood": str(reg[6]).upper(),
+                    "address": str(reg[7]).upper(),
+                    "activation_date": activation
+                },
+                "contacts": [{
+                    "name": str(reg[8]),
+                    "contact_type": LegalEntityContactType.PHONE.value,
+                    "value": str(reg[9]).replace(" ","").replace("-","").replace("(","").replace(")",""), # se for telefone pode remover tracos e parenteses
+                    "is_whatsapp": True if reg[10]=="1" else False,
+                    "is_default": True if reg[11]=="1" else False
+                },{
+                    "name": reg[12],
+                    "contact_type": LegalEntityContactType.EMAIL.value,
+                    "value": reg[13],
+                    "is_whatsapp": False,
+                    "is_default": True if reg[14]=="1" else False
+                }]
+            }
+        return parser
+
+    def __insert_entities(self,rows:list) -> None:
+        ids = self.conn.execute(
+            Insert(CmmLegalEntities).returning(CmmLegalEntities.id,sort_by_parameter_order=True),
+            [r["entity"] for _,r in rows]
+        ).scalars().all()
+        self.conn.execute(Insert(CmmLegalEntityContact),[
+            dict(ct,id_legal_entity=id) for id,(_,r) in zip(ids,rows) for ct in r["contacts"]
+        ])
+
+    def import_legal_entities(self,fName:str,type:str) -> dict:
+        """ Importa diretamente entidades legais e seus contatos (telefone e e-mail) """
+        for chunk in _read_csv_chunks(fName,self.chunk_size,skip_header=True):
+            rows = self.__parse(chunk,self.__parse_legal_entity(type))
+            if len(rows)==0:
+                continue
+            try:
+                with self.conn.begin_nested():
+                    self.__insert_entities(rows)
+                self.imported += len(rows)
+            except (DBAPIError,SQLAlchemyError):
+                for row in rows:
+                    try:
+                        with self.conn.begin_nested():
+                            self.__insert_entities([row])
+                        self.imported += 1
+                    except (DBAPIError,SQLAlchemyError) as e:
+                        self.__error(row[0],getattr(e,"orig",e))
+            self.__report(fName)
+        return self.summary()
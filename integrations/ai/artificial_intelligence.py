@@ -2,7 +2,7 @@ from abc import abstractmethod,ABC
 from dotenv import load_dotenv
 from os import environ,path
 
-from sqlalchemy import create_engine
+from models.helpers import EngineRegistry
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
@@ -14,12 +14,7 @@ class ArtificialInteligence(ABC):
     ai_api_key:str = ""
 
     def __init__(self,api_key:str) -> None:
-        conn = str(environ.get("F2B_DB_LIB"))
-        conn += "://"+str(environ.get("F2B_DB_USER"))
-        conn += ":"+str(environ.get("F2B_DB_PASS"))+"@"
-        conn += str(environ.get("F2B_DB_HOST"))+"/"
-        conn += str(environ.get("F2B_DB_NAME"))
-        self.dbconn = create_engine(conn)
+        self.dbconn = EngineRegistry.get_engine()
         self.ai_api_key = api_key
         super().__init__()
     
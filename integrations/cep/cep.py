@@ -1,29 +1,26 @@
 from abc import abstractmethod,ABC
 from types import SimpleNamespace
-from requests import Response,Session
+from requests import Response
 from dotenv import load_dotenv
 from os import environ,path
 import json
 
-from sqlalchemy import Select, create_engine, Engine
+from sqlalchemy import Engine
+from models.helpers import EngineRegistry
+from integrations.http_client import HttpClient
 
-from models.public import SysCities
+from geo import GeoIndex
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
 
 class CEP(ABC):
     dbconn:Engine
-    nav: Session
+    nav: HttpClient
 
     def __init__(self) -> None:
-        self.nav = Session()
-        conn = str(environ.get("F2B_DB_LIB"))+"://"
-        conn += str(environ.get("F2B_DB_USER"))+":"
-        conn += str(environ.get("F2B_DB_PASS"))+"@"
-        conn += str(environ.get("F2B_DB_HOST"))+"/"
-        conn += str(environ.get("F2B_DB_NAME"))
-        self.dbconn = create_engine(conn)
+        self.nav = HttpClient(self.__class__.__module__.split(".")[-1])
+        self.dbconn = EngineRegistry.get_engine()
         super().__init__()
 
     def _as_object(self,req:Response,try_convert:bool = False):
@@ -33,13 +30,7 @@ class CEP(ABC):
         return str(environ.get(name))
     
     def _get_city_id(self,ibge:str)->int:
-        id = 0
-        with self.dbconn.connect() as con:
-            exc = con.execute(Select(SysCities.id).where(SysCities.brazil_ibge_code==ibge)).first()
-            if exc is not None:
-                id = exc.id
-            con.close()
-        return id
+        return GeoIndex.find_city_by_ibge(ibge)
     
     
     @abstractmethod 
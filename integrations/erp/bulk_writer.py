@@ -0,0 +1,203 @@
+from os import environ, path
+from dotenv import load_dotenv
+from sqlalchemy import Connection, Engine, Insert, Select, Update, and_, or_, tuple_, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# quantidade de registros acumulados antes de gravar no BD
+ERP_BULK_BATCH = int(str(environ.get("F2B_ERP_BULK_BATCH","500")))
+
+
+def _same(current,new) -> bool:
+    # CHAR do postgres volta com espacos a direita e Decimal/int/str variam entre ERP e BD
+    if current is None or new is None:
+        return current is None and new is None
+    return str(current).rstrip()==str(new).rstrip()
+
+
+class BulkWriter():
+    """ Grava registros vindos do ERP em lotes sobre uma unica conexao
+
+        Os registros sao identificados pelas colunas `keys` (ex.: ["prodCode"]). Quando a
+        tabela possui indice unico nessas colunas cada lote vira um INSERT ... ON CONFLICT
+        DO UPDATE, caso contrario os existentes sao buscados em uma consulta e o lote eh
+        gravado com um UPDATE e um INSERT em executemany. Registros sem alteracao nao sao
+        regravados e sao contados como ignorados.
+
+        Uso:
+            with BulkWriter(self.dbconn,CmmProducts,["prodCode"]) as writer:
+                for p in items:
+                    writer.add({...})
+            writer.inserted, writer.updated, writer.skipped """
+
+    def __init__(self,bind:Engine|Connection,model,keys:list[str],
+                 batch_size:int = ERP_BULK_BATCH,insert_values:dict|None = None) -> None:
+        self.bind          = bind
+        self.conn          = bind if isinstance(bind,Connection) else None
+        self.table         = model.__table__
+        self.keys          = list(keys)
+        self.batch_size    = max(int(batch_size),1)
+        # valores usados apenas quando o registro for inserido (ex.: preco zerado)
+        self.insert_values = insert_values or {}
+        self.buffer:dict   = {}
+        self.inserted      = 0
+        self.updated       = 0
+        self.skipped       = 0
+        # id de cada registro gravado/existente pela chave, para vincular tabelas filhas
+        self.ids:dict      = {}
+        self.upsert        = self.__has_unique_index()
+
+    def __has_unique_index(self) -> bool:
+        keys = set(self.keys)
+        for idx in self.table.indexes:
+            if idx.unique and set(c.name for c in idx.columns)==keys:
+                return True
+        for cons in self.table.constraints:
+            if cons.__class__.__name__ in ("UniqueConstraint","PrimaryKeyConstraint") and set(c.name for c in cons.columns)==keys:
+                return True
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc,tb) -> None:
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+
+    def __key(self,record:dict) -> tuple:
+        return tuple(record.get(k) for k in self.keys)
+
+    def __connection(self) -> Connection:
+        if self.conn is None:
+            self.conn = self.bind.connect() # type: ignore
+        return self.conn
+
+    def add(self,record:dict,insert:bool = True) -> None:
+        """ Acumula o registro. Com insert=False ele soh atualiza um existente
+            (ex.: produto inativo que nao deve ser criado) """
+        key = self.__key(record)
+        if any(k is None for k in key):
+            self.skipped += 1
+            return
+        # o mesmo registro repetido no lote vale a ultima versao
+        if key in self.buffer:
+            self.skipped += 1
+        self.buffer[key] = (record,insert)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Grava o que estiver acumulado """
+        if len(self.buffer)==0:
+            return
+        batch = self.buffer
+        self.buffer = {}
+        conn = self.__connection()
+        if self.upsert:
+            self.__write_upsert(conn,{k: v for k,v in batch.items() if v[1]})
+            self.__write_lookup(conn,{k: v for k,v in batch.items() if not v[1]})
+        else:
+            self.__write_lookup(conn,batch)
+        # conexao propria: confirma por lote, conexao recebida: quem chamou controla a transacao
+        if self.bind is not conn:
+            conn.commit()
+
+    def close(self) -> None:
+        if self.conn is not None and self.bind is not self.conn:
+            self.conn.close()
+        self.conn = None
+
+    def counts(self) -> dict:
+        return {"inserted": self.inserted, "updated": self.updated, "skipped": self.skipped}
+
+    def __groups(self,records:list[dict]) -> list[list[dict]]:
+        # executemany e INSERT multi-values precisam das mesmas colunas em todas as linhas
+        groups = {}
+        for r in records:
+            groups.setdefault(tuple(sorted(r.keys())),[]).append(r)
+        return list(groups.values())
+
+    def __returning(self) -> list:
+        cols = [self.table.c[k] for k in self.keys]
+        return cols + ([self.table.c.id] if "id" in self.table.c else [])
+
+    def __write_upsert(self,conn:Connection,batch:dict) -> None:
+        if len(batch)==0:
+            return
+        for rows in self.__groups([dict(self.insert_values,**r) for r,_ in batch.values()]):
+            stmt = insert(self.table).values(rows)
+            cols = [c for c in rows[0].keys() if c not in self.keys and c not in self.insert_values]
+            set_ = {c: stmt.excluded[c] for c in cols}
+            # onupdate (ex.: date_updated) nao eh aplicado automaticamente no ON CONFLICT
+            for c in self.table.c:
+                if c.onupdate is not None and c.name not in set_ and getattr(c.onupdate,"is_clause_element",False):
+                    set_[c.name] = c.onupdate.arg # type: ignore
+            if len(cols)==0:
+                stmt = stmt.on_conflict_do_nothing(index_elements=self.keys)
+            else:
+                # sem alteracao o registro nao eh regravado e nao volta no RETURNING
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=self.keys,
+                    set_=set_,
+                    where=or_(*[self.table.c[c].is_distinct_from(stmt.excluded[c]) for c in cols])
+                )
+            # xmax = 0 indica linha criada pelo INSERT, senao foi atualizada pelo conflito
+            result = conn.execute(stmt.returning(*self.__returning(),literal_column("xmax = 0").label("f2b_inserted"))).mappings().all()
+            for r in result:
+                if r["f2b_inserted"]:
+                    self.inserted += 1
+                else:
+                    self.updated += 1
+                if "id" in r:
+                    self.ids[tuple(r[k] for k in self.keys)] = r["id"]
+            self.skipped += len(rows) - len(result)
+
+    def __write_lookup(self,conn:Connection,batch:dict) -> None:
+        if len(batch)==0:
+            return
+        key_cols = [self.table.c[k] for k in self.keys]
+        names = list(dict.fromkeys([c for r,_ in batch.values() for c in r.keys()] + self.keys))
+        if len(key_cols)==1:
+            where = key_cols[0].in_([k[0] for k in batch.keys()])
+        else:
+            where = tuple_(*key_cols).in_(list(batch.keys()))
+        current = {}
+        for r in conn.execute(Select(*[self.table.c[c] for c in names],*([self.table.c.id] if "id" in self.table.c and "id" not in names else [])).where(where)).mappings():
+            current[tuple(str(r[k]).rstrip() for k in self.keys)] = r
+
+        inserts, updates = [], []
+        for key,(record,can_insert) in batch.items():
+            exist = current.get(tuple(str(k).rstrip() for k in key))
+            if exist is None:
+                if can_insert:
+                    inserts.append(dict(self.insert_values,**record))
+                else:
+                    self.skipped += 1
+                continue
+            if "id" in exist:
+                self.ids[key] = exist["id"]
+            changed = {c: v for c,v in record.items() if c not in self.keys and not _same(exist[c],v)}
+            if len(changed)==0:
+                self.skipped += 1
+                continue
+            # bindparam com o mesmo nome da coluna conflita no SET, por isso o prefixo b_
+            updates.append(dict({"b_"+c: v for c,v in record.items() if c not in self.keys},**{"b_key_"+k: exist[k] for k in self.keys}))
+
+        for rows in self.__groups(updates):
+            cols = [c[2:] for c in rows[0].keys() if not c.startswith("b_key_")]
+            conn.execute(Update(self.table)
+                         .where(and_(*[self.table.c[k]==bindparam("b_key_"+k) for k in self.keys]))
+                         .values({c: bindparam("b_"+c) for c in cols}),rows)
+            self.updated += len(rows)
+
+        for rows in self.__groups(inserts):
+            result = conn.execute(Insert(self.table).values(rows).returning(*self.__returning())).mappings().all()
+            for r in result:
+                if "id" in r:
+                    self.ids[tuple(r[k] for k in self.keys)] = r["id"]
+            self.inserted += len(rows)
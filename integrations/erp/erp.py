@@ -1,31 +1,92 @@
 import json
+import logging
 from os import environ, path
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from types import SimpleNamespace
 from abc import abstractmethod, ABC
-from requests import Response, Session
-from sqlalchemy import create_engine, Engine
+from requests import Response
+from integrations.http_client import HttpClient
+from integrations.erp.bulk_writer import BulkWriter, ERP_BULK_BATCH
+from sqlalchemy import Engine, Select
+from sqlalchemy.dialects.postgresql import insert
+from models.helpers import EngineRegistry
+from models.public import SysErpSync
+from ref_cache import RefCache
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
 
+# margem (segundos) subtraida do inicio da sincronizacao ao gravar o watermark,
+# cobre diferenca de relogio com o ERP, os registros repetidos sao regravados (upsert)
+ERP_SYNC_OVERLAP = int(str(environ.get("F2B_ERP_SYNC_OVERLAP","300")))
+# forca a carga completa ignorando os watermarks (ex.: primeira carga ou correcao)
+ERP_SYNC_FULL    = str(environ.get("F2B_ERP_SYNC_FULL","0"))=="1"
+
 
 class ERP(ABC):
-    nav: Session
+    nav: HttpClient
     dbconn: Engine
+    schema: str
 
     def __init__(self, schema:str) -> None:
-        self.nav = Session()
-        conn = str(environ.get("F2B_DB_LIB"))+"://"
-        conn += str(environ.get("F2B_DB_USER"))+":"
-        conn += str(environ.get("F2B_DB_PASS"))+"@"
-        conn += str(environ.get("F2B_DB_HOST"))+"/"
-        conn += str(environ.get("F2B_DB_NAME"))
-        conn += "?options=-c%20search_path="+schema
-        self.dbconn = create_engine(conn)
+        self.nav = HttpClient(self.__class__.__module__.split(".")[-1])
+        self.schema = str(schema)
+        self.dbconn = EngineRegistry.get_engine(schema)
         super().__init__()
 
-    
+    def _get_watermark(self,entity:str) -> str|None:
+        """ Ultima alteracao jah importada da entidade para o tenant (None = nunca sincronizado) """
+        if ERP_SYNC_FULL:
+            return None
+        with EngineRegistry.get_engine().connect() as conn:
+            return conn.execute(Select(SysErpSync.watermark)
+                                .where(SysErpSync.id_customer==self.schema)
+                                .where(SysErpSync.entity==entity)).scalar()
+
+    def _save_watermark(self,entity:str,watermark:str|None,records:int) -> None:
+        with EngineRegistry.get_engine().connect() as conn:
+            stmt = insert(SysErpSync).values(id_customer=self.schema,entity=entity,watermark=watermark,
+                                             records=records,last_sync=datetime.now())
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[SysErpSync.id_customer,SysErpSync.entity],
+                set_={
+                    "watermark": stmt.excluded.watermark,
+                    "records": stmt.excluded.records,
+                    "last_sync": stmt.excluded.last_sync
+                }
+            ))
+            conn.commit()
+
+    def _delta_sync(self,entity:str,fetch,apply) -> int:
+        """ Sincroniza apenas o que mudou desde o ultimo watermark da entidade
+
+            fetch(since) deve gerar lotes (listas) de registros alterados desde `since`
+            (datetime ou None para carga completa) e apply(lote) grava cada lote.
+            O watermark soh avanca se todos os lotes forem aplicados, uma falha no meio
+            faz a proxima execucao reprocessar a partir do mesmo ponto """
+        watermark = self._get_watermark(entity)
+        since     = None if watermark is None else datetime.fromisoformat(watermark)
+        started   = datetime.now()
+        records   = 0
+        for batch in fetch(since):
+            if len(batch) > 0:
+                apply(batch)
+                records += len(batch)
+        self._save_watermark(entity,(started - timedelta(seconds=ERP_SYNC_OVERLAP)).isoformat(),records)
+        logging.info("ERP "+self.schema+" "+entity+": "+str(records)+" registros desde "+str(since or "o inicio"))
+        return records
+
+    def _bulk_writer(self,model,keys:list[str],batch_size:int = ERP_BULK_BATCH,insert_values:dict|None = None) -> BulkWriter:
+        """ Gravador em lote no schema do tenant, ver BulkWriter """
+        return BulkWriter(self.dbconn,model,keys,batch_size,insert_values)
+
+    def _invalidate_reference(self,writer:BulkWriter) -> None:
+        """ Invalida o cache de referencia do tenant quando a carga gravou algo,
+            o cron roda fora da API, ver RefCache.bump_external """
+        if writer.inserted+writer.updated > 0:
+            RefCache.bump_external(self.schema)
+
     def _as_object(self,req:Response):
         return json.loads(req.text,object_hook=lambda d: SimpleNamespace(**d))
 
@@ -57,4 +118,7 @@ class ERP(ABC):
     def get_products(self): pass
 
     @abstractmethod
-    def get_payment_conditions(self): pass
\ No newline at end of file
+    def get_payment_conditions(self):
+        """ As condicoes de pagamento sao listadas pelo cache de referencia, a carga
+            deve terminar com self._invalidate_reference(writer) """
+        pass
\ No newline at end of file
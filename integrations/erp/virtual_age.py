@@ -1,14 +1,12 @@
 import json
-from time import sleep
 from os import environ
 # from models import _show_query
 from integrations.erp import erp
 from requests import RequestException
+from geo import GeoIndex
+from datetime import date
 from models.tenant import CmmCategories
-from models.tenant import CmmProductsCategories
-from models.public import SysStateRegions, SysCities
 from models.tenant import CmmMeasureUnit,CmmLegalEntities
-from sqlalchemy import Insert,Select, Update, and_,or_,exc
 from models.tenant import CmmLegalEntityContact,CmmProducts
 
 class VirtualAge(erp.ERP):
@@ -42,57 +40,51 @@ class VirtualAge(erp.ERP):
         return False
     
     def get_products(self):
+        return self._delta_sync("products",self.__fetch_products,self.__apply_products)
+
+    def __fetch_products(self,since):
+        # busca apenas os produtos/precos alterados desde o ultimo watermark
+        change = {"inProduct":True,"inPrice":True}
+        if since is not None:
+            change["startDate"] = since.strftime("%Y-%m-%dT%H:%M:%S")
         has_next = True
         act_page = 1
         while has_next:
             req = self.nav.post(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/product/v2/products/search',
-                                data={
+                                data=json.dumps({
                                     "filter":{
-                                        "change":{
-                                            "inProduct":True,
-                                            "inPrice":True
-                                        }
+                                        "change": change
                                     },
                                     "option":{
                                         "branchInfoCode": environ.get("F2B_VIRTUALAGE_DEFAULT_COMPANY")
                                     },
                                     "page": act_page,
-                                    "pageSize": 30
-                                },
+                                    "pageSize": 100
+                                }),
                                 headers=self._get_header())
-            if req.status_code==200:
-                data = self._as_object(req)
-
-                for p in data.items:
-                    with self.dbconn.connect() as con:
-                        exist = con.execute(Select(CmmProducts).where(CmmProducts.prodCode==p.productCode)).first()
-                        if exist is not None:
-                            if not p.isActive:                                
-                                result = con.execute(Insert(CmmProducts).values(
-                                    prodCode=p.productCode,
-                                    barCode=p.productSku,
-                                    name=p.productName,
-                                    refCode=p.ReferenceCode,
-                                    description=p.description,
-                                    ncm=p.ncm,
-                                    price=0,
-                                    price_pdv=0,
-                                    measure_unit=p.measuredUnit,
-                                    structure='S',
-                                    id_category=0,
-                                    id_type=0,
-                                    id_model=0
-                                ))
-                                con.commit()
+            if req.status_code!=200:
+                # sem gravar o watermark a proxima execucao tenta o mesmo periodo
+                raise RequestException("Falha ao buscar produtos ("+str(req.status_code)+"): "+req.text)
+            data = self._as_object(req)
+            yield data.items
+            has_next = bool(data.hasNext)
+            act_page += 1
 
-                                inserted_id = result.inserted_primary_key[0] if hasattr(result, "inserted_primary_key") and result.inserted_primary_key else None
-                                
-                                self.__save_product_images(int(str(inserted_id)))
-                has_next = data.hasNext
-                act_page += 1
-                sleep(1)
-            else:
-                has_next = False
+    def __apply_products(self,items:list):
+        # produtos inativos soh atualizam um cadastro existente, nunca sao criados
+        with self._bulk_writer(CmmProducts,["prodCode"],
+                               insert_values={"price":0,"structure":'S',"id_type":0,"id_model":0,"id_grid":0}) as writer:
+            for p in items:
+                writer.add({
+                    "prodCode": str(p.productCode),
+                    "barCode": p.productSku,
+                    "name": p.productName,
+                    "refCode": p.ReferenceCode,
+                    "description": p.description,
+                    "ncm": p.ncm,
+                    "trash": not p.isActive
+                },insert=bool(p.isActive))
+        return writer.counts()
 
     def __save_product_images(self,id_product:int):
         req = self.nav.post(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/image/v2/product/search',
@@ -116,45 +108,34 @@ class VirtualAge(erp.ERP):
     def get_product_category(self):
         has_next = True
         act_page = 1
-        #faz um looping infinito por causa da paginacao de resultados
-        while has_next:
-            req = self.nav.get(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/product/v2/category',
-                               data={
-                                    "page": act_page,
-                                    "pageSize": 100
-                                },
-                                headers=self._get_header()
-                                )
-            #verifica se houve sucesso na busca
-            if req.status_code==200:
-                #converte o resultado em objeto
+        with self._bulk_writer(CmmCategories,["origin_id"]) as writer:
+            #faz um looping infinito por causa da paginacao de resultados
+            while has_next:
+                req = self.nav.get(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/product/v2/category',
+                                   data={
+                                        "page": act_page,
+                                        "pageSize": 100
+                                    },
+                                    headers=self._get_header()
+                                    )
+                #ao gerar falha na busca interrompe o looping
+                if req.status_code!=200:
+                    break
                 data = self._as_object(req)
-                #varre os itens do resultado
                 for it in data.items:
-                    #conecta o bd
-                    with self.dbconn.connect() as con:
-                        #verifica se o registro ja existe
-                        exist = con.execute(Select(CmmProductsCategories)\
-                                .join(CmmCategories,CmmCategories.id==CmmProductsCategories.id_category)\
-                                .where(CmmCategories.origin_id==it.code)).first()
-                        if exist is not None:
-                            #so irah salvar o que for categoria ou subcategoria
-                            if it.categoryType==1 or it.categoryType==2:
-                                con.execute(Insert(CmmProductsCategories).values(name=it.name,id_parent=it.parentCategoryCode,origin_id=it.code))
-                                con.commit()
-            else:
-                #ao gerar falha na busca interrompe o looping
-                has_next = False
-            has_next = data.hasNext
-            act_page += 1
-            #da um tempo pra nao sobrecarregar a API
-            sleep(1)
-        return True
+                    #so irah salvar o que for categoria ou subcategoria
+                    if it.categoryType==1 or it.categoryType==2:
+                        writer.add({"origin_id": it.code, "name": it.name, "id_parent": it.parentCategoryCode})
+                has_next = bool(data.hasNext)
+                act_page += 1
+        self._invalidate_reference(writer)
+        return writer.counts()
 
     def get_representative(self):
         try:
             has_next = True
             act_page = 1
+            customers = []
 
             while has_next:
                 #se nao preencheu a lista de REPS buscarah tudo o que existe na API
@@ -176,208 +157,121 @@ class VirtualAge(erp.ERP):
                                     data=json.dumps(filter),
                                     headers=self._get_header()
                                     )
-                if req.status_code==200:
-                    #transforma a resposta em objeto
-                    data = self._as_object(req)
-                    #varre os itens
-                    for it in data.items:
-                        #connecta o BD
-                        with self.dbconn.connect() as conn:
-                            #verifica se ja existe cadastro importado ou se ja tem cadastro do CNPJ
-                            exist = conn.execute(Select(CmmLegalEntities).where(or_(CmmLegalEntities.origin_id==it.code,CmmLegalEntities.taxvat==it.cpfCnpj))).first()
-                            #se nao existir ira cadastrar
-                            if exist is None:
-                                res = conn.execute(Insert(CmmLegalEntities).values(
-                                    origin_id    = it.code,
-                                    name         = it.name,
-                                    fantasy_name = it.name,
-                                    taxvat       = it.cpfCnpj,
-                                    id_city      = self._get_id_city(it.addresses[0].ibgeCityCode,it.addresses[0].stateAbbreviation),
-                                    postal_code  = it.addresses[0].cep,
-                                    neighborhood = it.addresses[0].neighborhood,
-                                    address      = it.addresses[0].address +','+str(it.addresses[0].addressNumber),
-                                    type         = "R"
-                                ))
-                                conn.commit()
-
-                                #importa os emails do cadastro
-                                for em in it.emails:
-                                    inserted_id = res.inserted_primary_key[0] if hasattr(res, "inserted_primary_key") and res.inserted_primary_key else None
-                                    self.__save_contact(conn,em,"E",inserted_id)
-
-                                #importa os telefones do cadastro
-                                for ph in it.phones:
-                                    inserted_id = res.inserted_primary_key[0] if hasattr(res, "inserted_primary_key") and res.inserted_primary_key else None
-                                    self.__save_contact(conn,ph,"P",inserted_id)
-
-                                #importa os clientes do representante
-                                if it.customers is not None:
-                                    for cs in it.customers:
-                                        self.get_customer(False,cs.cpfCnpj)
-                            else:
-                                #aqui irah atualizar as informacoes de cadastro
-                                conn.execute(Update(CmmLegalEntities).values(
-                                    origin_id    = it.code if it.code!=exist.origin_id else exist.origin_id,
-                                    name         = it.name if it.name!=exist.name else exist.name,
-                                    fantasy_name = it.name if it.name!=exist.fantasy_name else exist.fantasy_name,
-                                    taxvat       = it.cpfCnpj if it.cpfCnpj!=exist.taxvat else exist.taxvat,
-                                    id_city      = self._get_id_city(it.addresses[0].ibgeCityCode,it.addresses[0].stateAbbreviation) if self._get_id_city(it.addresses[0].ibgeCityCode,it.addresses[0].stateAbbreviation)!=exist.id_city else exist.id_city,
-                                    postal_code  = it.addresses[0].cep if it.addresses[0].cep!=exist.postal_code else exist.postal_code,
-                                    neighborhood = it.addresses[0].neighborhood if it.addresses[0].neighborhood!=exist.neighborhood else exist.neighborhood,
-                                    address      = it.addresses[0].address+','+str(it.addresses[0].addressNumber) if it.addresses[0].address else exist.address
-                                ).where(CmmLegalEntities.id==exist.id))
-                                conn.commit()
-                                for em in it.emails:
-                                    exist = conn.execute(Select(CmmLegalEntityContact).where(CmmLegalEntityContact.value==em.email)).first()
-                                    if exist is not None:
-                                        self.__save_contact(conn,em,"E",(0 if exist is not None else exist.id))
-                                
-                                for ph in it.phones:
-                                    number = str(ph.number).replace(" ","").replace("(","").replace(")","").replace("-","")
-                                    exist = conn.execute(Select(CmmLegalEntityContact).where(CmmLegalEntityContact.value==number))
-                                    if exist is not None:
-                                        self.__save_contact(conn,ph,"P",(0 if exist is not None else exist.id))
-                                
-                                #importa os clientes do representante
-                                if it.customers is not None:
-                                    for cs in it.customers:
-                                        self.get_customer(False,cs.cpfCnpj)
-                else:
-                    # print(req.status_code)
-                    # print(req.text)
-                    has_next = False
+                if req.status_code!=200:
+                    break
+                #transforma a resposta em objeto
+                data = self._as_object(req)
+                self.__save_entities(data.items,"R",lambda it: it.cpfCnpj)
+                #clientes do representante sao importados ao final em uma unica busca
+                for it in data.items:
+                    if getattr(it,"customers",None) is not None:
+                        customers += [cs.cpfCnpj for cs in it.customers]
                 has_next = bool(data.hasNext)
                 act_page += 1
+
+            if len(customers) > 0:
+                for items in self.__fetch_customers(None,list(dict.fromkeys(customers))):
+                    self.__apply_customers(items)
+            return True
         except RequestException as e:
             print(e)
             return False
         
     def _get_id_city(self,p_ibge_code:str,p_state:str):
-        try:
-            with self.dbconn.connect() as con:
-                stmt = Select(SysCities)\
-                    .join(SysStateRegions,SysStateRegions.id==SysCities.id_state_region)\
-                    .where(
-                        and_(
-                            SysCities.brazil_ibge_code.like('%{}'.format(p_ibge_code)),
-                            SysStateRegions.acronym==p_state
-                        )
-                    )
-                ct = con.execute(stmt).one_or_none()
-                return ct.id if ct is not None else 0
-        except exc.SQLAlchemyError as e:
-            print(e)
-            return 0
+        id_city = GeoIndex.find_city_by_ibge(p_ibge_code)
+        if id_city!=0 or p_ibge_code is None:
+            return id_city
+        # o ERP pode enviar o codigo sem o digito inicial do estado
+        code = str(p_ibge_code).strip()
+        for ibge,id in GeoIndex.by_ibge.items():
+            if ibge.endswith(code) and GeoIndex.states.get(GeoIndex.cities[id]["id_state_region"],{}).get("acronym")==p_state:
+                return id
+        return 0
     
     def get_customer(self,all:bool=True,taxvat:str=""):
         try:
-            act_page = 1
-            has_next = True
-            while has_next:
+            if all:
+                # carga periodica: apenas os clientes alterados desde o ultimo watermark
+                return self._delta_sync("customers",self.__fetch_customers,self.__apply_customers)
+            for items in self.__fetch_customers(None,[taxvat]):
+                self.__apply_customers(items)
+            return True
+        except RequestException as e:
+            print(e)
+            return False
 
-                if not all:
-                    filter = {
-                        "filter":{
-                            "isCustomer": True,
-                            "isSupplier": False,
-                            "isRepresentative": False,
-                            "isPurchasingGuide": False,
-                            "isShippingCompany": False,
-                            "cnpjList": [taxvat]
-                        },
-                        "expand": "phones,emails,addresses",
-                        "page": act_page,
-                        "pageSize": 500
-                    }
-                else:
-                    filter = {
-                        "filter":{
-                            "isCustomer": True,
-                            "isSupplier": False,
-                            "isRepresentative": False,
-                            "isPurchasingGuide": False,
-                            "isShippingCompany": False
-                        },
-                        "expand": "phones,emails,addresses",
-                        "page": act_page,
-                        "pageSize": 500
-                    }
+    def __fetch_customers(self,since,taxvats:list[str]|None = None):
+        act_page = 1
+        has_next = True
+        while has_next:
+            filter = {
+                "filter":{
+                    "isCustomer": True,
+                    "isSupplier": False,
+                    "isRepresentative": False,
+                    "isPurchasingGuide": False,
+                    "isShippingCompany": False
+                },
+                "expand": "phones,emails,addresses",
+                "page": act_page,
+                "pageSize": 500
+            }
+            if taxvats is not None:
+                filter["filter"]["cnpjList"] = taxvats
+            if since is not None:
+                filter["filter"]["change"] = {"startDate": since.strftime("%Y-%m-%dT%H:%M:%S")}
 
-                req = self.nav.post(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/person/v2/legal-entities/search',headers=self._get_header(),data=json.dumps(filter))
-                if req.status_code==200:
-                    data = self._as_object(req)
-                    for it in data.items:
-                        with self.dbconn.connect() as conn:
-                            clear_cnpj = str(it.cnpj).replace(" ","").replace("/","").replace("-","").replace(".","")
-                            exist = conn.execute(Select(CmmLegalEntities).where(CmmLegalEntities.taxvat==clear_cnpj)).first()
-                            if exist is not None:
-                                resp = conn.execute(Insert(CmmLegalEntities).values(
-                                    origin_id = it.code,
-                                    name = it.name,
-                                    fantasy_name = it.name,
-                                    taxvat = clear_cnpj,
-                                    id_city = self._get_id_city(it.addresses[0].ibgeCityCode,it.addresses[0].stateAbbreviation),
-                                    postal_code = it.addresses[0].cep,
-                                    neighborhood = it.addresses[0].neighborhood,
-                                    address      = it.addresses[0].address +','+str(it.addresses[0].addressNumber),
-                                    type="C"
-                                ))
-                                conn.commit()
+            req = self.nav.post(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/person/v2/legal-entities/search',headers=self._get_header(),data=json.dumps(filter))
+            if req.status_code!=200:
+                raise RequestException("Falha ao buscar clientes ("+str(req.status_code)+"): "+req.text)
+            data = self._as_object(req)
+            yield data.items
+            has_next = bool(data.hasNext)
+            act_page += 1
 
-                                #importa os emails do cadastro
-                                for em in it.emails:
-                                    inserted_id = resp.inserted_primary_key[0] if hasattr(resp, "inserted_primary_key") and resp.inserted_primary_key else None
-                                    self.__save_contact(conn,em,"E",inserted_id)
+    def __apply_customers(self,items:list):
+        return self.__save_entities(items,"C",lambda it: it.cnpj)
 
-                                #importa os telefones do cadastro
-                                for ph in it.phones:
-                                    inserted_id = resp.inserted_primary_key[0] if hasattr(resp, "inserted_primary_key") and resp.inserted_primary_key else None
-                                    self.__save_contact(conn,ph,"P",inserted_id)
-                            else:
-                                resp = conn.execute(Update(CmmLegalEntities).values(
-                                    origin_id = it.code,
-                                    name = it.name,
-                                    fantasy_name = it.name,
-                                    id_city = self._get_id_city(it.addresses[0].ibgeCityCode,it.addresses[0].stateAbbreviation),
-                                    postal_code = it.addresses[0].cep,
-                                    neighborhood = it.addresses[0].neighborhood,
-                                    address      = it.addresses[0].address +','+str(it.addresses[0].addressNumber),
-                                    type="C"
-                                ).where(CmmLegalEntities.taxvat==clear_cnpj))
-                                conn.commit()
+    def __save_entities(self,items:list,entity_type:str,taxvat):
+        """ Grava o lote de clientes/representantes e depois os contatos de todos eles """
+        taxvats = [str(taxvat(it)).replace(" ","").replace("/","").replace("-","").replace(".","") for it in items]
+        with self._bulk_writer(CmmLegalEntities,["taxvat"],insert_values={"activation_date": date.today()}) as writer:
+            for it,clear_taxvat in zip(items,taxvats):
+                # cadastro sem endereco no ERP nao pode derrubar o lote (nem travar o watermark)
+                address = it.addresses[0] if len(it.addresses or []) > 0 else None
+                writer.add({
+                    "origin_id": it.code,
+                    "name": it.name,
+                    "fantasy_name": it.name,
+                    "taxvat": clear_taxvat,
+                    "id_city": 0 if address is None else self._get_id_city(address.ibgeCityCode,address.stateAbbreviation),
+                    "postal_code": "" if address is None else address.cep,
+                    "neighborhood": "" if address is None else address.neighborhood,
+                    "address": "" if address is None else address.address +','+str(address.addressNumber),
+                    "type": entity_type
+                })
 
-                                for em in it.emails:
-                                        exist = conn.execute(Select(CmmLegalEntityContact).where(CmmLegalEntityContact.value==em.email)).first()
-                                        if exist is not None:
-                                            self.__save_contact(conn,em,"E",exist.id)
-                                    
-                                for ph in it.phones:
-                                    number = str(ph.number).replace(" ","").replace("(","").replace(")","").replace("-","")
-                                    exist = conn.execute(Select(CmmLegalEntityContact).where(CmmLegalEntityContact.value==number)).first()
-                                    if exist is not None:
-                                        self.__save_contact(conn,ph,"P",exist.id)
+        # os contatos dependem do id gravado acima, por isso sao um segundo lote
+        with self._bulk_writer(CmmLegalEntityContact,["id_legal_entity","contact_type","value"]) as contacts:
+            for it,clear_taxvat in zip(items,taxvats):
+                id_entity = writer.ids.get((clear_taxvat,))
+                if id_entity is None:
+                    continue
+                for em in (it.emails or []):
+                    contacts.add(self.__contact(id_entity,em,"E"))
+                for ph in (it.phones or []):
+                    contacts.add(self.__contact(id_entity,ph,"P"))
+        return {"entities": writer.counts(), "contacts": contacts.counts()}
 
-                else:
-                    print(req.status_code)
-                    print(req.text)
-                    has_next = False
-                
-                has_next = data.hasNext
-                act_page += 1
-        except RequestException as e:
-            print(e)
-            return False
-    
-    def __save_contact(self,conn,obj,contact_type,id = None):
-        conn.execute(Insert(CmmLegalEntityContact).values(
-                id_legal_entity=id,
-                contact_type = contact_type,
-                is_whatsapp = False,
-                value = str(obj.email).replace(" ","") if contact_type=="E" else str(obj.number).replace(" ","").replace("(","").replace(")","").replace("-",""),
-                is_default = bool(obj.isDefault),
-                name = obj.typeName
-            ))
-        conn.commit()
+    def __contact(self,id_entity:int,obj,contact_type:str) -> dict:
+        return {
+            "id_legal_entity": id_entity,
+            "contact_type": contact_type,
+            "is_whatsapp": False,
+            "value": str(obj.email).replace(" ","") if contact_type=="E" else str(obj.number).replace(" ","").replace("(","").replace(")","").replace("-",""),
+            "is_default": bool(obj.isDefault),
+            "name": obj.typeName
+        }
 
     def create_order(self):
         
@@ -387,7 +281,10 @@ class VirtualAge(erp.ERP):
 
         pass
 
-    def get_invoice(self,_taxvat:str):
+    def get_invoice(self,_taxvat:str|None = None):
+        # as notas sao consultadas por cliente sob demanda, na carga periodica nao ha o que buscar
+        if _taxvat is None:
+            return None
         req = self.nav.post(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/fiscal/v2/invoices/search',
                       data={
                         "filter": {
@@ -411,24 +308,16 @@ class VirtualAge(erp.ERP):
 
     def get_measure_unit(self):
         try:
-            has_next = True
-            act_page = 1
-            while has_next:
-                req = self.nav.get(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/product/v2/measurement-unit',
-                            headers=self._get_header())
-                if req.status_code==200:
-                    data = self._as_object(req)
-                    with self.dbconn.connect() as con:
-                        for d in data.items:
-                            exist = con.execute(Select(CmmMeasureUnit).where(CmmMeasureUnit.code==d.code)).first()
-                            if exist is not None:
-                                con.execute(Insert(CmmMeasureUnit).values(code=d.code,description=d.description))
-                                con.commit()
-                else:
-                    has_next = False
-                has_next = data.hasNext
-                act_page += 1
-            return True
+            req = self.nav.get(str(environ.get("F2B_VIRTUALAGE_URL"))+'/api/totvsmoda/product/v2/measurement-unit',
+                               headers=self._get_header())
+            if req.status_code!=200:
+                return False
+            data = self._as_object(req)
+            with self._bulk_writer(CmmMeasureUnit,["code"]) as writer:
+                for d in data.items:
+                    writer.add({"code": d.code, "description": d.description})
+            self._invalidate_reference(writer)
+            return writer.counts()
         except RequestException:
             #print(e.strerror)
             return False
@@ -1,4 +1,5 @@
-from requests import Response,Session
+from requests import Response
+from integrations.http_client import HttpClient
 from werkzeug.datastructures import FileStorage
 from abc import abstractmethod,ABC
 from types import SimpleNamespace
@@ -15,7 +16,7 @@ class File(ABC):
     env = environ
 
     def __init__(self) -> None:
-        self.nav = Session()
+        self.nav = HttpClient(self.__class__.__module__.split(".")[-1])
         super().__init__()
 
     def _as_object(self,req:Response):
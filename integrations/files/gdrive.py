@@ -2,7 +2,6 @@ import json
 from pydrive.drive import GoogleDrive
 from pydrive.auth import GoogleAuth
 from googleapiclient.errors import HttpError
-import requests
 from integrations.files import file
 import logging
 from os import environ
@@ -44,7 +43,7 @@ class Gdrive(file.File):
                 url = 'https://www.googleapis.com/drive/v3/files/' + file_id + '/permissions?supportsAllDrives=true'
                 headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
                 payload = {'type': 'anyone', 'value': 'anyone', 'role': 'reader'}
-                res = requests.post(url, data=json.dumps(payload), headers=headers)
+                res = self.nav.post(url, data=json.dumps(payload), headers=headers)
                 if res.status_code==200:
                     self.link = 'https://drive.google.com/thumbnail?id='+file_drive['id']+'&sz=w1000'
 
@@ -0,0 +1,233 @@
+import time
+import random
+import logging
+from threading import Lock
+from os import environ, path
+from dotenv import load_dotenv
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout, RequestException
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# Todas as configuracoes abaixo podem ser sobrescritas por integracao acrescentando
+# o nome do modulo em maiusculas, ex.: F2B_HTTP_READ_TIMEOUT_BRASPRESS=60
+HTTP_DEFAULTS = {
+    "CONNECT_TIMEOUT": "5",   # segundos para abrir a conexao
+    "READ_TIMEOUT": "30",     # segundos aguardando a resposta
+    "RETRIES": "2",           # novas tentativas em falhas transitorias
+    "BACKOFF": "0.5",         # base (segundos) do backoff exponencial com jitter
+    "BACKOFF_MAX": "10",      # espera maxima entre tentativas
+    "RATE": "10",             # requisicoes por segundo (token bucket), 0 = sem limite
+    "BURST": "10",            # requisicoes acumuladas que podem sair de uma vez
+    "CB_FAILURES": "5",       # falhas seguidas que abrem o circuito
+    "CB_RESET": "60",         # segundos com o circuito aberto antes de testar de novo
+    "POOL_SIZE": "10"         # conexoes keep-alive mantidas por host
+}
+
+# valores padrao especificos de cada integracao (antes do .env)
+PROVIDER_DEFAULTS = {
+    # a API da TOTVS Moda bloqueia rajadas, antes havia um sleep(1) entre as paginas
+    "virtual_age": {"RATE": "1", "BURST": "1"}
+}
+
+# limites do histograma de latencia (segundos)
+LATENCY_BUCKETS = (0.05,0.1,0.25,0.5,1,2.5,5,10,30)
+
+# status que indicam que o servidor nao processou a requisicao e pode ser repetida
+RETRY_ALWAYS = (429,503)
+# status transitorios que soh sao repetidos em metodos idempotentes
+RETRY_IDEMPOTENT = (502,504)
+IDEMPOTENT_METHODS = ("GET","HEAD","OPTIONS","PUT","DELETE")
+
+
+class CircuitOpenError(RequestException):
+    """ O circuito da integracao estah aberto, a chamada nem chega a ser feita """
+
+
+def _not_sent(e:Exception) -> bool:
+    """ A falha ocorreu ao abrir a conexao, a requisicao nao chegou ao servidor """
+    if isinstance(e,ConnectTimeout):
+        return True
+    reason = getattr(e.args[0],"reason",None) if len(e.args) > 0 else None
+    return isinstance(reason,NewConnectionError)
+
+
+def _setting(provider:str,name:str) -> str:
+    value = environ.get("F2B_HTTP_"+name+"_"+provider.upper())
+    if value is None:
+        value = PROVIDER_DEFAULTS.get(provider,{}).get(name)
+    if value is None:
+        value = environ.get("F2B_HTTP_"+name,HTTP_DEFAULTS[name])
+    return str(value)
+
+
+class _Provider():
+    """ Estado compartilhado por todas as instancias de uma integracao no processo:
+        pool de conexoes, token bucket, circuit breaker e metricas """
+
+    def __init__(self,name:str) -> None:
+        self.name        = name
+        self.lock        = Lock()
+        self.timeout     = (float(_setting(name,"CONNECT_TIMEOUT")),float(_setting(name,"READ_TIMEOUT")))
+        self.retries     = int(_setting(name,"RETRIES"))
+        self.backoff     = float(_setting(name,"BACKOFF"))
+        self.backoff_max = float(_setting(name,"BACKOFF_MAX"))
+        self.rate        = float(_setting(name,"RATE"))
+        self.burst       = max(float(_setting(name,"BURST")),1)
+        self.cb_failures = int(_setting(name,"CB_FAILURES"))
+        self.cb_reset    = float(_setting(name,"CB_RESET"))
+        pool_size        = int(_setting(name,"POOL_SIZE"))
+        # o PoolManager do adapter mantem um pool keep-alive por host e eh thread-safe
+        self.adapter     = HTTPAdapter(pool_connections=pool_size,pool_maxsize=pool_size)
+        self.tokens      = self.burst
+        self.refill_at   = time.monotonic()
+        self.failures    = 0
+        self.opened_at   = None
+        self.stats       = {
+            "requests": 0,
+            "errors": 0,
+            "retries": 0,
+            "rejected": 0,
+            "sum": 0.0,
+            "buckets": [0 for _ in range(len(LATENCY_BUCKETS)+1)]
+        }
+
+    def acquire(self) -> None:
+        # token bucket: aguarda ate existir uma ficha disponivel
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst,self.tokens+(now-self.refill_at)*self.rate)
+                self.refill_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1-self.tokens)/self.rate
+            time.sleep(wait)
+
+    def allow(self) -> bool:
+        # circuito aberto rejeita ate passar o cb_reset, depois libera uma tentativa (meio aberto)
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic()-self.opened_at >= self.cb_reset:
+                self.opened_at = time.monotonic()
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record(self,elapsed:float,success:bool) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["sum"] += elapsed
+            idx = len(LATENCY_BUCKETS)
+            for i,limit in enumerate(LATENCY_BUCKETS):
+                if elapsed <= limit:
+                    idx = i
+                    break
+            self.stats["buckets"][idx] += 1
+            if success:
+                self.failures  = 0
+                self.opened_at = None
+            else:
+                self.stats["errors"] += 1
+                self.failures += 1
+                if self.failures >= self.cb_failures and self.opened_at is None:
+                    logging.warning("Circuito da integracao "+self.name+" aberto apos "+str(self.failures)+" falhas")
+                    self.opened_at = time.monotonic()
+
+    def delay(self,attempt:int,resp:Response|None) -> float:
+        if resp is not None and resp.headers.get("Retry-After","").isdigit():
+            return min(float(resp.headers["Retry-After"]),self.backoff_max)
+        # full jitter: espera aleatoria entre 0 e a janela exponencial
+        return random.uniform(0,min(self.backoff_max,self.backoff*(2**attempt)))
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            count = self.stats["requests"]
+            return {
+                "requests": count,
+                "errors": self.stats["errors"],
+                "retries": self.stats["retries"],
+                "rejected": self.stats["rejected"],
+                "avg_latency": round(self.stats["sum"]/count,4) if count > 0 else 0,
+                "circuit": "closed" if self.opened_at is None else "open",
+                "histogram": {
+                    ("le_"+str(limit) if i < len(LATENCY_BUCKETS) else "inf"): self.stats["buckets"][i]
+                    for i,limit in enumerate(list(LATENCY_BUCKETS)+[None])
+                }
+            }
+
+
+class HttpClient(Session):
+    """ Session de saida das integracoes. Cada instancia tem seus proprios headers/verify,
+        mas compartilha com as demais da mesma integracao o pool de conexoes, o limite
+        de requisicoes, o circuit breaker e as metricas """
+    _providers:dict = {}
+    _lock = Lock()
+
+    def __init__(self,provider:str) -> None:
+        super().__init__()
+        self.provider = HttpClient.get_provider(provider)
+        self.mount("https://",self.provider.adapter)
+        self.mount("http://",self.provider.adapter)
+
+    @classmethod
+    def get_provider(cls,name:str) -> _Provider:
+        with cls._lock:
+            if name not in cls._providers:
+                cls._providers[name] = _Provider(name)
+            return cls._providers[name]
+
+    @classmethod
+    def metrics(cls) -> dict:
+        """ Latencia (histograma), erros e estado do circuito de cada integracao """
+        with cls._lock:
+            providers = list(cls._providers.values())
+        return {p.name: p.snapshot() for p in providers}
+
+    def close(self) -> None:
+        # o adapter eh compartilhado, fechar a session nao pode derrubar o pool dos demais
+        self.adapters.clear()
+        super().close()
+
+    def request(self,method,url,*args,**kwargs) -> Response: # type: ignore
+        provider = self.provider
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = provider.timeout
+        method  = str(method).upper()
+        attempt = 0
+        while True:
+            if not provider.allow():
+                raise CircuitOpenError("Integracao "+provider.name+" indisponivel (circuito aberto)")
+            provider.acquire()
+            start = time.perf_counter()
+            resp  = None
+            try:
+                resp = super().request(method,url,*args,**kwargs)
+            except (ConnectionError,Timeout) as e:
+                provider.record(time.perf_counter()-start,False)
+                # em metodo nao idempotente soh repete se nada foi enviado, conexao abortada
+                # ou timeout de leitura podem ter sido processados (pedido/e-mail duplicado)
+                can_retry = method in IDEMPOTENT_METHODS or _not_sent(e)
+                if attempt >= provider.retries or not can_retry:
+                    raise
+            else:
+                failed = resp.status_code >= 500 or resp.status_code==429
+                provider.record(time.perf_counter()-start,not failed)
+                can_retry = resp.status_code in RETRY_ALWAYS or (resp.status_code in RETRY_IDEMPOTENT and method in IDEMPOTENT_METHODS)
+                if not can_retry or attempt >= provider.retries:
+                    return resp
+            with provider.lock:
+                provider.stats["retries"] += 1
+            wait = provider.delay(attempt,resp)
+            if resp is not None:
+                # devolve a conexao ao pool antes de esperar
+                resp.close()
+            time.sleep(wait)
+            attempt += 1
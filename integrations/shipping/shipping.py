@@ -3,17 +3,18 @@ from os import environ, path
 from dotenv import load_dotenv
 from types import SimpleNamespace
 from abc import abstractmethod, ABC
-from requests import Response, Session
+from requests import Response
+from integrations.http_client import HttpClient
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
 
 class Shipping(ABC):
-    nav:Session
+    nav:HttpClient
     env = environ
 
     def __init__(self) -> None:
-        self.nav = Session()
+        self.nav = HttpClient(self.__class__.__module__.split(".")[-1])
         super().__init__()
 
     def verify_nav(self,_verify:bool = False) -> None:
@@ -0,0 +1,122 @@
+import time
+import logging
+import importlib
+from os import environ, path
+from dotenv import load_dotenv
+from threading import Lock, local
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# numero maximo de consultas simultaneas as transportadoras (todas as requisicoes do processo)
+TRACKING_WORKERS = int(str(environ.get("F2B_TRACKING_WORKERS","8")))
+# tempo maximo (segundos) que a listagem aguarda as transportadoras antes de responder parcial
+TRACKING_TIMEOUT = float(str(environ.get("F2B_TRACKING_TIMEOUT","8")))
+# validade (segundos) do rastreio em cache, pode ser ajustada por transportadora
+# com F2B_TRACKING_TTL_<TRANSPORTADORA> (ex.: F2B_TRACKING_TTL_BRASPRESS=3600)
+TRACKING_TTL       = int(str(environ.get("F2B_TRACKING_TTL","1800")))
+# validade (segundos) de consultas sem retorno, para nao insistir a cada pagina
+TRACKING_FAIL_TTL  = int(str(environ.get("F2B_TRACKING_FAIL_TTL","300")))
+# notas mantidas no cache, ao atingir o limite saem as vencidas e depois as menos usadas
+TRACKING_CACHE_SIZE = int(str(environ.get("F2B_TRACKING_CACHE_SIZE","10000")))
+
+
+class TrackingService():
+    """ Consulta o rastreio de varias notas em paralelo em um pool limitado,
+        guardando o resultado por (transportadora, CNPJ, nota, serie) """
+    _executor = ThreadPoolExecutor(max_workers=TRACKING_WORKERS,thread_name_prefix="tracking")
+    _cache:OrderedDict = OrderedDict()
+    _pending:dict = {}
+    _lock = Lock()
+    _local = local()
+
+    @classmethod
+    def __ttl(cls,carrier:str,result) -> int:
+        if result is None or result is False:
+            return TRACKING_FAIL_TTL
+        return int(str(environ.get("F2B_TRACKING_TTL_"+carrier.upper(),TRACKING_TTL)))
+
+    @classmethod
+    def __store(cls,key:tuple,value:tuple) -> None:
+        # chamado com o _lock adquirido, a limpeza desce a 90% do limite para nao
+        # varrer o cache a cada nova nota
+        cls._cache[key] = value
+        cls._cache.move_to_end(key)
+        if len(cls._cache) <= TRACKING_CACHE_SIZE:
+            return
+        now = time.monotonic()
+        for k in [k for k,v in cls._cache.items() if v[1] <= now]:
+            del cls._cache[k]
+        while len(cls._cache) > max(int(TRACKING_CACHE_SIZE*0.9),1):
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def __carrier(cls,carrier:str):
+        # uma instancia (e uma Session HTTP) por transportadora em cada thread do pool
+        instances = getattr(cls._local,"instances",None)
+        if instances is None:
+            instances = cls._local.instances = {}
+        if carrier not in instances:
+            class_name = carrier.replace("_","").title().replace(" ","")
+            instances[carrier] = getattr(
+                importlib.import_module('integrations.shipping.'+carrier),
+                class_name
+            )()
+        return instances[carrier]
+
+    @classmethod
+    def __lookup(cls,key:tuple,tenant:str|None):
+        carrier,taxvat,invoice,serie = key
+        try:
+            result = cls.__carrier(carrier).tracking(taxvat,invoice,serie,_tenant=tenant)
+        except Exception as e:
+            logging.error("Falha no rastreio "+carrier+" nota "+str(invoice)+": "+str(e))
+            result = False
+        with cls._lock:
+            cls.__store(key,(result,time.monotonic()+cls.__ttl(carrier,result)))
+            cls._pending.pop(key,None)
+        return result
+
+    @staticmethod
+    def key(carrier:str|None,taxvat:str|None,invoice,serie) -> tuple|None:
+        if carrier is None or str(carrier).strip()=="" or invoice is None:
+            return None
+        return (str(carrier).lower().strip(),str(taxvat),str(invoice),None if serie is None else str(serie))
+
+    @classmethod
+    def track(cls,items:dict,tenant:str|None = None,timeout:float = TRACKING_TIMEOUT) -> dict:
+        """ Recebe {id: (transportadora, cnpj, nota, serie)} e retorna {id: rastreio}.
+            As consultas que nao terminarem no timeout retornam None e continuam em
+            segundo plano, ficando disponiveis no cache para a proxima chamada """
+        result  = {}
+        waiting = {}
+        now     = time.monotonic()
+        with cls._lock:
+            for id,item in items.items():
+                key = cls.key(*item)
+                if key is None:
+                    result[id] = None
+                    continue
+                cached = cls._cache.get(key)
+                if cached is not None and cached[1] > now:
+                    cls._cache.move_to_end(key)
+                    result[id] = cached[0]
+                    continue
+                # a mesma nota consultada por requisicoes simultaneas vai uma unica vez a transportadora
+                future = cls._pending.get(key)
+                if future is None:
+                    future = cls._pending[key] = cls._executor.submit(cls.__lookup,key,tenant)
+                waiting[id] = future
+
+        if len(waiting) > 0:
+            wait(list(set(waiting.values())),timeout=timeout)
+            for id,future in waiting.items():
+                result[id] = future.result() if future.done() else None
+        return result
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._cache.clear()
@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+from hashlib import sha1
+from contextlib import nullcontext
+from os import environ, path
+from dotenv import load_dotenv
+from threading import Event, Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+from integrations.http_client import HttpClient
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# pasta da fila, as mensagens sobrevivem a reinicios da aplicacao
+MAIL_PATH        = str(environ.get("F2B_APP_PATH"))+'assets/mail/'
+# brevo = envio real, stub = apenas registra no log e em memoria (testes/desenvolvimento)
+MAIL_TRANSPORT   = str(environ.get("F2B_MAIL_TRANSPORT","brevo"))
+# envios simultaneos para o provedor
+MAIL_WORKERS     = int(str(environ.get("F2B_MAIL_WORKERS","2")))
+# intervalo (segundos) entre as leituras da fila quando nao ha novas mensagens
+MAIL_POLL        = float(str(environ.get("F2B_MAIL_POLL","2")))
+# mensagens por segundo de cada tenant (token bucket) e rajada permitida
+MAIL_RATE        = float(str(environ.get("F2B_MAIL_RATE","5")))
+MAIL_BURST       = float(str(environ.get("F2B_MAIL_BURST","20")))
+# tentativas antes de mover a mensagem para failed/ e base/maximo do backoff (segundos)
+MAIL_RETRIES     = int(str(environ.get("F2B_MAIL_RETRIES","5")))
+MAIL_BACKOFF     = float(str(environ.get("F2B_MAIL_BACKOFF","30")))
+MAIL_BACKOFF_MAX = float(str(environ.get("F2B_MAIL_BACKOFF_MAX","3600")))
+# mensagens com o mesmo conteudo agrupadas em uma chamada (messageVersions da Brevo)
+MAIL_BATCH       = int(str(environ.get("F2B_MAIL_BATCH","50")))
+# mensagem em processamento ha mais que isso (segundos) eh de um processo que caiu
+MAIL_STALE       = int(str(environ.get("F2B_MAIL_STALE","600")))
+
+
+class MailError(Exception):
+    """ Falha no envio, permanent=True indica que nao adianta tentar de novo """
+    def __init__(self,message:str,permanent:bool = False) -> None:
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class BrevoTransport():
+    """ Envio pela API transacional da Brevo """
+    URL = "https://api.brevo.com/v3/smtp/email"
+
+    def __init__(self) -> None:
+        self.nav = HttpClient("brevo")
+
+    @staticmethod
+    def __api_key(msg:dict) -> str:
+        # a chave nao vai para a fila em disco, eh lida da configuracao do tenant no envio
+        # (mensagens gravadas por versoes anteriores ainda trazem a chave)
+        if msg.get("api_key"):
+            return msg["api_key"]
+        from common import _get_tenant_config
+        cfg = _get_tenant_config(msg["tenant"])
+        if cfg is None or not cfg["email_brevo_api_key"]:
+            raise MailError("Tenant "+msg["tenant"]+" sem chave da Brevo configurada",True)
+        return str(cfg["email_brevo_api_key"])
+
+    def send(self,messages:list[dict]) -> None:
+        first = messages[0]
+        api_key = self.__api_key(first)
+        content = {
+            "sender": first["sender"],
+            "subject": first["subject"],
+            "htmlContent": first["html"]
+        }
+        if len(first["attachments"]) > 0:
+            content["attachment"] = first["attachments"]
+        if len(messages)==1:
+            content["to"] = [{"email": e} for e in first["to"]]
+            if len(first["cc"]) > 0:
+                content["cc"] = [{"email": e} for e in first["cc"]]
+        else:
+            # cada mensagem do lote vira uma versao com os proprios destinatarios
+            content["messageVersions"] = [dict(
+                {"to": [{"email": e} for e in m["to"]]},
+                **({"cc": [{"email": e} for e in m["cc"]]} if len(m["cc"]) > 0 else {})
+            ) for m in messages]
+
+        resp = self.nav.post(self.URL,json=content,headers={
+            'accept':'application/json',
+            'content-type': 'application/json',
+            'api-key': api_key
+        })
+        if resp.status_code >= 300:
+            # 4xx (exceto 429) eh erro da mensagem ou da chave, repetir nao resolve
+            permanent = 400 <= resp.status_code < 500 and resp.status_code!=429
+            raise MailError("Brevo "+str(resp.status_code)+": "+resp.text,permanent)
+
+
+class StubTransport():
+    """ Transporte local: nao envia nada, guarda as mensagens para conferencia """
+    def __init__(self) -> None:
+        self.sent:list = []
+        self.lock = Lock()
+
+    def send(self,messages:list[dict]) -> None:
+        with self.lock:
+            self.sent += messages
+        for m in messages:
+            logging.info("E-mail (stub) '"+m["subject"]+"' para "+",".join(m["to"]))
+
+
+class MailQueue():
+    """ Fila de saida de e-mails
+
+        As requisicoes apenas gravam a mensagem em pending/. Um despachante por processo le
+        a fila, aplica o limite de envio de cada tenant, agrupa mensagens com o mesmo
+        conteudo e envia no pool de workers. Para evitar envio duplicado entre processos
+        a mensagem eh reservada com um rename atomico para processing/ """
+    transport = StubTransport() if MAIL_TRANSPORT=="stub" else BrevoTransport()
+    _executor = ThreadPoolExecutor(max_workers=MAIL_WORKERS,thread_name_prefix="mail")
+    _wakeup = Event()
+    _lock = Lock()
+    _thread:Thread|None = None
+    _buckets:dict = {}
+    _app = None
+
+    @staticmethod
+    def __dir(name:str) -> str:
+        return MAIL_PATH+name+'/'
+
+    @classmethod
+    def __write(cls,folder:str,msg:dict) -> None:
+        tmp = cls.__dir(folder)+msg["id"]+'.tmp'
+        with open(tmp,"w") as f:
+            json.dump(msg,f)
+        os.replace(tmp,cls.__dir(folder)+msg["id"]+'.json')
+
+    @classmethod
+    def enqueue(cls,tenant:str,sender:dict,to:list,cc:list,subject:str,html:str,attachments:list|None = None) -> str:
+        """ Grava a mensagem na fila e retorna o id, o envio acontece em segundo plano """
+        cls.start()
+        msg = {
+            # o prefixo de tempo mantem a fila em ordem de chegada
+            "id": '{:016d}'.format(time.time_ns()//1000)+'_'+uuid.uuid4().hex,
+            "tenant": str(tenant),
+            "sender": sender,
+            "to": [str(t).strip() for t in to],
+            "cc": [str(c).strip() for c in cc],
+            "subject": subject,
+            "html": html,
+            "attachments": attachments or [],
+            "attempts": 0,
+            "next_try": 0,
+            "error": None
+        }
+        cls.__write("pending",msg)
+        cls._wakeup.set()
+        return msg["id"]
+
+    @classmethod
+    def start(cls,app = None) -> None:
+        """ Cria as pastas da fila e inicia o despachante do processo (uma unica vez),
+            app eh a aplicacao Flask usada para ler a configuracao do tenant no envio """
+        if app is not None:
+            cls._app = app
+        if cls._thread is not None:
+            return
+        with cls._lock:
+            if cls._thread is not None:
+                return
+            for folder in ("pending","processing","failed"):
+                os.makedirs(cls.__dir(folder),exist_ok=True)
+            cls._thread = Thread(target=cls.__dispatch,name="mail-dispatcher",daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def __allow(cls,tenant:str) -> bool:
+        # token bucket por tenant, sem ficha a mensagem espera a proxima rodada
+        if MAIL_RATE <= 0:
+            return True
+        now = time.monotonic()
+        tokens,at = cls._buckets.get(tenant,(MAIL_BURST,now))
+        tokens = min(MAIL_BURST,tokens+(now-at)*MAIL_RATE)
+        if tokens < 1:
+            cls._buckets[tenant] = (tokens,now)
+            return False
+        cls._buckets[tenant] = (tokens-1,now)
+        return True
+
+    @classmethod
+    def __recover(cls) -> None:
+        # devolve para a fila mensagens reservadas por um processo que nao terminou
+        now = time.time()
+        for f in os.listdir(cls.__dir("processing")):
+            file = cls.__dir("processing")+f
+            try:
+                if f.endswith(".json") and now-path.getmtime(file) > MAIL_STALE:
+                    os.replace(file,cls.__dir("pending")+f)
+            except OSError:
+                pass
+
+    @staticmethod
+    def __batch_key(msg:dict) -> str|None:
+        # anexos nao entram em lote para nao multiplicar o tamanho da chamada
+        if len(msg["attachments"]) > 0:
+            return None
+        return sha1("|".join([msg["tenant"],json.dumps(msg["sender"],sort_keys=True),
+                              msg["subject"],msg["html"]]).encode()).hexdigest()
+
+    @classmethod
+    def __collect(cls) -> list[list[dict]]:
+        """ Reserva as mensagens prontas para envio e agrupa as de mesmo conteudo """
+        now = time.time()
+        groups:dict = {}
+        single = []
+        for f in sorted(os.listdir(cls.__dir("pending"))):
+            if not f.endswith(".json"):
+                continue
+            try:
+                with open(cls.__dir("pending")+f) as fp:
+                    msg = json.load(fp)
+            except (OSError,ValueError):
+                continue
+            if msg["next_try"] > now or not cls.__allow(msg["tenant"]):
+                continue
+            try:
+                # quem conseguir o rename eh o dono da mensagem
+                os.rename(cls.__dir("pending")+f,cls.__dir("processing")+f)
+            except OSError:
+                continue
+            try:
+                # o rename mantem o mtime da ultima falha, o __recover mede a reserva a partir daqui
+                os.utime(cls.__dir("processing")+f)
+            except OSError:
+                pass
+            key = cls.__batch_key(msg)
+            if key is None:
+                single.append([msg])
+                continue
+            groups.setdefault(key,[]).append(msg)
+            if len(groups[key]) >= MAIL_BATCH:
+                single.append(groups.pop(key))
+        return single + list(groups.values())
+
+    @classmethod
+    def __release(cls,msg:dict) -> None:
+        # falha aqui nao eh falha de envio, a mensagem nao pode voltar para a fila
+        try:
+            os.remove(cls.__dir("processing")+msg["id"]+'.json')
+        except OSError as e:
+            logging.warning("Falha ao liberar o e-mail "+msg["id"]+": "+str(e))
+
+    @classmethod
+    def __send(cls,messages:list[dict]) -> None:
+        try:
+            with cls._app.app_context() if cls._app is not None else nullcontext():
+                cls.transport.send(messages)
+        except Exception as e:
+            permanent = isinstance(e,MailError) and e.permanent
+            logging.error("Falha no envio de e-mail ("+str(len(messages))+" mensagens): "+str(e))
+            for m in messages:
+                # mensagens antigas gravavam a chave da Brevo, ela nao volta para o disco
+                m.pop("api_key",None)
+                m["attempts"] += 1
+                m["error"] = str(e)
+                # backoff exponencial com jitter para nao repetir todas juntas
+                wait = min(MAIL_BACKOFF_MAX,MAIL_BACKOFF*(2**(m["attempts"]-1)))
+                m["next_try"] = time.time()+random.uniform(wait/2,wait)
+                folder = "failed" if permanent or m["attempts"] >= MAIL_RETRIES else "pending"
+                cls.__write(folder,m)
+                cls.__release(m)
+            cls._wakeup.set()
+            return
+        for m in messages:
+            cls.__release(m)
+
+    @classmethod
+    def __dispatch(cls) -> None:
+        cls.__recover()
+        while True:
+            cls._wakeup.wait(MAIL_POLL)
+            cls._wakeup.clear()
+            try:
+                for messages in cls.__collect():
+                    cls._executor.submit(cls.__send,messages)
+            except Exception as e:
+                logging.error("Falha ao ler a fila de e-mails: "+str(e))
+
+    @classmethod
+    def stats(cls) -> dict:
+        """ Quantidade de mensagens em cada etapa da fila """
+        return {folder: len([f for f in os.listdir(cls.__dir(folder)) if f.endswith(".json")])
+                if path.exists(cls.__dir(folder)) else 0
+                for folder in ("pending","processing","failed")}
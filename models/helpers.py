@@ -1,16 +1,42 @@
 import json
-from os import popen
-from sqlalchemy import text
+import time
+import base64
+import binascii
+import logging
+from hashlib import sha1
+from decimal import Decimal
+from threading import Lock
+from datetime import date, datetime
+from os import environ, path
+from sqlalchemy import text, event, create_engine, Engine
+from sqlalchemy import Select, asc, desc, func, literal, tuple_
+from contextvars import ContextVar
 from flask_migrate import Migrate
 from types import SimpleNamespace
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import InternalError
-from sqlalchemy.schema import CreateSchema
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.schema import CreateSchema, CreateTable, CreateIndex, SetTableComment, SetColumnComment
 from sqlalchemy.orm import sessionmaker, scoped_session
 
 db = SQLAlchemy()
 migrate = Migrate()
 
+# schema (tenant) da requisicao corrente, aplicado na conexao quando ela sai do pool
+_tenant_schema:ContextVar[str] = ContextVar("tenant_schema",default="public")
+
+# total de registros das listagens paginadas por (tenant, hash do filtro)
+COUNT_CACHE_TTL  = int(str(environ.get("F2B_COUNT_CACHE_TTL","30")))
+COUNT_CACHE_SIZE = int(str(environ.get("F2B_COUNT_CACHE_SIZE","5000")))
+
+_count_cache:dict = {}
+_count_lock = Lock()
+
+# migracoes dos schemas de tenant, relativas a raiz do projeto e nao ao diretorio corrente
+TENANT_MIGRATIONS = path.join(path.dirname(path.dirname(path.abspath(__file__))),
+                              str(environ.get("F2B_TENANT_MIGRATIONS","migrations/tenant")))
+
 def _get_params(search:str|None):
     if search is not None:
         # verifica se existem os pipes de separacao
@@ -48,9 +74,211 @@ def _get_params(search:str|None):
                 return json.loads(p_obj,object_hook=lambda d: SimpleNamespace(**d))
     return None
 
+def _get_tenant() -> str:
+    """schema of the current request (set by Database.switch_schema)"""
+    return _tenant_schema.get()
+
 def _show_query(rquery):
     print(rquery.compile(compile_kwargs={"literal_binds": True}))
 
+def _get_db_url() -> str:
+    conn = str(environ.get("F2B_DB_LIB"))+"://"
+    conn += str(environ.get("F2B_DB_USER"))+":"
+    conn += str(environ.get("F2B_DB_PASS"))+"@"
+    conn += str(environ.get("F2B_DB_HOST"))+"/"
+    conn += str(environ.get("F2B_DB_NAME"))
+    return conn
+
+class QueryPage:
+    """one page of a select, with the same attributes of flask-sqlalchemy's Pagination"""
+
+    def __init__(self,items:list,total:int,page:int,per_page:int) -> None:
+        self.items    = items
+        self.total    = total
+        self.page     = page
+        self.per_page = per_page
+        self.pages    = (total + per_page - 1)//per_page if per_page > 0 else 0
+        self.has_next = page < self.pages
+
+def _count_key(rquery:Select) -> tuple:
+    # importado aqui porque o ref_cache depende deste modulo
+    from ref_cache import RefCache
+    compiled = rquery.compile(dialect=db.engine.dialect)
+    filter_hash = sha1((str(compiled)+repr(sorted(compiled.params.items()))).encode()).hexdigest()
+    # a versao de gravacao do tenant muda a cada commit, o total antigo fica inalcancavel
+    return (_tenant_schema.get(),RefCache.table_versions(["*"])[0],filter_hash)
+
+def _get_count(key:tuple) -> int|None:
+    with _count_lock:
+        entry = _count_cache.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+def _set_count(key:tuple,total:int) -> None:
+    now = time.monotonic()
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            for k in [k for k,v in _count_cache.items() if v[1] <= now] or list(_count_cache.keys())[0:COUNT_CACHE_SIZE//10+1]:
+                del _count_cache[k]
+        _count_cache[key] = (total,now + COUNT_CACHE_TTL)
+
+def _paginate(rquery:Select,page:int,per_page:int) -> QueryPage:
+    """fetch one page and the total of registers in a single round trip
+
+    The total comes from a count(*) over() window column added to the page
+    query and is cached per (tenant, write version, filter hash) for
+    COUNT_CACHE_TTL seconds, so the next pages of the same listing run only
+    the data query and any write of the tenant recounts.
+    """
+    page   = max(page,1)
+    key    = _count_key(rquery)
+    total  = _get_count(key)
+    offset = (page - 1) * per_page
+
+    if total is not None:
+        return QueryPage(db.session.execute(rquery.limit(per_page).offset(offset)).all(),total,page,per_page)
+
+    # o window function eh calculado antes do DISTINCT, nesse caso conta em separado
+    if rquery._distinct:
+        total = db.session.execute(Select(func.count()).select_from(rquery.order_by(None).subquery())).scalar() or 0
+        items = db.session.execute(rquery.limit(per_page).offset(offset)).all()
+    else:
+        items = db.session.execute(rquery.add_columns(func.count().over().label("total_registers"))
+                                   .limit(per_page).offset(offset)).all()
+        if len(items) > 0:
+            total = items[0].total_registers
+        elif page > 1:
+            # pagina apos o final nao traz linhas para ler o total
+            total = db.session.execute(Select(func.count()).select_from(rquery.order_by(None).subquery())).scalar() or 0
+        else:
+            total = 0
+    _set_count(key,total)
+    return QueryPage(items,total,page,per_page)
+
+def _encode_cursor(values:list) -> str:
+    """opaque token with the sort values of the last row of a keyset page"""
+    return base64.urlsafe_b64encode(json.dumps(values,default=str).encode()).decode()
+
+def _decode_cursor(cursor:str|None,columns:list) -> list|None:
+    """sort values of a cursor token converted back to the columns python types
+
+    Raises ValueError when the token was not produced by _encode_cursor for
+    these columns.
+    """
+    if cursor is None or cursor=="":
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error,UnicodeDecodeError,ValueError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values,list) or len(values)!=len(columns) or any(v is None for v in values):
+        raise ValueError("invalid cursor")
+    result = []
+    for col,value in zip(columns,values):
+        try:
+            ptype = col.type.python_type
+        except NotImplementedError:
+            ptype = None
+        try:
+            if ptype in (datetime,date):
+                value = ptype.fromisoformat(value)
+            elif ptype is Decimal:
+                value = Decimal(str(value))
+        except (TypeError,ValueError,ArithmeticError) as e:
+            raise ValueError("invalid cursor") from e
+        result.append(value)
+    return result
+
+def _keyset_page(rquery:Select,order_col,id_col,descending:bool,cursor:str|None,per_page:int):
+    """fetch one keyset (cursor) page without OFFSET or COUNT
+
+    The query is ordered by (order_col, id_col) and filtered to the rows after
+    the cursor. One extra row is fetched to know if there is a next page.
+    Only NOT NULL columns present in the select can be used as keys.
+    Returns the page rows and the pagination dict, raises ValueError for an
+    unsupported column or an invalid cursor.
+    """
+    columns = [order_col,id_col] if order_col is not id_col else [id_col]
+    selected = rquery.selected_columns.keys()
+    for c in columns:
+        # NULL no cursor faria a comparacao de tupla virar NULL e a listagem acabaria antes da hora
+        if c.key not in selected or getattr(c.expression,"nullable",True):
+            raise ValueError("column "+str(c.key)+" can not be used for keyset pagination")
+    direction = desc if descending else asc
+    rquery = rquery.order_by(None).order_by(*[direction(c) for c in columns])
+
+    last = _decode_cursor(cursor,columns)
+    if last is not None:
+        key = tuple_(*columns) if len(columns) > 1 else columns[0]
+        val = tuple_(*[literal(v,c.type) for v,c in zip(last,columns)]) if len(columns) > 1 else literal(last[0],columns[0].type)
+        rquery = rquery.where(key < val if descending else key > val)
+
+    rows = db.session.execute(rquery.limit(per_page+1)).all()
+    has_next = len(rows) > per_page
+    rows = rows[0:per_page]
+    return rows, {
+        "per_page": per_page,
+        "has_next": has_next,
+        "next_cursor": _encode_cursor([getattr(rows[-1],c.key) for c in columns]) if has_next else None
+    }
+
+
+class EngineRegistry:
+    """process-wide pooled engine for batch jobs and integrations
+
+    All callers share a single connection pool. Tenant engines are views of
+    that pool with a schema_translate_map, created once per tenant and
+    cached, so a batch over many tenants never opens one pool per tenant.
+    """
+    _engine:Engine|None = None
+    _tenants:dict = {}
+    _lock = Lock()
+
+    @classmethod
+    def get_engine(cls,schema:str|None = None) -> Engine:
+        """return the shared engine, scoped to the tenant schema when informed"""
+        with cls._lock:
+            if cls._engine is None:
+                cls._engine = create_engine(_get_db_url(),
+                    pool_size=int(str(environ.get("F2B_DB_POOL_SIZE","5"))),
+                    max_overflow=int(str(environ.get("F2B_DB_MAX_OVERFLOW","10"))),
+                    pool_timeout=int(str(environ.get("F2B_DB_POOL_TIMEOUT","30"))),
+                    pool_recycle=int(str(environ.get("F2B_DB_POOL_RECYCLE","280"))),
+                    pool_pre_ping=True)
+            if schema is None:
+                return cls._engine
+            if schema not in cls._tenants:
+                cls._tenants[schema] = cls._engine.execution_options(
+                    schema_translate_map={None: str(schema)}
+                )
+            return cls._tenants[schema]
+
+    @classmethod
+    def dispose(cls) -> None:
+        """close every pooled connection (end of batch or process)"""
+        with cls._lock:
+            if cls._engine is not None:
+                cls._engine.dispose()
+            cls._engine = None
+            cls._tenants = {}
+
+    @classmethod
+    def stats(cls) -> dict:
+        """pool usage numbers for logs and monitoring"""
+        if cls._engine is None:
+            return {"active": False}
+        pool = cls._engine.pool
+        return {
+            "active": True,
+            "tenants": len(cls._tenants),
+            "size": pool.size(), # type: ignore
+            "checked_in": pool.checkedin(), # type: ignore
+            "checked_out": pool.checkedout(), # type: ignore
+            "overflow": pool.overflow(), # type: ignore
+            "status": pool.status()
+        }
+
 
 class Database:
     """used for managing tenant databases related operations"""
@@ -88,42 +316,153 @@ class Database:
         db.metadata.create_all(self.get_engine())
 
     def switch_schema(self):
-        """switch between tenant/public database schema"""
-        db.session.execute(text(f'set search_path to "{self.schema}"'))
-        db.session.commit()
-
-    def migrate_tenant_schema(self):
-        """migrate tenant database schema for new tenant"""
-        # Get the current revision for a database.
-        # NOTE: using popen may have a minor performance impact on the application
-        # you can store it in a different table in public schema and use it from there
-        # may be a faster approach
-        last_revision = popen("flask db heads -d migrations/tenant").read()
-        last_revision = last_revision.splitlines()[-1].split(" ")[0]
-
-        # creating revision table in tenant schema
-        session = self.get_session()
-        session.execute(
-            text(
-                f'CREATE TABLE "{self.schema}".alembic_version (version_num '
-                "VARCHAR(32) NOT NULL)"
-            )
-        )
-        session.commit()
-
-        # Insert last revision to alembic_version table
-        session.execute(
-            text(
-                f'INSERT INTO "{self.schema}".alembic_version (version_num) '
-                "VALUES (:version)"
-            ),
-            {"version": last_revision},
-        )
-        session.commit()
-        session.close()
+        """switch between tenant/public database schema
+
+        Only records the schema for the current context. The search_path is
+        applied on pool checkout and only when the connection was last used
+        by a different schema (see register_tenant_routing).
+        """
+        _tenant_schema.set(self.schema)
+
+        # se a sessao jah possui uma conexao em uso aplica imediatamente
+        if db.session.in_transaction():
+            conn = db.session.connection()
+            if conn.info.get("search_path")!=self.schema:
+                conn.execute(text(f'set search_path to "{self.schema}"'))
+                conn.info["search_path"] = self.schema
+                db.session.commit()
+
+    @staticmethod
+    def register_tenant_routing(engine):
+        """set the tenant search_path once per pooled connection
+
+        The schema currently applied is cached in the connection record, so
+        requests that reuse a connection of the same tenant cost no round trip.
+        """
+        @event.listens_for(engine,"connect")
+        def _on_connect(dbapi_connection,connection_record):
+            connection_record.info.pop("search_path",None)
+
+        @event.listens_for(engine,"checkout")
+        def _on_checkout(dbapi_connection,connection_record,connection_proxy):
+            schema = _tenant_schema.get()
+            if connection_record.info.get("search_path")!=schema:
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f'set search_path to "{schema}"')
+                cursor.close()
+                # sem o commit o rollback da devolucao ao pool desfaz o set
+                dbapi_connection.commit()
+                connection_record.info["search_path"] = schema
+
+    def migrate_tenant_schema(self,conn = None):
+        """stamp the tenant with the current alembic head
+
+        The revision of every tenant lives in public.sys_tenant_revision (see
+        tenant_migrate.py) instead of one alembic_version table per schema.
+        The head comes from TenantTemplate, read once per process instead of
+        forking `flask db heads` on every new tenant. An unresolved head raises
+        RuntimeError, a tenant without a revision record would later be
+        refused by tenant_migrate.py until its revision is recorded by hand.
+        """
+        last_revision = TenantTemplate.head()
+        if last_revision is None:
+            raise RuntimeError("Revisao das migracoes de tenant indisponivel em "+TENANT_MIGRATIONS)
+        if conn is None:
+            with EngineRegistry.get_engine().begin() as own:
+                return self.migrate_tenant_schema(own)
+        from models.public import SysTenantRevision
+        stmt = pg_insert(SysTenantRevision).values(id_customer=self.schema,revision=last_revision,
+                                                   status='O',error=None,date_updated=datetime.now())
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[SysTenantRevision.id_customer],
+            set_={
+                "revision": stmt.excluded.revision,
+                "status": stmt.excluded.status,
+                "error": stmt.excluded.error,
+                "date_updated": stmt.excluded.date_updated
+            }
+        ))
 
     def create_tenant_schema(self):
-        """create tenant used for creating new schema and its tables"""
-        self.create_schema()
-        self.create_tables()
-        self.migrate_tenant_schema()
\ No newline at end of file
+        """create the tenant schema, its tables and revision in a single transaction
+
+        The DDL of every tenant table is compiled once per process by
+        TenantTemplate and sent as one script, so a new tenant costs one round
+        trip instead of a catalog lookup and a CREATE per table. A failure
+        rolls back everything, leaving no half-built schema behind.
+        """
+        if TenantTemplate.head() is None:
+            # falha antes de criar qualquer coisa, sem revisao o schema ficaria orfao
+            raise RuntimeError("Revisao das migracoes de tenant indisponivel em "+TENANT_MIGRATIONS)
+        with EngineRegistry.get_engine().begin() as conn:
+            conn.execute(CreateSchema(self.schema,if_not_exists=True))
+            # SET LOCAL vale apenas nesta transacao, a conexao volta limpa ao pool
+            conn.execute(text(f'SET LOCAL search_path TO "{self.schema}"'))
+            conn.execution_options(no_parameters=True).exec_driver_sql(TenantTemplate.script())
+            self.migrate_tenant_schema(conn)
+
+
+class TenantTemplate:
+    """process-wide template used to provision tenant schemas
+
+    Holds the compiled DDL of the tenant metadata (tables, indexes and
+    comments, unqualified so it runs under the new schema search_path) and
+    the alembic head of the tenant migrations.
+    """
+    _script:str|None = None
+    _head:str|None = None
+    _head_loaded = False
+    _lock = Lock()
+
+    @classmethod
+    def script(cls) -> str:
+        """DDL script that creates every tenant table"""
+        if cls._script is None:
+            with cls._lock:
+                if cls._script is None:
+                    dialect = postgresql.dialect()
+                    statements = []
+                    for table in db.metadata.sorted_tables:
+                        if table.schema is not None:
+                            continue
+                        statements.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+                        for index in sorted(table.indexes,key=lambda i: str(i.name)):
+                            statements.append(str(CreateIndex(index).compile(dialect=dialect)).strip())
+                        if table.comment is not None:
+                            statements.append(str(SetTableComment(table).compile(dialect=dialect)).strip())
+                        for column in table.columns:
+                            if column.comment is not None:
+                                statements.append(str(SetColumnComment(column).compile(dialect=dialect)).strip())
+                    cls._script = ";\n".join(statements)+";"
+        return cls._script
+
+    @classmethod
+    def head(cls) -> str|None:
+        """alembic head of the tenant migrations (F2B_TENANT_HEAD overrides), None when unresolved"""
+        if cls._head_loaded:
+            return cls._head
+        with cls._lock:
+            if not cls._head_loaded:
+                head = environ.get("F2B_TENANT_HEAD")
+                if head is None:
+                    try:
+                        from alembic.config import Config
+                        from alembic.script import ScriptDirectory
+                        config = Config()
+                        config.set_main_option("script_location",TENANT_MIGRATIONS)
+                        head = ScriptDirectory.from_config(config).get_current_head()
+                    except Exception as e:
+                        logging.error("Revisao das migracoes de tenant indisponivel: "+str(e))
+                        head = None
+                cls._head = head
+                # a falha nao fica guardada, a proxima chamada tenta de novo
+                cls._head_loaded = head is not None
+        return cls._head
+
+    @classmethod
+    def reset(cls) -> None:
+        """forget the cached script and head (after a deploy of new migrations)"""
+        with cls._lock:
+            cls._script = None
+            cls._head = None
+            cls._head_loaded = False
@@ -221,4 +221,25 @@ class SysConfig(dbForModel.Model):
     erp_client_id       = Column(String(100),nullable=True)
     erp_client_secret   = Column(String(255),nullable=True)
     erp_username        = Column(String(255),nullable=True)
-    erp_password        = Column(String(255),nullable=True)
\ No newline at end of file
+    erp_password        = Column(String(255),nullable=True)
+class SysErpSync(dbForModel.Model):
+    __bind_key__    = "public"
+    __table_args__  = {"schema":"public"}
+    id              = Column(Integer,primary_key=True,nullable=False,autoincrement=True,index=True)
+    id_customer     = Column(ForeignKey(SysCustomer.id),nullable=False,index=True,comment="Id da tabela SysCustomer")
+    entity          = Column(String(50),nullable=False,comment="Entidade sincronizada (products, customers, representatives...)")
+    watermark       = Column(String(100),nullable=True,comment="Data/hora ou cursor da ultima alteracao jah importada do ERP")
+    records         = Column(Integer,nullable=False,default=0,comment="Registros aplicados na ultima sincronizacao")
+    last_sync       = Column(DateTime,nullable=True)
+
+IDX_ERP_SYNC = Index("IDX_ERP_SYNC",SysErpSync.id_customer,SysErpSync.entity,unique=True)
+
+class SysTenantRevision(dbForModel.Model):
+    __bind_key__    = "public"
+    __table_args__  = {"schema":"public"}
+    id_customer     = Column(ForeignKey(SysCustomer.id),primary_key=True,nullable=False,comment="Id da tabela SysCustomer (nome do schema do tenant)")
+    revision        = Column(String(32),nullable=True,comment="Ultima revisao das migracoes de tenant aplicada no schema")
+    status          = Column(CHAR(1),nullable=False,server_default='O',default='O',comment="O = OK, F = Falha na ultima migracao")
+    error           = Column(String(1000),nullable=True,comment="Erro da ultima migracao com falha")
+    duration        = Column(DECIMAL(10,3),nullable=True,comment="Segundos gastos na ultima migracao")
+    date_updated    = Column(DateTime,nullable=True)
@@ -0,0 +1,299 @@
+import json
+import time
+import logging
+from hashlib import sha1
+from functools import wraps
+from threading import Lock
+from collections import OrderedDict
+from os import environ, path
+from dotenv import load_dotenv
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.helpers import _get_tenant
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# lru = memoria do processo (um unico no), redis = compartilhado entre nos,
+# local = dicionario simples para testes, none = desliga o cache
+REF_CACHE_BACKEND = str(environ.get("F2B_REF_CACHE_BACKEND","lru"))
+# respostas mantidas no lru e tempo (segundos) de cada resposta em qualquer backend
+REF_CACHE_SIZE    = int(str(environ.get("F2B_REF_CACHE_SIZE","2048")))
+REF_CACHE_TTL     = int(str(environ.get("F2B_REF_CACHE_TTL","600")))
+REDIS_URL         = str(environ.get("F2B_REDIS_URL","redis://localhost:6379/0"))
+REF_CACHE_PREFIX  = "f2b:ref:"
+
+
+class LRUBackend():
+    """ Cache em memoria do processo, descarta o menos usado ao atingir o limite """
+    shared = False
+
+    def __init__(self,size:int = REF_CACHE_SIZE) -> None:
+        self.size     = max(size,1)
+        self.lock     = Lock()
+        self.entries  = OrderedDict()
+        self.versions:dict = {}
+
+    def get(self,key:str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self,key:str,value,ttl:int) -> None:
+        with self.lock:
+            self.entries[key] = (value,time.monotonic()+ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def version(self,tenant:str) -> int:
+        with self.lock:
+            return self.versions.get(tenant,0)
+
+    def many(self,keys:list) -> list:
+        with self.lock:
+            return [self.versions.get(k,0) for k in keys]
+
+    def bump(self,tenant:str) -> int:
+        with self.lock:
+            self.versions[tenant] = self.versions.get(tenant,0)+1
+            return self.versions[tenant]
+
+
+class RedisBackend():
+    """ Cache compartilhado entre os nos, as respostas sao gravadas em JSON com TTL
+        e o contador de versao de cada tenant eh um INCR atomico """
+    shared = True
+
+    def __init__(self,url:str = REDIS_URL) -> None:
+        from redis import Redis
+        self.client = Redis.from_url(url,socket_timeout=1,socket_connect_timeout=1)
+
+    def get(self,key:str):
+        value = self.client.get(key)
+        return None if value is None else json.loads(value) # type: ignore
+
+    def set(self,key:str,value,ttl:int) -> None:
+        self.client.set(key,json.dumps(value),ex=ttl)
+
+    def version(self,tenant:str) -> int:
+        value = self.client.get(REF_CACHE_PREFIX+"version:"+tenant)
+        return 0 if value is None else int(value) # type: ignore
+
+    def many(self,keys:list) -> list:
+        values = self.client.mget([REF_CACHE_PREFIX+"version:"+k for k in keys])
+        return [0 if v is None else int(v) for v in values] # type: ignore
+
+    def bump(self,tenant:str) -> int:
+        return int(self.client.incr(REF_CACHE_PREFIX+"version:"+tenant)) # type: ignore
+
+
+class LocalBackend():
+    """ Substituto para testes: sem limite nem expiracao, com os acessos contados
+        para conferir acertos e invalidacoes """
+    shared = False
+
+    def __init__(self) -> None:
+        self.entries:dict  = {}
+        self.versions:dict = {}
+        self.hits   = 0
+        self.misses = 0
+
+    def get(self,key:str):
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def set(self,key:str,value,ttl:int) -> None:
+        self.entries[key] = value
+
+    def version(self,tenant:str) -> int:
+        return self.versions.get(tenant,0)
+
+    def many(self,keys:list) -> list:
+        return [self.versions.get(k,0) for k in keys]
+
+    def bump(self,tenant:str) -> int:
+        self.versions[tenant] = self.versions.get(tenant,0)+1
+        return self.versions[tenant]
+
+
+def _make_backend(name:str):
+    if name=="redis":
+        return RedisBackend()
+    if name=="local":
+        return LocalBackend()
+    if name=="none":
+        return None
+    return LRUBackend()
+
+
+class RefCache():
+    """ Cache read-through das tabelas de referencia (cores, tamanhos, marcas...)
+
+        A chave eh (tenant, versao do tenant, recurso, hash da URL com a query). Os
+        POST/DELETE desses recursos incrementam a versao do tenant, o que torna todas
+        as respostas anteriores inalcancaveis de uma vez (elas expiram pelo TTL/LRU).
+        A versao eh unica por tenant porque as listagens se cruzam (colecoes trazem a
+        marca, funis trazem as etapas). Falha no backend nunca derruba a requisicao,
+        apenas faz a leitura ir direto ao BD """
+    backend = _make_backend(REF_CACHE_BACKEND)
+
+    @classmethod
+    def use(cls,backend) -> None:
+        """ Troca o backend (ex.: LocalBackend() nos testes) """
+        cls.backend = backend
+
+    @staticmethod
+    def __key(tenant:str,version:int,resource:str) -> str:
+        args = sorted(request.args.items(multi=True))
+        query_hash = sha1((request.path+"?"+json.dumps(args)).encode()).hexdigest()
+        return REF_CACHE_PREFIX+tenant+":"+str(version)+":"+resource+":"+query_hash
+
+    @staticmethod
+    def __cacheable(result) -> bool:
+        # erros (dict com error_code ou tupla com status) nao sao guardados
+        if result is None or isinstance(result,tuple):
+            return False
+        return not (isinstance(result,dict) and "error_code" in result)
+
+    @classmethod
+    def version(cls,tenant:str|None = None) -> int:
+        """ Versao atual do tenant (0 sem backend ou com falha no backend) """
+        if cls.backend is None:
+            return 0
+        try:
+            return cls.backend.version(tenant or _get_tenant())
+        except Exception as e:
+            logging.error("Falha ao ler a versao do cache de referencia: "+str(e))
+            return 0
+
+    @classmethod
+    def bump(cls,tenant:str|None = None) -> None:
+        """ Invalida as respostas do tenant (o da requisicao quando nao informado) """
+        if cls.backend is None:
+            return
+        try:
+            cls.backend.bump(tenant or _get_tenant())
+        except Exception as e:
+            logging.error("Falha ao invalidar o cache de referencia: "+str(e))
+
+    @classmethod
+    def table_versions(cls,tables:list,tenant:str|None = None) -> list:
+        """ Versao de gravacao de cada tabela do tenant (zeros sem backend ou com falha),
+            a tabela "*" conta qualquer gravacao do tenant """
+        if cls.backend is None:
+            return [0]*len(tables)
+        tenant = tenant or _get_tenant()
+        try:
+            return cls.backend.many([tenant+":"+t for t in tables])
+        except Exception as e:
+            logging.error("Falha ao ler as versoes das tabelas: "+str(e))
+            return [0]*len(tables)
+
+    @classmethod
+    def bump_tables(cls,tables,tenant:str|None = None) -> None:
+        """ Incrementa a versao das tabelas gravadas e a do tenant ("*") """
+        if cls.backend is None:
+            return
+        tenant = tenant or _get_tenant()
+        try:
+            for t in sorted(tables)+["*"]:
+                cls.backend.bump(tenant+":"+t)
+        except Exception as e:
+            logging.error("Falha ao incrementar as versoes das tabelas: "+str(e))
+
+    @classmethod
+    def bump_external(cls,tenant:str) -> bool:
+        """ Invalida as respostas do tenant a partir de outro processo (cron do ERP,
+            filas). Soh o redis eh visto pela API, nos backends do proprio processo o
+            incremento seria perdido e a API serve a resposta antiga ateh o
+            F2B_REF_CACHE_TTL expirar, entao apenas registra e devolve False """
+        if cls.backend is None:
+            return False
+        if not getattr(cls.backend,"shared",False):
+            logging.info("Cache de referencia de "+tenant+" nao compartilhado, a API atualiza em ateh "+str(REF_CACHE_TTL)+"s")
+            return False
+        cls.bump(tenant)
+        return True
+
+    @classmethod
+    def cached(cls,resource:str):
+        """ Decorator do GET: devolve a resposta guardada ou executa e guarda """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args,**kwargs):
+                backend = cls.backend
+                tenant  = _get_tenant()
+                if backend is None or tenant=="public":
+                    return func(*args,**kwargs)
+                try:
+                    key = cls.__key(tenant,backend.version(tenant),resource)
+                    value = backend.get(key)
+                except Exception as e:
+                    logging.error("Falha ao ler o cache de referencia: "+str(e))
+                    return func(*args,**kwargs)
+                if value is not None:
+                    return value
+                result = func(*args,**kwargs)
+                if cls.__cacheable(result):
+                    try:
+                        backend.set(key,result,REF_CACHE_TTL)
+                    except Exception as e:
+                        logging.error("Falha ao gravar o cache de referencia: "+str(e))
+                return result
+            return wrapper
+        return decorator
+
+    @classmethod
+    def invalidates(cls,func):
+        """ Decorator dos POST/DELETE: incrementa a versao do tenant apos a gravacao """
+        @wraps(func)
+        def wrapper(*args,**kwargs):
+            try:
+                return func(*args,**kwargs)
+            finally:
+                cls.bump()
+        return wrapper
+
+
+# as gravacoes feitas pela sessao do ORM (API) incrementam a versao das tabelas
+# envolvidas no commit, usada pelo ConditionalGet e pelo cache de totais (_paginate)
+_WRITTEN = "f2b_written_tables"
+
+def _written(session:Session) -> set:
+    return session.info.setdefault(_WRITTEN,set())
+
+@event.listens_for(Session,"after_flush")
+def _track_flush(session,flush_context):
+    for obj in list(session.new)+list(session.dirty)+list(session.deleted):
+        table = getattr(obj,"__table__",None)
+        if table is not None and (obj not in session.dirty or session.is_modified(obj)):
+            _written(session).add(table.name)
+
+@event.listens_for(Session,"do_orm_execute")
+def _track_statement(orm_execute_state):
+    # Insert/Update/Delete executados direto pela sessao nao passam pelo flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement,"table",None)
+        if table is not None and getattr(table,"name",None) is not None:
+            _written(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session,"after_commit")
+def _bump_written(session):
+    tables = session.info.pop(_WRITTEN,None)
+    if tables:
+        RefCache.bump_tables(tables)
+
+@event.listens_for(Session,"after_rollback")
+def _discard_written(session):
+    session.info.pop(_WRITTEN,None)
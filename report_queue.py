@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+from threading import Lock
+from os import environ, path
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# relatorios gerados ao mesmo tempo (cada um abre um processo do wkhtmltopdf)
+REPORT_WORKERS    = int(str(environ.get("F2B_REPORT_WORKERS","2")))
+# relatorios aguardando + em execucao no processo, acima disso a solicitacao eh recusada
+REPORT_QUEUE_SIZE = int(str(environ.get("F2B_REPORT_QUEUE_SIZE","20")))
+# tempo (segundos) que o PDF gerado fica disponivel para download
+REPORT_TTL        = int(str(environ.get("F2B_REPORT_TTL","3600")))
+REPORT_PATH       = str(environ.get("F2B_APP_PATH"))+'assets/pdf/jobs/'
+
+JOB_ID = re.compile("^[0-9a-f]{32}$")
+
+
+class ReportQueueFull(Exception):
+    """ Limite de relatorios pendentes atingido """
+
+
+class ReportQueue():
+    """ Fila de geracao de relatorios em PDF
+
+        A solicitacao apenas enfileira e recebe o id do job, a montagem e a renderizacao
+        ocorrem em um pool limitado. O estado de cada job fica em um .json ao lado do
+        PDF, assim qualquer processo da aplicacao consegue consultar e entregar o arquivo """
+    _executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS,thread_name_prefix="report")
+    _lock = Lock()
+    _active = 0
+
+    @staticmethod
+    def __meta_path(job:str) -> str:
+        return REPORT_PATH+job+'.json'
+
+    @staticmethod
+    def file_path(job:str) -> str:
+        return REPORT_PATH+job+'.pdf'
+
+    @classmethod
+    def __save(cls,meta:dict) -> None:
+        # grava em arquivo temporario e troca para nunca expor um json pela metade
+        tmp = cls.__meta_path(meta["id"])+'.tmp'
+        with open(tmp,"w") as f:
+            json.dump(meta,f)
+        os.replace(tmp,cls.__meta_path(meta["id"]))
+
+    @classmethod
+    def __load(cls,job:str) -> dict|None:
+        if JOB_ID.match(str(job)) is None or not path.exists(cls.__meta_path(job)):
+            return None
+        with open(cls.__meta_path(job)) as f:
+            return json.load(f)
+
+    @classmethod
+    def __run(cls,meta:dict,render) -> None:
+        meta["status"] = "running"
+        cls.__save(meta)
+        try:
+            # render(arquivo) monta os dados e grava o PDF no caminho informado
+            if render(cls.file_path(meta["id"])):
+                meta["status"] = "done"
+                meta["size"]   = path.getsize(cls.file_path(meta["id"]))
+            else:
+                meta["status"] = "failed"
+                meta["error"]  = "Falha ao gerar o relatório!"
+        except Exception as e:
+            logging.error("Falha no relatorio "+meta["id"]+": "+str(e))
+            meta["status"] = "failed"
+            meta["error"]  = str(e)
+        finally:
+            with cls._lock:
+                cls._active -= 1
+        meta["expires"] = time.time()+REPORT_TTL
+        cls.__save(meta)
+
+    @classmethod
+    def submit(cls,tenant:str,name:str,render) -> dict:
+        """ Enfileira a geracao e retorna o estado inicial do job """
+        if path.exists(REPORT_PATH)==False:
+            os.makedirs(REPORT_PATH,exist_ok=True)
+        cls.purge()
+        with cls._lock:
+            if cls._active >= REPORT_QUEUE_SIZE:
+                raise ReportQueueFull("Limite de relatórios em geração atingido, tente novamente em instantes!")
+            cls._active += 1
+        meta = {
+            "id": uuid.uuid4().hex,
+            "tenant": str(tenant),
+            "name": name,
+            "status": "queued",
+            "size": 0,
+            "error": None,
+            "created": time.time(),
+            "expires": None
+        }
+        cls.__save(meta)
+        try:
+            cls._executor.submit(cls.__run,meta,render)
+        except RuntimeError:
+            with cls._lock:
+                cls._active -= 1
+            raise
+        return meta
+
+    @classmethod
+    def status(cls,tenant:str,job:str) -> dict|None:
+        """ Estado do job, None se nao existir, tiver expirado ou for de outro tenant """
+        meta = cls.__load(job)
+        if meta is None or meta["tenant"]!=str(tenant):
+            return None
+        if meta["expires"] is not None and meta["expires"] < time.time():
+            return None
+        return meta
+
+    @classmethod
+    def purge(cls) -> None:
+        """ Remove os jobs vencidos (json e PDF) """
+        if path.exists(REPORT_PATH)==False:
+            return
+        now = time.time()
+        for f in os.listdir(REPORT_PATH):
+            if not f.endswith(".json"):
+                continue
+            job = f.replace(".json","")
+            try:
+                meta = cls.__load(job)
+                if meta is None or meta["expires"] is None or meta["expires"] >= now:
+                    continue
+                for p in (cls.file_path(job),cls.__meta_path(job)):
+                    if path.exists(p):
+                        os.remove(p)
+            except (OSError,ValueError) as e:
+                logging.warning("Falha ao remover o relatorio "+job+": "+str(e))
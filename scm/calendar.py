@@ -1,19 +1,22 @@
 import calendar
 import simplejson
 from auth import auth
+from conditional import ConditionalGet
+from ref_cache import RefCache
 from os import environ
 from flask import request
 import simplejson as json
 from decimal import Decimal
 from http import HTTPStatus
-from datetime import datetime,date
+from functools import lru_cache
+from datetime import datetime,date,timedelta
 from f2bconfig import CrmFunnelType
-from models.helpers import _get_params, _show_query, db
+from models.helpers import _get_params, _paginate, _show_query, db
 from models.tenant import ScmEvent, ScmEventType
 from flask_restx import Resource, Namespace, fields
-from sqlalchemy import desc, exc, asc,between,Select,and_, func, or_
+from sqlalchemy import desc, exc, asc,between,Select, func, or_, extract
 from models.tenant import CrmConfig, CrmFunnel, CrmFunnelStage 
-from models.tenant import B2bBrand, B2bCollection, ScmCalendar
+from models.tenant import B2bBrand, B2bCollection
 
 ns_calendar = Namespace("calendar",description="Operações para manipular dados de cidades")
 
@@ -26,40 +29,70 @@ evt_model = ns_calendar.model(
     }
 )
 
-def get_children(p_id_parent:int):
-    yquery = Select(ScmEvent.id,
-                    ScmEvent.id_parent,
-                    ScmEvent.name,
-                    ScmEvent.year,
-                    ScmEvent.start_date,
-                    ScmEvent.end_date,
-                    ScmEvent.budget_value,
-                    ScmEvent.date_created,
-                    ScmEvent.date_updated,
-                    ScmEventType.id.label("id_event_type"),
-                    ScmEventType.name.label("event_type_name"),
-                    ScmEventType.hex_color,
-                    ScmEventType.has_budget,
-                    ScmEventType.is_milestone,
-                    B2bCollection.id.label("id_collection"),
-                    B2bCollection.name.label("collection_name"),
-                    B2bBrand.id.label("id_brand"),
-                    B2bBrand.name.label("brand_name")).distinct()\
-            .join(ScmEventType,ScmEventType.id==ScmEvent.id_event_type)\
-            .join(ScmCalendar,and_(ScmEvent.year==ScmCalendar.year,ScmEvent.start_date==ScmCalendar.calendar_date))\
-            .outerjoin(B2bCollection,ScmEvent.id_collection==B2bCollection.id)\
-            .outerjoin(B2bBrand,B2bCollection.id_brand==B2bBrand.id)\
-            .where(ScmEvent.id_parent==p_id_parent)\
-            .order_by(asc(ScmEvent.start_date))
-    
+# intervalos de datas do esqueleto do calendario mantidos em memoria (compartilhado entre tenants)
+CALENDAR_CACHE_SIZE = int(str(environ.get("F2B_CALENDAR_CACHE_SIZE","256")))
+
+def _to_date(value) -> date:
+    return value if isinstance(value,date) else datetime.strptime(str(value)[:10],"%Y-%m-%d").date()
+
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _calendar_skeleton(p_start:date,p_end:date) -> list[dict]:
+    """ Anos, meses e semanas (ISO) do periodo calculados sem consultar o BD
+
+        Segue a regra da antiga tabela scm_calendar: cada semana pertence ao ano/mes
+        do seu sabado. O resultado fica em cache e nao deve ser alterado por quem chama """
+    years:dict = {}
+    # primeiro sabado do periodo (weekday 5)
+    day = p_start + timedelta(days=(5 - p_start.weekday()) % 7)
+    while day <= p_end:
+        weeks = years.setdefault(day.year,{}).setdefault(day.month,[])
+        week = day.isocalendar().week
+        if week not in weeks:
+            weeks.append(week)
+        day += timedelta(days=7)
     return [{
+        "year": year,
+        "months": [{
+            "position": month,
+            "weeks": weeks
+        } for month,weeks in months.items()]
+    } for year,months in years.items()]
+
+def _event_query() -> Select:
+    """ Consulta base dos eventos com tipo, colecao, marca e as semanas (ISO) de inicio e fim """
+    return Select(ScmEvent.id,
+                  ScmEvent.id_parent,
+                  ScmEvent.name,
+                  ScmEvent.year,
+                  ScmEvent.start_date,
+                  ScmEvent.end_date,
+                  ScmEvent.budget_value,
+                  ScmEvent.date_created,
+                  ScmEvent.date_updated,
+                  extract("week",ScmEvent.start_date).label("start_week"),
+                  extract("week",ScmEvent.end_date).label("end_week"),
+                  ScmEventType.id.label("id_event_type"),
+                  ScmEventType.name.label("event_type_name"),
+                  ScmEventType.hex_color,
+                  ScmEventType.has_budget,
+                  ScmEventType.is_milestone,
+                  B2bCollection.id.label("id_collection"),
+                  B2bCollection.name.label("collection_name"),
+                  B2bBrand.id.label("id_brand"),
+                  B2bBrand.name.label("brand_name"))\
+        .join(ScmEventType,ScmEventType.id==ScmEvent.id_event_type)\
+        .outerjoin(B2bCollection,ScmEvent.id_collection==B2bCollection.id)\
+        .outerjoin(B2bBrand,B2bCollection.id_brand==B2bBrand.id)
+
+def _event_dict(e) -> dict:
+    return {
         "id": e.id,
         "id_parent": e.id_parent,
         "name": e.name,
-        "start_week": date(e.start_date.year,e.start_date.month,e.start_date.day).isocalendar().week,
-        "end_week": date(e.end_date.year,e.end_date.month,e.end_date.day).isocalendar().week,
+        "start_week": int(e.start_week),
+        "end_week": None if e.end_week is None else int(e.end_week),
         "start_date": e.start_date.strftime("%Y-%m-%d"),
-        "end_date": e.end_date.strftime("%Y-%m-%d"),
+        "end_date": None if e.end_date is None else e.end_date.strftime("%Y-%m-%d"),
         "year":e.year,
         "budget_value": None if e.budget_value is None else json.dumps(e.budget_value),
         "date_created": e.date_created.strftime("%Y-%m-%d %H:%M:%S"),
@@ -79,7 +112,45 @@ def get_children(p_id_parent:int):
                 "name": e.brand_name
             }
         }
-    } for e in db.session.execute(yquery).all()]
+    }
+
+def get_children(p_ids_parent:list[int]) -> dict:
+    """ Filhos diretos de varios eventos em uma unica consulta: {id_pai: [eventos]} """
+    children = {}
+    if len(p_ids_parent)==0:
+        return children
+    yquery = _event_query().where(ScmEvent.id_parent.in_(p_ids_parent)).order_by(asc(ScmEvent.start_date))
+    for e in db.session.execute(yquery).all():
+        children.setdefault(e.id_parent,[]).append(_event_dict(e))
+    return children
+
+def get_event_tree(p_start,p_end,p_event_type:int|None = None) -> list[dict]:
+    """ Eventos principais do periodo com todos os descendentes, em uma unica consulta
+
+        Uma CTE recursiva parte dos eventos sem pai do periodo e desce pelo id_parent,
+        a arvore eh montada em memoria mantendo a ordem por data de inicio """
+    roots = Select(ScmEvent.id)\
+        .where(between(ScmEvent.start_date,p_start,p_end))\
+        .where(or_(ScmEvent.id_parent.is_(None),ScmEvent.id_parent==0))
+    if p_event_type is not None:
+        roots = roots.where(ScmEvent.id_event_type==p_event_type)
+
+    tree = roots.cte("event_tree",recursive=True)
+    tree = tree.union_all(Select(ScmEvent.id).join(tree,ScmEvent.id_parent==tree.c.id))
+
+    yquery = _event_query().join(tree,tree.c.id==ScmEvent.id).order_by(asc(ScmEvent.start_date),asc(ScmEvent.id))
+
+    nodes  = {}
+    result = []
+    rows   = db.session.execute(yquery).all()
+    for e in rows:
+        nodes[e.id] = dict(_event_dict(e),children=[])
+    for e in rows:
+        if e.id_parent is None or e.id_parent==0 or e.id_parent not in nodes:
+            result.append(nodes[e.id])
+        else:
+            nodes[e.id_parent]["children"].append(nodes[e.id])
+    return result
 
 @ns_calendar.route("/")
 class CalendarList(Resource):
@@ -87,6 +158,7 @@ class CalendarList(Resource):
     @ns_calendar.response(HTTPStatus.BAD_REQUEST,"Falha ao listar registros!")
     @ns_calendar.param("query","Texto para busca de intervalos de datas e eventos","query")
     @auth.login_required
+    @ConditionalGet.tables(ScmEvent,ScmEventType,B2bCollection,B2bBrand)
     def get(self):
         search = "" if request.args.get("query") is None else request.args.get("query")
 
@@ -96,7 +168,7 @@ class CalendarList(Resource):
                 if params.start=="" and params.end=="":
                     # tenta buscar eventos do calendario com maior data de fim
                     last_date = db.session.execute(
-                        Select(ScmEvent.end_date).order_by(desc(ScmEvent.end_date))
+                        Select(ScmEvent.end_date).where(ScmEvent.end_date.is_not(None)).order_by(desc(ScmEvent.end_date))
                     ).first()
                     if last_date is None:
                         params.end = date(datetime.now().year,12,31)
@@ -110,18 +182,7 @@ class CalendarList(Resource):
                     params.start = date(datetime.now().year,1,1)
                     
 
-                yquery = Select(ScmCalendar.year).distinct()\
-                    .where(between(ScmCalendar.calendar_date,params.start,params.end))\
-                    .where(ScmCalendar.day_of_week==7)
-                    # .order_by(asc(ScmCalendar.time_id))
-
-                retorno = [{
-                        "year": y.year,
-                        "months": [{
-                            "position": m.month,
-                            "weeks": self.__get_weeks(params.start,params.end,y.year,m.month)
-                        }for m in self.__get_months(params.start,params.end,y.year)],
-                    } for y in db.session.execute(yquery).all()]
+                retorno = _calendar_skeleton(_to_date(params.start),_to_date(params.end))
                 return retorno
             return None
         except exc.SQLAlchemyError as e:
@@ -131,25 +192,6 @@ class CalendarList(Resource):
                 "error_sql": e._sql_message()
             }
     
-    def __get_months(self,dt_start,dt_end,_current_year):
-        return db.session.execute(Select(ScmCalendar.month).distinct()\
-            .where(between(ScmCalendar.calendar_date,dt_start,dt_end))\
-            .where(ScmCalendar.year==_current_year)\
-            .where(ScmCalendar.day_of_week==7)
-            #.order_by(asc(ScmCalendar.time_id))
-        ).all()
-    
-    def __get_weeks(self,dt_start,dt_end,_current_year,_current_month):
-        weeks = []
-        qry = Select(ScmCalendar.week).distinct()\
-            .where(ScmCalendar.calendar_date.between(dt_start,dt_end))\
-            .where(and_(ScmCalendar.year==_current_year,ScmCalendar.month==_current_month,ScmCalendar.day_of_week==7))
-            # .order_by(asc(ScmCalendar.time_id))
-        # _show_query(qry)
-        for w in db.session.execute(qry).all():
-            weeks.append(w.week)
-        return weeks
-
     @ns_calendar.response(HTTPStatus.OK,"Salva um evento no calendário",evt_model)
     @ns_calendar.response(HTTPStatus.BAD_REQUEST,"Falha salvar registro!")
     @auth.login_required
@@ -206,6 +248,8 @@ class CalendarList(Resource):
                                 setattr(new_stg,"order",'' if cfg_stg is None else cfg_stg.order)
                                 db.session.add(new_stg)
                             db.session.commit()
+                            # o funil novo aparece na listagem de funis
+                            RefCache.bump()
 
             return reg.id
             
@@ -241,6 +285,7 @@ class CalendarEventApi(Resource):
     @ns_calendar.response(HTTPStatus.OK,"Retorna os dados de um evento especifico")
     @ns_calendar.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @ConditionalGet.tables(ScmEvent,ScmEventType,B2bCollection,B2bBrand)
     def get(self,id:int):
         try:
             qry = ScmEvent.query.get(id)
@@ -328,6 +373,8 @@ class CalendarEventApi(Resource):
                             setattr(new_stg,"order",(cfg_stg.order if cfg_stg is not None else None))
                             db.session.add(new_stg)
                         db.session.commit()
+                        # o funil novo aparece na listagem de funis
+                        RefCache.bump()
             return True
             
         except exc.SQLAlchemyError as e:
@@ -348,6 +395,7 @@ class CalendarEventList(Resource):
     @ns_calendar.response(HTTPStatus.BAD_REQUEST,"Falha ao listar registros!")
     @ns_calendar.param("query","Texto para busca de intervalos de datas e eventos","query")
     @auth.login_required
+    @ConditionalGet.tables(ScmEvent,ScmEventType,B2bCollection,B2bBrand)
     def get(self):
         query   = "" if request.args.get("query") is None else request.args.get("query")
 
@@ -359,64 +407,8 @@ class CalendarEventList(Resource):
                 params.start = date(datetime.now().year,1,1)
                 params.end   = date(datetime.now().year,12,31)
 
-            yquery = Select(ScmEvent.id,
-                            ScmEvent.id_parent,
-                            ScmEvent.name,
-                            ScmEvent.year,
-                            ScmEvent.start_date,
-                            ScmEvent.end_date,
-                            ScmEvent.budget_value,
-                            ScmEvent.date_created,
-                            ScmEvent.date_updated,
-                            ScmEventType.id.label("id_event_type"),
-                            ScmEventType.name.label("event_type_name"),
-                            ScmEventType.hex_color,
-                            ScmEventType.has_budget,
-                            ScmEventType.is_milestone,
-                            B2bCollection.id.label("id_collection"),
-                            B2bCollection.name.label("collection_name"),
-                            B2bBrand.id.label("id_brand"),
-                            B2bBrand.name.label("brand_name")).distinct()\
-                .join(ScmEventType,ScmEventType.id==ScmEvent.id_event_type)\
-                .join(ScmCalendar,and_(ScmEvent.year==ScmCalendar.year,ScmEvent.start_date==ScmCalendar.calendar_date))\
-                .outerjoin(B2bCollection,ScmEvent.id_collection==B2bCollection.id)\
-                .outerjoin(B2bBrand,B2bCollection.id_brand==B2bBrand.id)\
-                .where(between(ScmCalendar.calendar_date,params.start,params.end))\
-                .where(or_(ScmEvent.id_parent.is_(None),ScmEvent.id_parent==0))\
-                .order_by(asc(ScmEvent.start_date))
-            
-            if hasattr(params,'entity_type'):
-                yquery = yquery.where(ScmEventType.id==int(params.entity_type))
-
-            retorno = [{
-                    "id": e.id,
-                    "id_parent": e.id_parent,
-                    "name": e.name,
-                    "start_week": date(e.start_date.year,e.start_date.month,e.start_date.day).isocalendar().week,
-                    "end_week": date(e.end_date.year,e.end_date.month,e.end_date.day).isocalendar().week,
-                    "start_date": e.start_date.strftime("%Y-%m-%d"),
-                    "end_date": e.end_date.strftime("%Y-%m-%d"),
-                    "year":e.year,
-                    "budget_value": None if e.budget_value is None else json.dumps(e.budget_value),
-                    "date_created": e.date_created.strftime("%Y-%m-%d %H:%M:%S"),
-                    "date_updated": e.date_updated.strftime("%Y-%m-%d %H:%M:%S") if e.date_updated is not None else None,
-                    "type": {
-                        "id": e.id_event_type,
-                        "name": e.event_type_name,
-                        "hex_color": e.hex_color,
-                        "has_budget": e.has_budget,
-                        "is_milestone": e.is_milestone
-                    },
-                    "collection":{
-                        "id":e.id_collection,
-                        "name": e.collection_name,
-                        "brand":{
-                            "id": e.id_brand,
-                            "name": e.brand_name
-                        }
-                    },
-                    "children": get_children(e.id)
-                } for e in db.session.execute(yquery).all()]
+            event_type = int(params.entity_type) if hasattr(params,'entity_type') else None
+            retorno = get_event_tree(params.start,params.end,event_type)
 
             return retorno
         except exc.SQLAlchemyError as e:
@@ -435,6 +427,7 @@ class EventList(Resource):
     @ns_calendar.param("page","Número da página de registros","query",type=int,required=True)
     @ns_calendar.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_calendar.param("query","Texto para busca","query")
+    @ConditionalGet.tables(ScmEvent,ScmEventType,B2bCollection,B2bBrand)
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -466,9 +459,8 @@ class EventList(Resource):
                             B2bCollection.id.label("id_collection"),
                             B2bCollection.name.label("collection_name"),
                             B2bBrand.id.label("id_brand"),
-                            B2bBrand.name.label("brand_name")).distinct()\
+                            B2bBrand.name.label("brand_name"))\
                 .join(ScmEventType,ScmEventType.id==ScmEvent.id_event_type)\
-                .join(ScmCalendar,and_(ScmEvent.year==ScmCalendar.year,ScmEvent.start_date==ScmCalendar.calendar_date))\
                 .outerjoin(B2bCollection,ScmEvent.id_collection==B2bCollection.id)\
                 .outerjoin(B2bBrand,B2bCollection.id_brand==B2bBrand.id)\
                 .where(ScmEvent.trash==trash)\
@@ -482,8 +474,8 @@ class EventList(Resource):
                 rquery = rquery.where(ScmEvent.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
+                children = get_children([m.id for m in pag.items])
 
                 retorno = {
                     "pagination":{
@@ -516,12 +508,14 @@ class EventList(Resource):
                                 "name": m.brand_name
                             }
                         },
-                        "children": get_children(m.id),
+                        "children": children.get(m.id,[]),
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
+                rows = db.session.execute(rquery).all()
+                children = get_children([m.id for m in rows])
                 retorno = [{
                         "id": m.id,
                         "id_parent": m.id_parent,
@@ -545,10 +539,10 @@ class EventList(Resource):
                                 "name": m.brand_name
                             }
                         },
-                        "children": get_children(m.id),
+                        "children": children.get(m.id,[]),
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in rows]
             return retorno
         except exc.SQLAlchemyError as e:
             return {
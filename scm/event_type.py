@@ -1,10 +1,11 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
 from models.helpers import db
-from models.helpers import _get_params
+from models.helpers import _get_params, _paginate
 from models.tenant import ScmEventType
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource, Namespace, fields
@@ -46,6 +47,7 @@ class CollectionList(Resource):
     @ns_event.param("pageSize","Número de registros por página","query",type=int,required=True,default=25)
     @ns_event.param("query","Texto para busca","query")
     @auth.login_required
+    @RefCache.cached("event-types")
     def get(self):
         pag_num  = 1 if request.args.get("page") is None else int(str(request.args.get("page")))
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
@@ -88,8 +90,7 @@ class CollectionList(Resource):
                 rquery = rquery.where(ScmEventType.is_milestone.is_(False))
 
             if not list_all:
-                pag    = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag    = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -121,7 +122,7 @@ class CollectionList(Resource):
                         "parent": self.__get_parent(m.id_parent),
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -184,6 +185,7 @@ class CollectionList(Resource):
     @ns_event.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registro!")
     @ns_event.doc(body=event_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -211,6 +213,7 @@ class CollectionList(Resource):
     @ns_event.response(HTTPStatus.OK,"Exclui os dados de um tipo de evento")
     @ns_event.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self)->bool|dict:
         try:
             req = request.get_json()
@@ -232,6 +235,7 @@ class CollectionApi(Resource):
     @ns_event.response(HTTPStatus.OK,"Retorna os dados de um tipo de evento")
     @ns_event.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @auth.login_required
+    @RefCache.cached("event-types")
     def get(self,id:int):
         try:
             qry = ScmEventType.query.get(id)
@@ -264,6 +268,7 @@ class CollectionApi(Resource):
     @ns_event.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_event.doc(body=event_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
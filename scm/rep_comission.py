@@ -1,10 +1,11 @@
 from auth import auth
+from ref_cache import RefCache
 from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
 from models.tenant import B2bBrand
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource, Namespace, fields
 
@@ -69,8 +70,7 @@ class ComissionList(Resource):
                 rquery = rquery.where(B2bBrand.name.like("%{}%".format(search)))
 
             if list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -85,7 +85,7 @@ class ComissionList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -106,6 +106,7 @@ class ComissionList(Resource):
     @ns_comission.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registro!")
     @ns_comission.doc(body=comission_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self):
         try:
             req = request.get_json()
@@ -128,6 +129,7 @@ class ComissionList(Resource):
     @ns_comission.response(HTTPStatus.OK,"Exclui os dados de uma ou mais marcas")
     @ns_comission.response(HTTPStatus.BAD_REQUEST,"Falha ao excluir registro!")
     @auth.login_required
+    @RefCache.invalidates
     def delete(self):
         try:
             req = request.get_json()
@@ -176,6 +178,7 @@ class CollectionApi(Resource):
     @ns_comission.response(HTTPStatus.BAD_REQUEST,"Registro não encontrado!")
     @ns_comission.doc(body=comission_model)
     @auth.login_required
+    @RefCache.invalidates
     def post(self,id:int):
         try:
             req = request.get_json()
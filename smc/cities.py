@@ -2,10 +2,11 @@ from auth import auth
 from os import environ
 from flask import request
 from http import HTTPStatus
+from geo import GeoIndex
 from models.helpers import _get_params, db
-from sqlalchemy import Select, desc, exc, asc
+from sqlalchemy import exc
 from flask_restx import Resource, Namespace, fields
-from models.public import SysCities , SysCountries, SysStateRegions
+from models.public import SysCities
 ns_city = Namespace("cities",description="Operações para manipular dados de cidades")
 
 #API Models
@@ -46,79 +47,30 @@ class CitiesList(Resource):
         query    = "" if request.args.get("query") is None else request.args.get("query")
 
         try:
+            # a lista vem do indice em memoria, o ETag muda apenas quando os dados ou a consulta mudam
+            etag = GeoIndex.etag(pag_num,pag_size,query)
+            if request.if_none_match.contains(etag):
+                return None, HTTPStatus.NOT_MODIFIED, {"ETag": '"'+etag+'"'}
+
             params = _get_params(str(query))
+            direction = 'ASC'
+            order_by  = 'id'
+            search    = None
+            list_all  = False
+            filter_state = None
             if params is not None:
-                direction = asc if not hasattr(params,'order') else asc if params.order=='ASC' else desc
+                direction = 'ASC' if not hasattr(params,'order') else str(params.order).upper()
                 order_by  = 'id' if not hasattr(params,'order_by') else params.order_by
                 search = None if not hasattr(params,"search") else params.search
                 list_all = False if not hasattr(params,"list_all") else params.list_all
                 filter_state = None if not hasattr(params,"state_region") else params.state_region
 
-            rquery = Select(SysCities.id,
-                   SysCities.name,
-                   SysStateRegions.id.label("state_region_id"),
-                   SysStateRegions.name.label("state_region_name"),
-                   SysStateRegions.acronym,
-                   SysCountries.id.label("country_id"),
-                   SysCountries.name.label("country_name"))\
-                   .join(SysStateRegions,SysStateRegions.id==SysCities.id_state_region)\
-                   .join(SysCountries,SysCountries.id==SysStateRegions.id_country)\
-                   .order_by(direction(getattr(SysCities,order_by)))
-            
-            if search is not None and search!="":
-                rquery = rquery.where(
-                    SysCities.name.like('%{}%'.format(search)) |
-                    SysStateRegions.name.like('%{}%'.format(search)) |
-                    SysCountries.name.like('%{}%'.format(search))
-                )
-
-            if filter_state is not None:
-                if str(filter_state).find(",")==-1:
-                    rquery = rquery.where(SysCities.id_state_region==filter_state)
-                else:
-                    rquery = rquery.where(SysCities.id_state_region.in_(filter_state))
-
-            #print(rquery)
+            rows = GeoIndex.list_cities(search,filter_state,order_by,direction=='DESC')
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num -1)*pag_size)
-                return {
-                    "pagination":{
-                        "registers": pag.total,
-                        "page": pag_num,
-                        "per_page": pag_size,
-                        "pages": pag.pages,
-                        "has_next": pag.has_next
-                    },
-                    "data":[{
-                        "id": m.id,
-                        "name": m.name,
-                        "state_region":{
-                            "id": m.state_region_id,
-                            "name": m.state_region_name,
-                            "acronym": m.acronym,
-                            "country": {
-                                "id": m.country_id,
-                                "name": m.country_name
-                            }
-                        }
-                    }for m in db.session.execute(rquery)]
-                }
+                return GeoIndex.paginate(rows,pag_num,pag_size), HTTPStatus.OK, {"ETag": '"'+etag+'"'}
             else:
-                return [{
-                        "id": m.id,
-                        "name": m.name,
-                        "state_region":{
-                            "id": m.state_region_id,
-                            "name": m.state_region_name,
-                            "acronym":m.acronym,
-                            "country": {
-                                "id": m.country_id,
-                                "name": m.country_name
-                            }
-                        }
-                    }for m in db.session.execute(rquery)]
+                return rows, HTTPStatus.OK, {"ETag": '"'+etag+'"'}
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -138,6 +90,7 @@ class CitiesList(Resource):
             reg.id_state_region = req["id_state_region"]
             db.session.add(reg)
             db.session.commit()
+            GeoIndex.invalidate()
             return reg.id
         except exc.SQLAlchemyError as e:
             return {
@@ -186,6 +139,7 @@ class CityApi(Resource):
                 reg.name = req["name"]
                 reg.id_state_region = req["id_state_region"]
                 db.session.commit()
+                GeoIndex.invalidate()
                 return True
             return False 
         except exc.SQLAlchemyError as e:
@@ -203,6 +157,7 @@ class CityApi(Resource):
             reg = SysCities.query.get(id)
             setattr(reg,"trash",True)
             db.session.commit()
+            GeoIndex.invalidate()
             return True
         except exc.SQLAlchemyError as e:
             return {
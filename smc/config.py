@@ -1,7 +1,7 @@
 # from auth import auth
 from flask import request
 from http import HTTPStatus
-from f2bconfig import DashboardImage, DashboardImageColor
+from common import _get_tenant_config, _invalidate_tenant_config
 from models.helpers import db # , _get_params
 from sqlalchemy import Select, exc
 from models.public import SysConfig
@@ -134,67 +134,14 @@ class ConfigApi(Resource):
     # @auth.login_required
     def get(self,id:str):
         try:
-            cfg = db.session.execute(Select(SysConfig).where(SysConfig.id_customer==id)).first()
+            cfg = _get_tenant_config(id)
             if cfg is None:
                 return {
                     "error_code": HTTPStatus.BAD_REQUEST.value,
                     "error_details": "Configuração não encontrada!",
                     "error_sql": ""
                 }, HTTPStatus.BAD_REQUEST
-            else:
-                if cfg[0].dashboard_config=='M':
-                    dash_image = DashboardImage.MEN.value
-                    dash_color = DashboardImageColor.MEN.value
-                if cfg[0].dashboard_config=='W':
-                    dash_image = DashboardImage.WOMEN.value
-                    dash_color = DashboardImageColor.WOMEN.value
-                if cfg[0].dashboard_config=='H':
-                    dash_image = DashboardImage.WHEAT.value
-                    dash_color = DashboardImageColor.WHEAT.value
-                if cfg[0].dashboard_config=='D':
-                    dash_image = DashboardImage.DRINK.value
-                    dash_color = DashboardImageColor.DRINK.value
-                if cfg[0].dashboard_config=='S':
-                    dash_image = DashboardImage.SHOES.value
-                    dash_color = DashboardImageColor.SHOES.value
-                if cfg[0].dashboard_config=='P':
-                    dash_image = DashboardImage.PISTON.value
-                    dash_color = DashboardImageColor.PISTON.value
-                if cfg[0].dashboard_config=='F':
-                    dash_image = DashboardImage.PHARMA.value
-                    dash_color = DashboardImageColor.PHARMA.value
-                
-                return {
-                    "id_customer": str(cfg[0].id_customer),
-                    "pagination_size": cfg[0].pagination_size,
-                    "email_brevo_api_key": cfg[0].email_brevo_api_key,
-                    "email_from_name": cfg[0].email_from_name,
-                    "email_from_value": cfg[0].email_from_value,
-                    "flimv_model": cfg[0].flimv_model,
-                    "dashboard_config": cfg[0].dashboard_config,
-                    "dashboard_image": dash_image,
-                    "dashboard_color": dash_color,
-                    "ai_model": cfg[0].ai_model,
-                    "ai_api_key": cfg[0].ai_api_key,
-                    "company_custom": cfg[0].company_custom,
-                    "company_name": cfg[0].company_name,
-                    "company_logo": cfg[0].company_logo,
-                    "url_instagram": cfg[0].url_instagram,
-                    "url_facebook": cfg[0].url_facebook,
-                    "url_linkedin": cfg[0].url_linkedin,
-                    "max_upload_files": cfg[0].max_upload_files,
-                    "max_upload_images": cfg[0].max_upload_images,
-                    "use_url_images": cfg[0].use_url_images,
-                    "track_orders": cfg[0].track_orders,
-                    "erp_integration": cfg[0].erp_integration,
-                    "erp_url": cfg[0].erp_url,
-                    "erp_token": cfg[0].erp_token,
-                    "erp_grant_type": cfg[0].erp_grant_type,
-                    "erp_client_id": cfg[0].erp_client_id,
-                    "erp_client_secret": cfg[0].erp_client_secret,
-                    "erp_username": cfg[0].erp_username,
-                    "erp_password": cfg[0].erp_password
-                }
+            return dict(cfg)
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -240,6 +187,7 @@ class ConfigApi(Resource):
                 if "track_orders" in req:
                     reg.track_orders = req["track_orders"]
                 db.session.commit()
+                _invalidate_tenant_config(id)
                 return True
             return False 
         except exc.SQLAlchemyError as e:
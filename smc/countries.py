@@ -3,7 +3,7 @@ from os import environ
 from flask import request
 from http import HTTPStatus
 from models.public import SysCountries
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, desc, exc, asc
 from flask_restx import Resource, Namespace, fields
 
@@ -64,8 +64,7 @@ class CategoryList(Resource):
                 rquery = rquery.where(SysCountries.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
 					"pagination":{
@@ -78,7 +77,7 @@ class CategoryList(Resource):
 					"data":[{
 						"id": m.id,
 						"name": m.name
-					} for m in db.session.execute(rquery)]
+					} for m in pag.items]
 				}
             else:
                 retorno = [{
@@ -1,3 +1,4 @@
+import logging
 from auth import auth
 from os import environ
 from flask import request
@@ -5,7 +6,8 @@ from http import HTTPStatus
 from datetime import datetime
 from sqlalchemy import Select, exc, asc, desc, text
 from flask_restx import Resource, Namespace, fields
-from models.helpers import db, _get_params, Database
+from concurrent.futures import ThreadPoolExecutor
+from models.helpers import db, _get_params, _paginate, Database, EngineRegistry
 from models.public import SysCustomer, SysCustomerPlan, SysCustomerUser, SysUsers
 
 ns_customer = Namespace("customer",description="Operações para manipular dados de clientes")
@@ -49,6 +51,71 @@ customer_return = ns_customer.model(
     }
 )
 
+# scripts SQL (separados por virgula) da carga inicial de cada novo tenant, ex.: docs/cmm_report.sql
+TENANT_SEEDS      = [f.strip() for f in str(environ.get("F2B_TENANT_SEEDS","")).split(",") if f.strip()!=""]
+# tenants criados/populados ao mesmo tempo
+PROVISION_WORKERS = int(str(environ.get("F2B_PROVISION_WORKERS","4")))
+
+_provision_executor = ThreadPoolExecutor(max_workers=PROVISION_WORKERS,thread_name_prefix="provision")
+
+def _seed_tenant(schema:str) -> None:
+    """ Executa os scripts de carga inicial no schema do tenant """
+    for seed in TENANT_SEEDS:
+        try:
+            with open(seed,encoding="utf-8") as f:
+                script = f.read()
+            with EngineRegistry.get_engine().begin() as conn:
+                conn.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+                conn.execution_options(no_parameters=True).exec_driver_sql(script)
+        except Exception as e:
+            logging.error("Falha na carga inicial "+seed+" do tenant "+schema+": "+str(e))
+
+def _seed_tenant_async(schema:str) -> None:
+    if len(TENANT_SEEDS) > 0:
+        _provision_executor.submit(_seed_tenant,schema)
+
+def _provision_tenant(schema:str) -> str|None:
+    """ Cria o schema do tenant, retorna None ou a mensagem de erro """
+    try:
+        Database(schema).create_tenant_schema()
+    except exc.SQLAlchemyError as e:
+        return e._message()
+    except RuntimeError as e:
+        return str(e)
+    _seed_tenant_async(schema)
+    return None
+
+def _register_trials(customers:list,id_plan:int) -> list[dict]:
+    """ Cadastra varios clientes de teste de uma vez: os registros publicos sao gravados
+        em uma transacao e os schemas criados em paralelo no pool de provisionamento """
+    rows = []
+    for c in customers:
+        customer:SysCustomer = SysCustomer()
+        setattr(customer,"name",c["name"])
+        setattr(customer,"taxvat",c["taxvat"])
+        setattr(customer,"postal_code",c["postal_code"])
+        setattr(customer,"date_created",datetime.now())
+        rows.append(customer)
+    db.session.add_all(rows)
+    db.session.flush()
+
+    for customer in rows:
+        customer_plan:SysCustomerPlan = SysCustomerPlan()
+        customer_plan.id_customer = customer.id
+        setattr(customer_plan,"id_plan",id_plan)
+        setattr(customer_plan,"activate",True)
+        setattr(customer_plan,"activation_date",datetime.now())
+        setattr(customer_plan,"payment_model",environ.get("F2B_DEFAULT_PAYMENT_MODEL","M"))
+        setattr(customer_plan,"payment_method",environ.get("F2B_DEFAULT_PAYMENT_METHOD","C"))
+        db.session.add(customer_plan)
+    db.session.commit()
+
+    futures = {str(c.id): _provision_executor.submit(_provision_tenant,str(c.id)) for c in rows}
+    return [{
+        "id": id,
+        "error": future.result()
+    } for id,future in futures.items()]
+
 def _register_customer(
         name:str,
         taxvat:str,
@@ -85,17 +152,11 @@ def _register_customer(
             db.session.add(customer_plan)
             db.session.commit()
 
-            # cria o schema do novo cliente
-            tenant = Database(str(customer.id))
-            tenant.create_tenant_schema()
-
-            start_date = str(datetime.now().year)+"-01-01"
-            end_date   = str(datetime.now().year+50)+"-12-31" # correcao na data final para o fim do ano
+            # cria o schema do novo cliente, a carga inicial de dados segue em segundo plano
+            # o calendario (anos/meses/semanas) eh calculado em memoria, nao precisa mais ser populado
+            Database(str(customer.id)).create_tenant_schema()
+            _seed_tenant_async(str(customer.id))
 
-            # as funcoes do PostgreSQL sao chamadas com o SELECT
-            db.session.execute(text("SELECT public.populate('"+str(customer.id)+"','"+start_date+"','"+end_date+"')"))
-            db.session.commit()            
-            
         return True
     except exc.SQLAlchemyError as e:
         return {
@@ -103,6 +164,13 @@ def _register_customer(
             "error_details": e._message(),
             "error_sql": e._sql_message()
         }, HTTPStatus.BAD_REQUEST
+    except RuntimeError as e:
+        # revisao das migracoes indisponivel, o schema nao foi criado
+        return {
+            "error_code": HTTPStatus.INTERNAL_SERVER_ERROR.value,
+            "error_details": str(e),
+            "error_sql": ""
+        }, HTTPStatus.INTERNAL_SERVER_ERROR
 
 
 @ns_customer.route("/")
@@ -145,8 +213,7 @@ class CustomerList(Resource):
                 rquery = rquery.where(SysCustomer.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -169,7 +236,7 @@ class CustomerList(Resource):
                         },
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -355,4 +422,22 @@ class CustomerSysApi(Resource):
             req["payment_method"] if "payment_method" in req else "C",
             users=req["users"] if "users" in req else None
         )
-ns_customer.add_resource(CustomerSysApi,"/register")
\ No newline at end of file
+ns_customer.add_resource(CustomerSysApi,"/register")
+
+
+class CustomerTrialApi(Resource):
+    @ns_customer.response(HTTPStatus.OK,"Registra vários clientes de teste de uma vez")
+    @ns_customer.response(HTTPStatus.BAD_REQUEST,"Falha ao criar registros!")
+    @auth.login_required
+    def post(self):
+        try:
+            req = request.get_json()
+            return _register_trials(req["customers"],req["plan"]["id"])
+        except exc.SQLAlchemyError as e:
+            db.session.rollback()
+            return {
+                "error_code": e.code,
+                "error_details": e._message(),
+                "error_sql": e._sql_message()
+            }, HTTPStatus.BAD_REQUEST
+ns_customer.add_resource(CustomerTrialApi,"/register/trial")
\ No newline at end of file
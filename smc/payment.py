@@ -3,7 +3,7 @@ from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, asc, desc, or_
 from flask_restx import Resource, Namespace, fields
 from models.public import SysPayment, SysPlan, SysCustomer
@@ -100,8 +100,7 @@ class PaymentList(Resource):
                 ))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -128,7 +127,7 @@ class PaymentList(Resource):
                         "starter": float(m.starter),
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
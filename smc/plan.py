@@ -6,7 +6,7 @@ from decimal import Decimal
 from http import HTTPStatus
 from datetime import datetime
 from models.public import SysCustomerPlan, SysPlan
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from sqlalchemy import Select, exc, asc, desc
 from flask_restx import Resource, Namespace, fields
 
@@ -82,8 +82,7 @@ class PaymentList(Resource):
                 rquery = rquery.where(SysPlan.name.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
 
                 retorno = {
                     "pagination":{
@@ -98,7 +97,7 @@ class PaymentList(Resource):
                         "name": m.name,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 retorno = [{
@@ -3,8 +3,9 @@ from os import environ
 from flask import request
 from http import HTTPStatus
 from models.public import SysStateRegions
+from geo import GeoIndex
 from models.helpers import _get_params, db
-from sqlalchemy import Select, desc, exc, asc, or_
+from sqlalchemy import exc
 from flask_restx import Resource, Namespace, fields
 
 ns_state_region = Namespace("state-regions",description="Operações para manipular dados de estados ou regiões")
@@ -46,60 +47,31 @@ class CategoryList(Resource):
         pag_size = int(str(environ.get("F2B_PAGINATION_SIZE"))) if request.args.get("pageSize") is None else int(str(request.args.get("pageSize")))
 
         try:
+            # a lista vem do indice em memoria, o ETag muda apenas quando os dados ou a consulta mudam
+            etag = GeoIndex.etag(pag_num,pag_size,request.args.get("query"))
+            if request.if_none_match.contains(etag):
+                return None, HTTPStatus.NOT_MODIFIED, {"ETag": '"'+etag+'"'}
+
             params    = _get_params(request.args.get("query"))
+            direction = 'ASC'
+            order_by  = 'id'
+            search    = None
+            list_all  = False
+            filter_country = None
             if params is not None:
-                direction = asc if not hasattr(params,'order') else asc if str(params.order).upper()=='ASC' else desc
+                direction = 'ASC' if not hasattr(params,'order') else str(params.order).upper()
                 order_by  = 'id' if not hasattr(params,'order_by') else params.order_by
                 search    = None if not hasattr(params,"search") else params.search
                 list_all  = False if not hasattr(params,"list_all") else params.list_all
                 filter_country = None if not hasattr(params,"country") else params.country
 
-            rquery = Select(SysStateRegions.id,
-                            SysStateRegions.id_country,
-                            SysStateRegions.name,
-                            SysStateRegions.acronym)\
-                            .select_from(SysStateRegions)\
-                            .order_by(direction(getattr(SysStateRegions,order_by)))
-            
-            if search is not None:
-                rquery = rquery.where(or_(
-                    SysStateRegions.name.like("%{}%".format(search)),
-                    SysStateRegions.acronym.like("%{}%".format(search))
-                ))
-
-            if filter_country is not None:
-                if str(filter_country).find(",")==-1:
-                    rquery = rquery.where(SysStateRegions.id_country==filter_country)
-                else:
-                    rquery = rquery.where(SysStateRegions.id_country.in_(filter_country))
+            rows = GeoIndex.list_states(search,filter_country,order_by,direction=='DESC')
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
-
-                retorno = {
-					"pagination":{
-						"registers": pag.total,
-						"page": pag_num,
-						"per_page": pag_size,
-						"pages": pag.pages,
-						"has_next": pag.has_next
-					},
-					"data":[{
-						"id": m.id,
-                        "id_country": m.id_country,
-						"name": m.name,
-                        "acronym": m.acronym
-					} for m in db.session.execute(rquery)]
-				}
+                retorno = GeoIndex.paginate(rows,pag_num,pag_size)
             else:
-                retorno = [{
-						"id": m.id,
-                        "id_country": m.id_country,
-						"name": m.name,
-                        "acronym": m.acronym
-					} for m in db.session.execute(rquery)]
-            return retorno
+                retorno = rows
+            return retorno, HTTPStatus.OK, {"ETag": '"'+etag+'"'}
         except exc.SQLAlchemyError as e:
             return {
                 "error_code": e.code,
@@ -119,6 +91,7 @@ class CategoryList(Resource):
             reg.id_country = req["id_country"]
             db.session.add(reg)
             db.session.commit()
+            GeoIndex.invalidate()
             return reg.id
         except exc.SQLAlchemyError as e:
             return {
@@ -167,6 +140,7 @@ class CategoryApi(Resource):
                 reg.name = req["name"]
                 reg.id_country = req["id_country"]
                 db.session.commit()
+                GeoIndex.invalidate()
                 return True
             return False 
         except exc.SQLAlchemyError as e:
@@ -184,6 +158,7 @@ class CategoryApi(Resource):
             reg = SysStateRegions.query.get(id)
             setattr(reg,"trash",True)
             db.session.commit()
+            GeoIndex.invalidate()
             return True
         except exc.SQLAlchemyError as e:
             return {
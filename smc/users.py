@@ -1,13 +1,13 @@
 import requests
-from auth import auth
+from auth import auth, invalidate_token, invalidate_user
 from os import environ
 from flask import request
 from http import HTTPStatus
 from datetime import datetime
-from models.helpers import _get_params, db
+from models.helpers import _get_params, _paginate, db
 from flask_restx import Resource ,Namespace, fields
-from f2bconfig import CustomerAction, DashboardImage, DashboardImageColor, LegalEntityContactType, MailTemplates, UserType
-from common import _send_email, _get_dashboard_config
+from f2bconfig import CustomerAction, LegalEntityContactType, MailTemplates, UserType
+from common import _send_email, _get_dashboard_config, _get_tenant_config
 from models.public import _save_customer_log, SysConfig
 from models.public import SysUsers, SysCustomer, SysCustomerUser, SysPlan, SysCustomerPlan
 from models.tenant import CmmLegalEntities, CmmLegalEntityContact
@@ -97,8 +97,7 @@ class UsersList(Resource):
                 rquery = rquery.where(SysUsers.username.like("%{}%".format(search)))
 
             if not list_all:
-                pag = db.paginate(rquery,page=pag_num,per_page=pag_size)
-                rquery = rquery.limit(pag_size).offset((pag_num - 1) * pag_size)
+                pag = _paginate(rquery,page=pag_num,per_page=pag_size)
                 return {
                     "pagination":{
                         "registers": pag.total,
@@ -116,7 +115,7 @@ class UsersList(Resource):
                         "active": m.active,
                         "date_created": m.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                         "date_updated": m.date_updated.strftime("%Y-%m-%d %H:%M:%S") if m.date_updated is not None else None
-                    } for m in db.session.execute(rquery)]
+                    } for m in pag.items]
                 }
             else:
                 return [{
@@ -230,6 +229,7 @@ class UsersList(Resource):
                 if usr is not None:
                     usr.active = req["toTrash"]
                     db.session.commit()
+                    invalidate_user(id)
             return True
         except exc.SQLAlchemyError as e:
             return {
@@ -329,6 +329,7 @@ class UserApi(Resource):
             if usr is not None:
                 setattr(usr,"active",False)
                 db.session.commit()
+                invalidate_user(id)
                 return True
         except exc.SQLAlchemyError as e:
             return {
@@ -365,32 +366,13 @@ class UserAuth(Resource):
                 entity = db.session.execute(Select(CmmLegalEntities.id).where(CmmLegalEntities.id_user==usr[0].id)).first()
 
             # busca as configuracoes do usuario
-            cfg = db.session.execute(Select(SysConfig).where(SysConfig.id_customer==str(usr[1].id_customer))).first()
-            if cfg[0].dashboard_config=='M':
-                dash_image = DashboardImage.MEN.value
-                dash_color = DashboardImageColor.MEN.value
-            if cfg[0].dashboard_config=='W':
-                dash_image = DashboardImage.WOMEN.value
-                dash_color = DashboardImageColor.WOMEN.value
-            if cfg[0].dashboard_config=='H':
-                dash_image = DashboardImage.WHEAT.value
-                dash_color = DashboardImageColor.WHEAT.value
-            if cfg[0].dashboard_config=='D':
-                dash_image = DashboardImage.DRINK.value
-                dash_color = DashboardImageColor.DRINK.value
-            if cfg[0].dashboard_config=='S':
-                dash_image = DashboardImage.SHOES.value
-                dash_color = DashboardImageColor.SHOES.value
-            if cfg[0].dashboard_config=='P':
-                dash_image = DashboardImage.PISTON.value
-                dash_color = DashboardImageColor.PISTON.value
-            if cfg[0].dashboard_config=='F':
-                dash_image = DashboardImage.PHARMA.value
-                dash_color = DashboardImageColor.PHARMA.value
+            cfg = _get_tenant_config(str(usr[1].id_customer))
 
             #verifica a senha criptografada anteriormente
             pwd = str(req["password"]).encode()
             if usr[0].check_pwd(pwd):
+                # o novo token substitui o anterior no BD, o antigo nao pode seguir valido pelo cache
+                invalidate_user(usr[0].id)
                 obj_retorno = {
 					"token_access": usr[0].get_token(str(usr[1].id_customer)),
 					"token_type": "Bearer",
@@ -399,37 +381,7 @@ class UserAuth(Resource):
                     "id_user": usr[0].id,
                     "id_profile": str(usr[1].id_customer),
                     "id_entity": entity,
-                    "config": {
-                        "id_customer": str(cfg[0].id_customer),
-                        "pagination_size": cfg[0].pagination_size,
-                        "email_brevo_api_key": cfg[0].email_brevo_api_key,
-                        "email_from_name": cfg[0].email_from_name,
-                        "email_from_value": cfg[0].email_from_value,
-                        "flimv_model": cfg[0].flimv_model,
-                        "dashboard_config": cfg[0].dashboard_config,
-                        "dashboard_image": dash_image,
-                        "dashboard_color": dash_color,
-                        "ai_model": cfg[0].ai_model,
-                        "ai_api_key": cfg[0].ai_api_key,
-                        "company_custom": cfg[0].company_custom,
-                        "company_name": cfg[0].company_name,
-                        "company_logo": cfg[0].company_logo,
-                        "url_instagram": cfg[0].url_instagram,
-                        "url_facebook": cfg[0].url_facebook,
-                        "url_linkedin": cfg[0].url_linkedin,
-                        "max_upload_files": cfg[0].max_upload_files,
-                        "max_upload_images": cfg[0].max_upload_images,
-                        "use_url_images": cfg[0].use_url_images,
-                        "track_orders": cfg[0].track_orders,
-                        "erp_integration": cfg[0].erp_integration,
-                        "erp_url": cfg[0].erp_url,
-                        "erp_token": cfg[0].erp_token,
-                        "erp_grant_type": cfg[0].erp_grant_type,
-                        "erp_client_id": cfg[0].erp_client_id,
-                        "erp_client_secret": cfg[0].erp_client_secret,
-                        "erp_username": cfg[0].erp_username,
-                        "erp_password": cfg[0].erp_password
-                    }
+                    "config": None if cfg is None else dict(cfg)
                 }
                 usr[0].is_authenticate = True
                 db.session.commit()
@@ -456,6 +408,8 @@ class UserAuth(Resource):
         try:
             usr:SysUsers|None = SysUsers.query.get(request.args.get("id"))
             if usr is not None:
+                # o token antigo deixa de existir no BD, entao sai do cache
+                invalidate_token(usr.token)
                 usr.renew_token()
                 db.session.commit()
                 return usr.token_expire.strftime("%Y-%m-%d %H:%M:%S")
@@ -473,6 +427,7 @@ class UserAuthLogout(Resource):
             if usr is not None:
                 usr.logout()
                 db.session.commit()
+                invalidate_user(id)
                 entity = SysCustomerUser.query.filter(SysCustomerUser.id_user==id).first()
                 if entity is not None:
                     _save_customer_log(id,entity.id,CustomerAction.SYSTEM_ACCESS,'Efetuou logoff')
@@ -701,7 +656,7 @@ class UserPassword(Resource):
             # porem o usuario tambem pode ser desativado diretamente no cadastro de 
             # usuarios
             exist = db.session.execute(
-                Select(SysUsers.id,SysUsers.email,SysUsers.name,SysConfig.email_brevo_api_key,SysCustomerUser.id_customer)\
+                Select(SysUsers.id,SysUsers.email,SysUsers.name,SysCustomerUser.id_customer)\
                 .join(SysCustomerUser,SysCustomerUser.id_user==SysUsers.id)\
                 .join(SysConfig,SysConfig.id_customer==SysCustomerUser.id_customer)\
                 .where(and_(
@@ -711,14 +666,13 @@ class UserPassword(Resource):
             ).first()
             if exist is not None:
                 sended = _send_email(
-                    str(exist.id),
+                    str(exist.id_customer),
                     [exist.email],
                     [],
                     "Fast2bee - Recuperação de Senha",
                     exist.name,
                     MailTemplates.PWD_RECOVERY,
-                    exist.email_brevo_api_key,
-                    customer_id=str(exist.id_customer)+"/")
+                    p_url=str(exist.id_customer)+"/"+str(exist.id))
                 return sended
         except exc.SQLAlchemyError as e:
             return {
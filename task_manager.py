@@ -1,133 +1,275 @@
-import csv
+import json
+import time
 import logging
+import argparse
 import importlib
 from flimv import Flimv
-from datetime import datetime
+from threading import Lock
 from dotenv import load_dotenv
-from sqlalchemy import Insert, create_engine, Select
-from os import environ, path, listdir, remove
-from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import Select
+from importer import CsvImporter
+from models.helpers import EngineRegistry
+from integrations.http_client import HttpClient
+from os import environ, path, listdir, remove, makedirs, replace
+try:
+    import fcntl
+except ImportError:
+    # windows (desenvolvimento)
+    fcntl = None
+    import msvcrt
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from models.public import SysCustomer, SysConfig
-from models.tenant import CmmLegalEntityImport, CmmProductsImport
 
 
 BASEDIR = path.abspath(path.dirname(__file__))
 load_dotenv(path.join(BASEDIR, '.env'))
 
-# realiza a conexao com o banco de dados (repensar para incluir os tenants)
-conn = str(environ.get("F2B_DB_LIB"))+"://"
-conn += str(environ.get("F2B_DB_USER"))+":"
-conn += str(environ.get("F2B_DB_PASS"))+"@"
-conn += str(environ.get("F2B_DB_HOST"))+"/"
-conn += str(environ.get("F2B_DB_NAME"))
-db = create_engine(conn)
+# pool compartilhado por todos os jobs e tenants do processo
+db = EngineRegistry.get_engine()
 
-with db.connect() as connection:
-    try:
-        # verifica se a tabela de importacao de produtos existe, senao cria
-        all_active_customers = connection.execute(Select(SysCustomer.id,SysConfig.erp_integration,SysConfig.erp_module).where(SysCustomer.churn.is_(False)))
-    except Exception as e:
-        logging.error(e)
+# numero maximo de tenants processados ao mesmo tempo
+SCHEDULER_WORKERS      = int(str(environ.get("F2B_SCHEDULER_WORKERS","4")))
+SCHEDULER_PATH         = str(environ.get("F2B_APP_PATH"))+'assets/scheduler/'
+
+
+# etapas da carga do ERP, na ordem de execucao
+ERP_STEPS = ["get_representative","get_customer","get_order","get_invoice","get_payment_conditions",
+             "get_products","get_bank_slip","get_measure_unit","create_order"]
+
+
+def run_erp(customer) -> None:
+    """ Executa a carga do ERP de um tenant """
+    if customer.erp_integration is not True or customer.erp_module is None:
+        return
+    module = str(customer.erp_module)
+    class_name = str(customer.erp_module).replace("_"," ").title().replace(" ","")
+    ERP = getattr(
+        importlib.import_module('integrations.erp.'+module),
+        class_name
+    )
+
+    # cria uma instancia do ERP para cada cliente
+    erp = ERP(str(customer.id))
+
+    # cada etapa eh independente, a falha de uma nao impede as seguintes
+    failed = []
+    for step in ERP_STEPS:
+        try:
+            getattr(erp,step)()
+        except Exception as e:
+            failed.append(step)
+            logging.error("Falha na etapa "+step+" do ERP do tenant "+str(customer.id)+": "+str(e))
+    if len(failed) > 0:
+        raise RuntimeError("Etapas do ERP com falha: "+",".join(failed))
+
+def run_flimv(customer) -> None:
+    """ Atualiza as informacoes do FLIMV de um tenant """
+    flimv = Flimv(str(customer.id))
+    flimv.process()
+
+# period = segundos entre as execucoes, hour/minute = horario de referencia da janela
+JOBS = {
+    # esse eh o job de carga do ERP que eh executado de hora em hora
+    "erp": {"run": run_erp, "period": 3600, "hour": None, "minute": 0},
+    # esse eh o job que atualiza as informacoes do FLIMV a cada dia sempre as 1h
+    "flimv": {"run": run_flimv, "period": 86400, "hour": 1, "minute": 0}
+}
+
+
+class TaskScheduler():
+    """ Executa os jobs de todos os tenants em um pool limitado de workers,
+        garantindo que o mesmo tenant nao rode dois jobs ao mesmo tempo """
+    workers:int
+    state:dict
+
+    def __init__(self,workers:int = SCHEDULER_WORKERS) -> None:
+        self.workers = workers
+        self.state_lock = Lock()
+        self.tenant_locks = {}
+        self.lock_files:dict = {}
+        if path.exists(SCHEDULER_PATH)==False:
+            makedirs(SCHEDULER_PATH)
+        self.state = self.__load_state()
+
+    @staticmethod
+    def __read_json(file:str) -> dict:
+        try:
+            with open(file,"r") as state_file:
+                return json.load(state_file)
+        except (OSError,ValueError):
+            return {}
+
+    def __load_state(self) -> dict:
+        """ Estado de todos os tenants (apenas para o status), {job: {tenant: info}} """
+        state = self.__read_json(SCHEDULER_PATH+'state.json')
+        for f in listdir(SCHEDULER_PATH):
+            if f.startswith("state_") and f.endswith(".json"):
+                tenant = f[len("state_"):-len(".json")]
+                for name,info in self.__read_json(SCHEDULER_PATH+f).items():
+                    state.setdefault(name,{})[tenant] = info
+        return state
+
+    def __load_tenant(self,tenant:str) -> dict:
+        # cada tenant tem o proprio arquivo, lido com o lock do tenant para pegar o que outro processo gravou
+        state = self.__read_json(SCHEDULER_PATH+'state_'+tenant+'.json')
+        if len(state)==0:
+            # estado anterior ao arquivo por tenant
+            legacy = self.__read_json(SCHEDULER_PATH+'state.json')
+            state = {name: tenants[tenant] for name,tenants in legacy.items() if tenant in tenants}
+        return state
 
+    def __save_tenant(self,tenant:str,state:dict) -> None:
+        # arquivo temporario + replace: quem ler no meio da gravacao ve o arquivo anterior inteiro
+        file = SCHEDULER_PATH+'state_'+tenant+'.json'
+        with open(file+'.tmp',"w") as state_file:
+            json.dump(state,state_file,indent=2)
+        replace(file+'.tmp',file)
+        with self.state_lock:
+            for name,info in state.items():
+                self.state.setdefault(name,{})[tenant] = info
 
-# esse eh o job de carga do ERP que eh executado de hora em hora
-if datetime.now().strftime("%M")=="00":
-    for customer in all_active_customers:
-        if customer.erp_integration==True:
-            module = str(customer.erp_module)
-            class_name = str(customer.erp_module).replace("_"," ").title().replace(" ","")
-            ERP = getattr(
-                importlib.import_module('integrations.erp.'+module),
-                class_name
-            )
-
-        # cria uma instancia do ERP para cada cliente
-        erp = ERP(customer.id)
-
-        erp.get_representative()
-        erp.get_customer()
-        erp.get_order()
-        erp.get_invoice()
-        erp.get_payment_conditions()
-        erp.get_products()
-        erp.get_bank_slip()
-        erp.get_measure_unit()
-        erp.create_order()
-
-# esse eh o job que atualiza as informacoes do FLIMV a cada dia sempre as 1h
-# if datetime.now().strftime("%H%M")=="0100":
-if datetime.now().strftime("%H%M")=="1040":
-    for customer in all_active_customers:
-        # cria uma instancia do FLIMV para cada cliente
-        flimv = Flimv(customer.id)
-        flimv.process()
-
-
-def import_file(fName:str):
+    def __last_slot(self,job:dict,now:datetime) -> datetime:
+        # inicio da janela mais recente do job que jah deveria ter sido executada
+        if job["hour"] is None:
+            slot = now.replace(minute=job["minute"],second=0,microsecond=0)
+        else:
+            slot = now.replace(hour=job["hour"],minute=job["minute"],second=0,microsecond=0)
+        while slot > now:
+            slot -= timedelta(seconds=job["period"])
+        return slot
+
+    @staticmethod
+    def __lock_file(f,lock:bool) -> bool:
+        # lock do sistema operacional: eh liberado sozinho se o processo morrer,
+        # entao nao existe lock abandonado nem tempo limite para o job
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(),(fcntl.LOCK_EX|fcntl.LOCK_NB) if lock else fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(),msvcrt.LK_NBLCK if lock else msvcrt.LK_UNLCK,1)
+            return True
+        except OSError:
+            return False
+
+    def __acquire(self,tenant:str) -> bool:
+        # lock em memoria para as threads e no arquivo para outros processos (ex.: cron sobreposto)
+        with self.state_lock:
+            lock = self.tenant_locks.setdefault(tenant,Lock())
+        if not lock.acquire(blocking=False):
+            return False
+        # o arquivo nunca eh removido, assim dois processos sempre disputam o mesmo inode
+        f = open(SCHEDULER_PATH+tenant+'.lock',"a+")
+        if not self.__lock_file(f,True):
+            f.close()
+            lock.release()
+            return False
+        self.lock_files[tenant] = f
+        return True
+
+    def __release(self,tenant:str) -> None:
+        f = self.lock_files.pop(tenant,None)
+        if f is not None:
+            self.__lock_file(f,False)
+            f.close()
+        self.tenant_locks[tenant].release()
+
+    def __run_tenant(self,customer,jobs:list,now:datetime,force:bool) -> list:
+        tenant  = str(customer.id)
+        metrics = []
+        if not self.__acquire(tenant):
+            logging.warning("Tenant "+tenant+" ja esta em execucao, ignorando")
+            return metrics
+        state = self.__load_tenant(tenant)
+        try:
+            for name in jobs:
+                job  = JOBS[name]
+                slot = self.__last_slot(job,now)
+                info = state.setdefault(name,{"runs":0,"failures":0,"missed":0})
+
+                last = None if info.get("last_slot") is None else datetime.fromisoformat(info["last_slot"])
+                if not force and last is not None and last >= slot:
+                    continue
+
+                # janelas que passaram sem execucao (processo parado, sobreposicao, etc.)
+                missed = 0 if last is None else max(0,int((slot-last).total_seconds()//job["period"])-1)
+
+                start = time.perf_counter()
+                status = "success"
+                try:
+                    job["run"](customer)
+                except Exception as e:
+                    status = "error"
+                    logging.error("Falha no job "+name+" do tenant "+tenant+": "+str(e))
+                duration = round(time.perf_counter()-start,3)
+
+                info["runs"]          += 1
+                info["failures"]      += 0 if status=="success" else 1
+                info["missed"]        += missed
+                info["last_slot"]      = slot.isoformat()
+                info["last_run"]       = datetime.now().isoformat()
+                info["last_status"]    = status
+                info["last_duration"]  = duration
+                info["total_duration"] = round(info.get("total_duration",0)+duration,3)
+                # gravado a cada job, ainda com o lock do tenant
+                self.__save_tenant(tenant,state)
+                metrics.append({"job":name,"tenant":tenant,"status":status,"duration":duration,"missed":missed})
+                logging.info("Job "+name+" tenant "+tenant+" "+status+" em "+str(duration)+"s (janelas perdidas: "+str(missed)+")")
+        finally:
+            self.__release(tenant)
+        return metrics
+
+    def run(self,jobs:list,tenant:str|None = None,force:bool = False) -> list:
+        """ Executa os jobs informados para todos os tenants ativos (ou apenas um) """
+        with db.connect() as connection:
+            query = Select(SysCustomer.id,SysConfig.erp_integration,SysConfig.erp_module)\
+                .outerjoin(SysConfig,SysConfig.id_customer==SysCustomer.id)\
+                .where(SysCustomer.churn.is_(False))
+            if tenant is not None:
+                query = query.where(SysCustomer.id==tenant)
+            customers = connection.execute(query).all()
+
+        now = datetime.now()
+        metrics = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.__run_tenant,customer,jobs,now,force) for customer in customers]
+            for ft in as_completed(futures):
+                try:
+                    metrics += ft.result()
+                except Exception as e:
+                    logging.error(e)
+        logging.info("Pool de conexoes: "+str(EngineRegistry.stats()))
+        logging.info("Integracoes: "+json.dumps(HttpClient.metrics()))
+        return metrics
+
+    def status(self) -> dict:
+        return self.state | {"pool": EngineRegistry.stats(), "http": HttpClient.metrics()}
+
+
+def import_file(fName:str) -> dict:
+    summary = {}
     try:
-        with open(fName,newline='',encoding="utf-8") as csv_file:
-            has_header = csv.Sniffer().has_header(csv_file.read(1024))
-            csv_file.seek(0)
-            csv_reader = csv.reader(csv_file)
-            #pula a linha de cabecalho
-            if has_header:
-                next(csv_reader)
-            with db.connect() as conn:
-                customers = conn.execute(Select(SysCustomer.id).where(SysCustomer.churn.is_(False)))
-                for customer in customers:
-                    nconn = create_engine(str(environ.get("F2B_DB_LIB"))+"://"+str(environ.get("F2B_DB_USER"))+":"+\
-                        str(environ.get("F2B_DB_PASS"))+"@"+str(environ.get("F2B_DB_HOST"))+"/"+str(environ.get("F2B_DB_NAME"))+"?options=-c%20search_path="+str(customer.id))
-                    ndb = nconn.connect()
-                    
-                    if fName.find("import_P_")!=-1:
-                        for row in csv_reader:
-                            product = {
-                                "refCode":row[0],
-                                "barCode":row[1],
-                                "type":row[2],
-                                "model":row[3],
-                                "brand":row[4],
-                                "name":row[5],
-                                "description":row[6],
-                                "observation":row[7],
-                                "price":float(str(row[8]).replace(",",".")),
-                                "measure_unit":row[9],
-                                "color":row[10],
-                                "size":row[11],
-                                "quantity":int(row[12])
-                            }
-                            ndb.execute(Insert(CmmProductsImport),product)
-                    elif fName.find("import_E_")!=-1:
-                        for row in csv_reader:
-                            entity = {
-                                "id_original":row[0],
-                                "taxvat":row[1],
-                                "name":row[2],
-                                "fantasy_name":row[3],
-                                "city":row[4],
-                                "postal_code":row[5],
-                                "neighborhood":row[6],
-                                "address":row[7],
-                                "type": "P" if row[8]=='PERSONA' else "C" if row[8]=="CUSTOMER" else "R",
-                                "phone_type":row[9],
-                                "phone_number":row[10],
-                                "is_whatsapp":bool(row[11]),
-                                "phone_is_default":bool([row[12]]),
-                                "email_type":row[13],
-                                "email_address":row[14],
-                                "email_is_default":bool(row[15])
-                            }
-                            ndb.execute(Insert(CmmLegalEntityImport),parameters=entity)
-                    ndb.commit()
-            #fecha o arquivo
-            csv_file.close()
-
-            #realiza a exclusao do arquivo apos importar
-            remove(fName)
-            process_import()
+        with db.connect() as conn:
+            customers = conn.execute(Select(SysCustomer.id).where(SysCustomer.churn.is_(False))).all()
+
+        # se o nome do arquivo indicar o tenant importa apenas para ele
+        targets = [c for c in customers if path.basename(fName).find(str(c.id))!=-1] or customers
+        for customer in targets:
+            # o arquivo eh relido em blocos para cada tenant
+            with EngineRegistry.get_engine(str(customer.id)).connect() as ndb:
+                importer = CsvImporter(ndb)
+                summary[str(customer.id)] = importer.import_staging(fName)
+                ndb.commit()
+            for err in importer.errors:
+                logging.warning("Importacao "+path.basename(fName)+" tenant "+str(customer.id)+" linha "+str(err["line"])+": "+err["error"])
+
+        #realiza a exclusao do arquivo apos importar
+        remove(fName)
+        process_import()
     except Exception as e:
         logging.error(e)
-        print(e)
+    return summary
 
 def process_import():
     try:
@@ -135,17 +277,31 @@ def process_import():
     except Exception as e:
         logging.error(e)
 
-# realiza varredura dos arquivos de importacao e adiciona um em cada thread para execucao
-# mesmo por que nao deverao haver muitas importacoes de dados
-fpath = str(environ.get("F2B_APP_PATH"))+'assets/import/' 
-files = [f for f in listdir(fpath) if path.isfile(fpath+f)]
-workers = len(files)+1
-for f in files:
-    # define uma thread para cada arquivo existente
+def run_imports(workers:int = SCHEDULER_WORKERS) -> None:
+    # realiza varredura dos arquivos de importacao e processa em um unico pool limitado
+    # mesmo por que nao deverao haver muitas importacoes de dados
+    fpath = str(environ.get("F2B_APP_PATH"))+'assets/import/'
+    files = [f for f in listdir(fpath) if path.isfile(fpath+f)]
     with ThreadPoolExecutor(max_workers=workers) as executor:
-        ft = executor.submit(import_file,fpath+f)
-        print(executor._work_queue)
-        print(f)
-        #if ft.done:
-            # print(executor._work_queue)
-        # executor.shutdown(wait=True)
\ No newline at end of file
+        for f in files:
+            executor.submit(import_file,fpath+f)
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Agendador de tarefas do Fast2Bee (executar via cron a cada minuto)")
+    parser.add_argument("command",choices=["run","import","status"],help="run = executa os jobs devidos, import = processa arquivos, status = exibe metricas")
+    parser.add_argument("--job",action="append",choices=list(JOBS.keys()),help="Job a executar (padrao: todos)")
+    parser.add_argument("--tenant",default=None,help="Executa apenas para o tenant informado")
+    parser.add_argument("--workers",type=int,default=SCHEDULER_WORKERS,help="Numero maximo de tenants em paralelo")
+    parser.add_argument("--force",action="store_true",help="Executa mesmo que a janela ja tenha sido processada")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command=="run":
+        scheduler = TaskScheduler(args.workers)
+        for m in scheduler.run(args.job or list(JOBS.keys()),args.tenant,args.force):
+            print(json.dumps(m))
+    elif args.command=="import":
+        run_imports(args.workers)
+    else:
+        print(json.dumps(TaskScheduler(args.workers).status(),indent=2))
+    EngineRegistry.dispose()
@@ -0,0 +1,232 @@
+import time
+import logging
+import argparse
+from threading import Lock
+from datetime import datetime
+from dotenv import load_dotenv
+from os import environ, path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from alembic.config import Config
+from alembic.operations import Operations
+from alembic.script import ScriptDirectory
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import Connection, Select, text
+from sqlalchemy.dialects.postgresql import insert
+from models.helpers import EngineRegistry
+from models.public import SysCustomer, SysTenantRevision
+
+BASEDIR = path.abspath(path.dirname(__file__))
+load_dotenv(path.join(BASEDIR, '.env'))
+
+# schemas migrados ao mesmo tempo (cada um usa uma conexao do pool compartilhado)
+MIGRATE_WORKERS   = int(str(environ.get("F2B_MIGRATE_WORKERS","4")))
+# tenants executados (com rollback) no dry-run para estimar o tempo total
+MIGRATE_SAMPLE    = int(str(environ.get("F2B_MIGRATE_SAMPLE","3")))
+# relativo a raiz do projeto, o comando pode ser chamado de qualquer diretorio
+TENANT_MIGRATIONS = path.join(BASEDIR,str(environ.get("F2B_TENANT_MIGRATIONS","migrations/tenant")))
+UNVERSIONED_ERROR = "schema com tabelas sem revisao registrada, registre a revisao em sys_tenant_revision"
+
+
+class TenantMigrator():
+    """ Atualiza os schemas dos tenants em paralelo
+
+        As tabelas publicas usadas aqui estao em docs/public-tenant-revision-erp-sync.sql.
+        Cada revisao pendente roda em uma transacao propria junto com a gravacao da
+        revisao em public.sys_tenant_revision, entao o tenant nunca fica com uma revisao
+        registrada diferente do que foi aplicado. Na primeira falha o tenant para na
+        ultima revisao confirmada e os demais seguem normalmente """
+
+    def __init__(self,workers:int = MIGRATE_WORKERS,script_location:str = TENANT_MIGRATIONS) -> None:
+        config = Config()
+        config.set_main_option("script_location",script_location)
+        self.script  = ScriptDirectory.from_config(config)
+        self.head    = self.script.get_current_head()
+        self.workers = max(workers,1)
+        self.engine  = EngineRegistry.get_engine()
+        self.lock    = Lock()
+        self.done    = 0
+        self.total   = 0
+
+    def tenants(self,tenant:str|None = None) -> list[tuple[str,str|None,bool]]:
+        """ (schema, revisao atual, se jah consta no controle central) de cada tenant,
+            revisao None soh eh tratada como base se o schema estiver vazio (ver upgrade) """
+        stmt = Select(SysCustomer.id,SysTenantRevision.revision)\
+            .outerjoin(SysTenantRevision,SysTenantRevision.id_customer==SysCustomer.id)\
+            .order_by(SysCustomer.date_created)
+        if tenant is not None:
+            stmt = stmt.where(SysCustomer.id==tenant)
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+            result = []
+            for r in rows:
+                revision = r.revision
+                if revision is None:
+                    # tenant criado antes do registro central, herda o alembic_version do schema
+                    revision = self.__legacy_revision(conn,str(r.id))
+                result.append((str(r.id),revision,r.revision is not None))
+            return result
+
+    def __legacy_revision(self,conn:Connection,schema:str) -> str|None:
+        exists = conn.execute(text("SELECT to_regclass(:name)"),{"name": '"'+schema+'".alembic_version'}).scalar()
+        if exists is None:
+            return None
+        return conn.execute(text(f'SELECT version_num FROM "{schema}".alembic_version')).scalar()
+
+    @staticmethod
+    def __unversioned(conn:Connection,schema:str) -> bool:
+        # schema com tabelas e sem revisao conhecida: reaplicar desde a base recriaria
+        # tabelas existentes, precisa ser registrado manualmente na revisao correta
+        return conn.execute(text("SELECT count(*) FROM information_schema.tables WHERE table_schema=:schema"),
+                            {"schema": schema}).scalar() > 0 # type: ignore
+
+    def pending(self,revision:str|None) -> list:
+        """ Revisoes a aplicar, da mais antiga para a mais nova """
+        if revision==self.head:
+            return []
+        return list(reversed(list(self.script.iterate_revisions(self.head,revision or "base"))))
+
+    def __record(self,conn:Connection,schema:str,revision:str|None,status:str,error:str|None,duration:float) -> None:
+        stmt = insert(SysTenantRevision).values(id_customer=schema,revision=revision,status=status,
+                                                error=None if error is None else error[:1000],
+                                                duration=round(duration,3),date_updated=datetime.now())
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[SysTenantRevision.id_customer],
+            set_={
+                "revision": stmt.excluded.revision,
+                "status": stmt.excluded.status,
+                "error": stmt.excluded.error,
+                "duration": stmt.excluded.duration,
+                "date_updated": stmt.excluded.date_updated
+            }
+        ))
+
+    @staticmethod
+    def __apply(conn:Connection,schema:str,revision) -> None:
+        # as revisoes usam o `op` do alembic sem schema, o search_path direciona para o tenant
+        conn.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+        ctx = MigrationContext.configure(conn)
+        with Operations.context(ctx):
+            revision.module.upgrade()
+
+    def upgrade(self,schema:str,revision:str|None) -> dict:
+        """ Aplica as revisoes pendentes de um tenant """
+        steps   = self.pending(revision)
+        start   = time.perf_counter()
+        applied = revision
+        error   = None
+        with self.engine.connect() as conn:
+            if revision is None and self.__unversioned(conn,schema):
+                return {"tenant": schema, "from": None, "to": None, "steps": 0,
+                        "error": UNVERSIONED_ERROR,
+                        "elapsed": round(time.perf_counter()-start,3)}
+            for step in steps:
+                try:
+                    with conn.begin():
+                        self.__apply(conn,schema,step)
+                        self.__record(conn,schema,step.revision,'O',None,time.perf_counter()-start)
+                    applied = step.revision
+                except Exception as e:
+                    # para na primeira falha, o tenant fica na ultima revisao confirmada
+                    error = str(e)
+                    with conn.begin():
+                        self.__record(conn,schema,applied,'F',error,time.perf_counter()-start)
+                    break
+            if len(steps)==0 and revision is not None:
+                # registra no controle central os tenants que vieram do alembic_version
+                with conn.begin():
+                    self.__record(conn,schema,revision,'O',None,0)
+        return {"tenant": schema, "from": revision, "to": applied, "steps": len(steps),
+                "error": error, "elapsed": round(time.perf_counter()-start,3)}
+
+    def rehearse(self,schema:str,revision:str|None) -> dict:
+        """ Executa todas as revisoes pendentes do tenant e desfaz (DDL transacional) """
+        steps = self.pending(revision)
+        start = time.perf_counter()
+        error = None
+        with self.engine.connect() as conn:
+            if revision is None and self.__unversioned(conn,schema):
+                return {"tenant": schema, "from": None, "to": None, "steps": 0,
+                        "error": UNVERSIONED_ERROR,
+                        "elapsed": 0}
+            trans = conn.begin()
+            try:
+                for step in steps:
+                    self.__apply(conn,schema,step)
+            except Exception as e:
+                error = str(e)
+            finally:
+                trans.rollback()
+        return {"tenant": schema, "from": revision, "to": self.head, "steps": len(steps),
+                "error": error, "elapsed": round(time.perf_counter()-start,3)}
+
+    def __progress(self,result:dict) -> None:
+        with self.lock:
+            self.done += 1
+            done = self.done
+        logging.info("["+str(done)+"/"+str(self.total)+"] "+result["tenant"]+" "+str(result["from"])+" -> "+str(result["to"])+
+                     " ("+str(result["elapsed"])+"s)"+("" if result["error"] is None else " FALHA: "+result["error"]))
+
+    def run(self,tenant:str|None = None) -> dict:
+        """ Migra todos os tenants pendentes no pool e retorna o resumo """
+        todo = [(schema,revision) for schema,revision,registered in self.tenants(tenant)
+                if len(self.pending(revision)) > 0 or not registered]
+        self.total, self.done = len(todo), 0
+        start = time.perf_counter()
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix="migrate") as executor:
+            futures = {executor.submit(self.upgrade,schema,revision): (schema,revision) for schema,revision in todo}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # falha de conexao/catalogo de um tenant nao interrompe os demais
+                    schema,revision = futures[future]
+                    result = {"tenant": schema, "from": revision, "to": revision, "steps": 0,
+                              "error": str(e), "elapsed": 0}
+                self.__progress(result)
+                results.append(result)
+        failed = [r for r in results if r["error"] is not None]
+        return {
+            "head": self.head,
+            "tenants": len(results),
+            "upgraded": len([r for r in results if r["error"] is None and r["steps"] > 0]),
+            "failed": [{"tenant": r["tenant"], "revision": r["to"], "error": r["error"]} for r in failed],
+            "elapsed": round(time.perf_counter()-start,3)
+        }
+
+    def estimate(self,tenant:str|None = None,sample:int = MIGRATE_SAMPLE) -> dict:
+        """ Dry-run: ensaia uma amostra de tenants pendentes e estima o tempo total """
+        pending = [(schema,revision) for schema,revision,_ in self.tenants(tenant) if len(self.pending(revision)) > 0]
+        trials  = [self.rehearse(schema,revision) for schema,revision in pending[:max(sample,1)]]
+        avg     = sum(t["elapsed"] for t in trials)/len(trials) if len(trials) > 0 else 0
+        waves   = (len(pending) + self.workers - 1)//self.workers
+        return {
+            "head": self.head,
+            "pending": len(pending),
+            "sample": trials,
+            "avg_tenant": round(avg,3),
+            "workers": self.workers,
+            "estimated": round(avg*waves,3)
+        }
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Migracao dos schemas de tenants do Fast2Bee")
+    parser.add_argument("command",choices=["upgrade","dry-run","status"],help="upgrade = aplica as revisoes pendentes, dry-run = estima o tempo sem gravar, status = revisao de cada tenant")
+    parser.add_argument("--tenant",default=None,help="Executa apenas para o tenant informado")
+    parser.add_argument("--workers",type=int,default=MIGRATE_WORKERS,help="Numero maximo de tenants em paralelo")
+    parser.add_argument("--sample",type=int,default=MIGRATE_SAMPLE,help="Tenants ensaiados no dry-run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,format="%(asctime)s %(levelname)s %(message)s")
+    migrator = TenantMigrator(args.workers)
+    try:
+        if args.command=="upgrade":
+            print(migrator.run(args.tenant))
+        elif args.command=="dry-run":
+            print(migrator.estimate(args.tenant,args.sample))
+        else:
+            for schema,revision,_ in migrator.tenants(args.tenant):
+                print(schema,revision,"pendentes: "+str(len(migrator.pending(revision))))
+    finally:
+        EngineRegistry.dispose()
@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+
+# as configuracoes sao lidas na importacao dos modulos, por isso vem antes de tudo
+os.environ["F2B_APP_PATH"]          = tempfile.mkdtemp(prefix="f2b_test_")+"/"
+os.environ["F2B_MAIL_TRANSPORT"]    = "stub"
+os.environ["F2B_MAIL_POLL"]         = "0.05"
+os.environ["F2B_REF_CACHE_BACKEND"] = "local"
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from models.helpers import db, _tenant_schema
+from ref_cache import RefCache, LocalBackend
+
+
+def sqlite_engine():
+    """ SQLite em memoria com SAVEPOINT funcionando (begin_nested) """
+    engine = create_engine("sqlite://",poolclass=StaticPool,connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine,"connect")
+    def _connect(dbapi_connection,connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine,"begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_BINDS"] = {"public": "sqlite://"}
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"poolclass": StaticPool,"connect_args": {"check_same_thread": False}}
+    db.init_app(app)
+    return app
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context(), app.test_request_context("/"):
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture(autouse=True)
+def ref_cache():
+    backend = LocalBackend()
+    RefCache.use(backend)
+    token = _tenant_schema.set("t1")
+    yield backend
+    _tenant_schema.reset(token)
@@ -0,0 +1,50 @@
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import Column, Integer, MetaData, Select, String, Table
+from integrations.erp.bulk_writer import BulkWriter
+from conftest import sqlite_engine
+
+metadata = MetaData()
+# sem indice unico em code: o sqlite nao tem o xmax do upsert, usa o caminho com consulta
+erp_item = Table("erp_item",metadata,
+    Column("id",Integer,primary_key=True,autoincrement=True),
+    Column("code",String(20),nullable=False),
+    Column("name",String(50),nullable=False))
+model = SimpleNamespace(__table__=erp_item)
+
+
+@pytest.fixture
+def engine():
+    engine = sqlite_engine()
+    metadata.create_all(engine)
+    with BulkWriter(engine,model,["code"]) as writer:
+        for code in ("A","B","C"):
+            writer.add({"code": code,"name": "Item "+code})
+    assert writer.counts()=={"inserted": 3,"updated": 0,"skipped": 0}
+    yield engine
+    engine.dispose()
+
+
+def _names(engine) -> dict:
+    with engine.connect() as conn:
+        return {r.code: r.name for r in conn.execute(Select(erp_item.c.code,erp_item.c.name))}
+
+
+def test_insert_update_and_skip_counts(engine):
+    with BulkWriter(engine,model,["code"],batch_size=2) as writer:
+        writer.add({"code": "A","name": "Item A alterado"})
+        writer.add({"code": "B","name": "Item B"})
+        writer.add({"code": "Z","name": "Inativo"},insert=False)
+        writer.add({"code": None,"name": "Sem codigo"})
+        writer.add({"code": "D","name": "Item D"})
+    assert writer.counts()=={"inserted": 1,"updated": 1,"skipped": 3}
+    assert _names(engine)=={"A": "Item A alterado","B": "Item B","C": "Item C","D": "Item D"}
+    assert set(writer.ids.keys())=={("A",),("B",),("D",)}
+
+
+def test_repeated_key_in_batch_keeps_last_record(engine):
+    with BulkWriter(engine,model,["code"]) as writer:
+        writer.add({"code": "A","name": "primeira"})
+        writer.add({"code": "A","name": "ultima"})
+    assert writer.counts()=={"inserted": 0,"updated": 1,"skipped": 1}
+    assert _names(engine)["A"]=="ultima"
@@ -0,0 +1,38 @@
+import pytest
+from datetime import date, timedelta
+from scm.calendar import _calendar_skeleton
+
+
+def _populate_saturdays(p_start:date,p_end:date) -> dict:
+    """ Mesmas linhas da public.populate filtradas por day_of_week = 7 (DOW 6, sabado) """
+    weeks:dict = {}
+    day = p_start
+    while day <= p_end:
+        if day.isoweekday()%7+1==7:
+            weeks.setdefault((day.year,day.month),set()).add(day.isocalendar().week)
+        day += timedelta(days=1)
+    return weeks
+
+
+def _flatten(skeleton:list) -> dict:
+    return {(y["year"],m["position"]): m["weeks"] for y in skeleton for m in y["months"]}
+
+
+@pytest.mark.parametrize("p_start,p_end",[
+    (date(2024,12,1),date(2026,1,31)),
+    (date(2020,12,27),date(2021,1,9)),
+    (date(2025,3,2),date(2025,3,7))
+])
+def test_skeleton_matches_populate(p_start,p_end):
+    skeleton = _flatten(_calendar_skeleton(p_start,p_end))
+    assert {k: set(v) for k,v in skeleton.items()}==_populate_saturdays(p_start,p_end)
+    assert all(len(v)==len(set(v)) for v in skeleton.values())
+    # anos e meses em ordem cronologica, como a tela monta as colunas
+    assert list(skeleton.keys())==sorted(skeleton.keys())
+
+
+def test_week_belongs_to_its_saturday():
+    skeleton = _flatten(_calendar_skeleton(date(2024,12,1),date(2026,1,31)))
+    assert 52 in skeleton[(2024,12)]
+    assert skeleton[(2025,1)][0]==1
+    assert skeleton[(2026,1)][0]==1
@@ -0,0 +1,93 @@
+import base64
+import pytest
+from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Integer, Numeric, Select, String
+from models.helpers import db, _paginate, _keyset_page, _encode_cursor, _decode_cursor, _count_cache
+
+
+class PageItem(db.Model):
+    __tablename__ = "test_page_item"
+    id           = Column(Integer,primary_key=True,autoincrement=True)
+    name         = Column(String(50),nullable=False)
+    note         = Column(String(50),nullable=True)
+    price        = Column(Numeric(10,2),nullable=False)
+    date_created = Column(DateTime,nullable=False)
+
+
+@pytest.fixture
+def items(ctx):
+    PageItem.__table__.create(db.engine,checkfirst=True)
+    db.session.execute(PageItem.__table__.delete())
+    _count_cache.clear()
+    start = datetime(2025,1,1)
+    # nomes repetidos para o desempate pelo id no keyset
+    db.session.add_all([PageItem(name="item "+str(i//2),price=Decimal(i),date_created=start+timedelta(hours=i))
+                        for i in range(23)])
+    db.session.commit()
+    return Select(PageItem.id,PageItem.name,PageItem.note,PageItem.price,PageItem.date_created).order_by(PageItem.id)
+
+
+def test_paginate_page_and_total(items):
+    pag = _paginate(items,page=3,per_page=10)
+    assert [r.id for r in pag.items]==list(range(21,24))
+    assert (pag.total,pag.pages,pag.has_next)==(23,3,False)
+
+    first = _paginate(items,page=1,per_page=10)
+    assert len(first.items)==10 and first.has_next
+
+
+def test_paginate_after_last_page_keeps_total(items):
+    pag = _paginate(items,page=5,per_page=10)
+    assert pag.items==[]
+    assert pag.total==23
+
+
+def test_paginate_recounts_after_commit(items):
+    assert _paginate(items,page=1,per_page=10).total==23
+    db.session.add(PageItem(name="novo",price=Decimal(1),date_created=datetime(2025,2,1)))
+    db.session.commit()
+    assert _paginate(items,page=1,per_page=10).total==24
+
+
+@pytest.mark.parametrize("descending",[False,True])
+def test_keyset_walks_every_row_once(items,descending):
+    expected = [r.id for r in db.session.execute(items).all()]
+    expected = sorted(expected,key=lambda i: ("item "+str((i-1)//2),i),reverse=descending)
+    seen, cursor = [], None
+    while True:
+        rows, pagination = _keyset_page(items,PageItem.name,PageItem.id,descending,cursor,7)
+        seen += [r.id for r in rows]
+        if not pagination["has_next"]:
+            assert pagination["next_cursor"] is None
+            break
+        cursor = pagination["next_cursor"]
+    assert seen==expected
+
+
+def test_keyset_rejects_nullable_or_unselected_columns(items):
+    with pytest.raises(ValueError):
+        _keyset_page(items,PageItem.note,PageItem.id,False,None,5)
+    with pytest.raises(ValueError):
+        _keyset_page(Select(PageItem.id),PageItem.name,PageItem.id,False,None,5)
+
+
+def test_cursor_round_trip_restores_types():
+    columns = [PageItem.__table__.c.date_created,PageItem.__table__.c.price,PageItem.__table__.c.id]
+    values = [datetime(2025,3,4,5,6,7),Decimal("10.50"),42]
+    assert _decode_cursor(_encode_cursor(values),columns)==values
+    assert _decode_cursor(None,columns) is None
+    assert _decode_cursor("",columns) is None
+
+
+@pytest.mark.parametrize("cursor",[
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    _encode_cursor([1]),
+    _encode_cursor(["2025-01-01",None]),
+    _encode_cursor(["ontem",1])
+])
+def test_invalid_cursor_raises_value_error(cursor):
+    columns = [PageItem.__table__.c.date_created,PageItem.__table__.c.id]
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor,columns)
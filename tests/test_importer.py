@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import Select, func
+from importer import CsvImporter
+from models.tenant import CmmProductsImport
+from conftest import sqlite_engine
+
+HEADER = "refCode,barCode,type,model,brand,name,description,observation,price,measure_unit,color,size,quantity\n"
+
+
+def _row(ref:str,price:str = "10,50") -> str:
+    return ",".join([ref,"789","Tenis","Casual","Marca","Produto "+ref,"","",'"'+price+'"',"PR","Preto","40","3"])+"\n"
+
+
+@pytest.fixture
+def conn():
+    engine = sqlite_engine()
+    CmmProductsImport.__table__.create(engine) # type: ignore
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def test_import_staging_reports_invalid_lines(conn,tmp_path):
+    fName = tmp_path/"import_P_test.csv"
+    # linha 3 com preco invalido e linha 4 com colunas faltando
+    fName.write_text(HEADER+_row("P1")+_row("P2","abc")+"P3,789,Tenis\n"+_row("P4"),encoding="utf-8")
+    progress = []
+
+    result = CsvImporter(conn,chunk_size=2,progress=lambda *args: progress.append(args)).import_staging(str(fName))
+
+    assert (result["processed"],result["imported"])==(4,2)
+    assert [e["line"] for e in result["errors"]]==[3,4]
+    assert progress==[(2,1,1),(4,2,2)]
+    assert conn.execute(Select(func.count()).select_from(CmmProductsImport.__table__)).scalar()==2 # type: ignore
+
+
+def test_unknown_file_type(conn,tmp_path):
+    fName = tmp_path/"produtos.csv"
+    fName.write_text(HEADER,encoding="utf-8")
+    with pytest.raises(ValueError):
+        CsvImporter(conn).import_staging(str(fName))
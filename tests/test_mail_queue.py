@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import pytest
+import mail_queue
+from mail_queue import MailError, MailQueue, StubTransport
+
+SENDER = {"name": "Loja","email": "loja@exemplo.com"}
+
+
+class FailingTransport():
+    def send(self,messages:list[dict]) -> None:
+        raise MailError("bad",True)
+
+
+def wait_for(condition,timeout:float = 5) -> bool:
+    limit = time.monotonic()+timeout
+    while time.monotonic() < limit:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def _folder(name:str) -> str:
+    return mail_queue.MAIL_PATH+name+"/"
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    def use(transport):
+        monkeypatch.setattr(MailQueue,"transport",transport)
+        return transport
+    return use
+
+
+def test_enqueue_is_sent_by_dispatcher(transport):
+    stub = transport(StubTransport())
+    msg_id = MailQueue.enqueue("t1",SENDER,["a@exemplo.com "],[],"Pedido","<p>ok</p>")
+
+    assert wait_for(lambda: len(stub.sent)==1)
+    assert wait_for(lambda: not os.path.exists(_folder("processing")+msg_id+".json"))
+    assert not os.path.exists(_folder("pending")+msg_id+".json")
+    msg = stub.sent[0]
+    assert msg["id"]==msg_id and msg["to"]==["a@exemplo.com"]
+    assert "api_key" not in msg
+
+
+def test_permanent_failure_goes_to_failed_without_api_key(transport):
+    transport(FailingTransport())
+    MailQueue.start()
+    # mensagem gravada por versao anterior, com a chave da Brevo no disco
+    msg = {"id": "{:016d}".format(time.time_ns()//1000)+"_legacy","tenant": "t1","sender": SENDER,
+           "to": ["b@exemplo.com"],"cc": [],"subject": "Antiga","html": "<p>x</p>","attachments": [],
+           "attempts": 0,"next_try": 0,"error": None,"api_key": "segredo"}
+    with open(_folder("pending")+msg["id"]+".json","w") as f:
+        json.dump(msg,f)
+    MailQueue._wakeup.set()
+
+    failed = _folder("failed")+msg["id"]+".json"
+    assert wait_for(lambda: os.path.exists(failed))
+    with open(failed) as f:
+        stored = json.load(f)
+    assert stored["attempts"]==1
+    assert stored["error"]=="bad"
+    assert "api_key" not in stored
+    assert wait_for(lambda: not os.path.exists(_folder("processing")+msg["id"]+".json"))
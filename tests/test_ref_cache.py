@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert
+from sqlalchemy.orm import Session
+from models.helpers import _tenant_schema
+from ref_cache import RefCache
+from conftest import sqlite_engine
+
+
+@pytest.fixture
+def calls(ctx):
+    calls = []
+
+    @RefCache.cached("colors")
+    def get_colors():
+        calls.append(1)
+        return {"data": ["azul"]}
+
+    @RefCache.invalidates
+    def post_color():
+        return {"ok": True}
+
+    return calls, get_colors, post_color
+
+
+def test_cached_hits_until_bump(calls,ref_cache):
+    calls, get_colors, post_color = calls
+    assert get_colors()==get_colors()=={"data": ["azul"]}
+    assert len(calls)==1 and ref_cache.hits==1
+
+    RefCache.bump()
+    get_colors()
+    assert len(calls)==2
+
+    post_color()
+    get_colors()
+    assert len(calls)==3
+    assert RefCache.version()==2
+
+
+def test_errors_and_public_tenant_are_not_cached(ctx,ref_cache):
+    calls = []
+
+    @RefCache.cached("sizes")
+    def get_sizes():
+        calls.append(1)
+        return {"error_code": 500,"error_details": "falha","error_sql": ""}
+
+    get_sizes()
+    get_sizes()
+    assert len(calls)==2 and ref_cache.entries=={}
+
+    @RefCache.cached("brands")
+    def get_brands():
+        calls.append(1)
+        return {"data": []}
+
+    token = _tenant_schema.set("public")
+    try:
+        get_brands()
+        get_brands()
+    finally:
+        _tenant_schema.reset(token)
+    assert len(calls)==4 and ref_cache.entries=={}
+
+
+def test_bump_external_needs_shared_backend():
+    assert RefCache.bump_external("t1") is False
+    assert RefCache.version("t1")==0
+
+
+def test_table_versions():
+    RefCache.bump_tables({"b2b_orders"})
+    assert RefCache.table_versions(["b2b_orders","*","cmm_products"])==[1,1,0]
+    assert RefCache.table_versions(["b2b_orders"],tenant="t2")==[0]
+
+
+def test_session_commit_bumps_written_tables():
+    engine = sqlite_engine()
+    metadata = MetaData()
+    table = Table("cmm_color",metadata,Column("id",Integer,primary_key=True),Column("name",String(20)))
+    metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(insert(table).values(name="azul"))
+        session.rollback()
+    assert RefCache.table_versions(["cmm_color","*"])==[0,0]
+
+    with Session(engine) as session:
+        session.execute(insert(table).values(name="azul"))
+        session.commit()
+    assert RefCache.table_versions(["cmm_color","*"])==[1,1]
+    engine.dispose()